@@ -2,31 +2,81 @@
 FastAPI Production API for the Self-Improving Compliance Assistant.
 Provides REST endpoints for querying, evaluation, and evolution.
 """
+import uuid
 import asyncio
 import logging
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel, Field
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 from compliance_rag.graph.workflow import create_compliance_graph
 from compliance_rag.core.gene_pool import SOPGenePool
 from compliance_rag.evaluation.judge import evaluate_run
+from compliance_rag.evaluation.performance import run_metrics
+from compliance_rag.evaluation.runner import GoldenSetRunner
 from compliance_rag.agents.evolution import diagnose_failure, evolve_sop
-from compliance_rag.utils.logger import setup_logger
+from compliance_rag.utils.logger import setup_logger, request_id_var, payload as log_payload
+from compliance_rag.config import SOP_POLL_INTERVAL, llm_config, llm_scheduler
+from compliance_rag.endpoint_pool import EndpointPool, replica_stats
+from compliance_rag.scheduler import prioritized, INTERACTIVE, BATCH, EVOLUTION
+from compliance_rag.tracing import render_metrics, start_trace, span
+from compliance_rag.tools.retrieval import get_vector_store
+from compliance_rag.jobs import (
+    JobStore, JobRunner, JobContext, QUEUED, SUCCEEDED, FAILED, CANCELLED, FINISHED_STATES
+)
 
 # Setup logging
 setup_logger("compliance_rag", level="INFO")
 logger = logging.getLogger("compliance_rag.api")
 
+# Initialize Gene Pool on startup
+# The pool lives in a shared SQLite file; with several workers, each one polls the
+# generation counter so versions evolved on another worker are served within SOP_POLL_INTERVAL.
+gene_pool = SOPGenePool(poll_interval=SOP_POLL_INTERVAL)
+
+# Background jobs (/evolve, evaluation) live in a shared SQLite queue; every worker process
+# runs JOB_WORKERS job tasks, so evolution never runs inside an HTTP request.
+job_store = JobStore()
+
+
+async def watch_gene_pool():
+    """Picks up SOP versions added by other workers and warms them into the cache."""
+    while True:
+        await asyncio.sleep(SOP_POLL_INTERVAL)
+        try:
+            if await asyncio.to_thread(gene_pool.refresh):
+                latest = gene_pool.get_latest_version_id()
+                await asyncio.to_thread(gene_pool.get_sop, latest)
+                logger.info("Gene Pool changed; now serving SOP %s.", latest)
+        except Exception as e:
+            logger.error("Gene Pool refresh failed: %s", e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # With SOP_POLL_INTERVAL=0 every request reads the counter itself; no watcher needed
+    watcher = asyncio.create_task(watch_gene_pool()) if SOP_POLL_INTERVAL > 0 else None
+    # Load the vector store before serving, so a missing store fails startup instead of the first query
+    await asyncio.to_thread(get_vector_store)
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    if watcher:
+        watcher.cancel()
+
+
 # Initialize FastAPI
 app = FastAPI(
     title="Compliance RAG API",
     description="Self-Improving Agentic RAG for Corporate Compliance",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # CORS
@@ -38,8 +88,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Gene Pool on startup
-gene_pool = SOPGenePool()
+
+class RequestIdMiddleware:
+    """
+    Tags everything logged while handling a request with its ID: the caller's
+    X-Request-ID if given, otherwise a fresh one. The ID is echoed in the response.
+    (Plain ASGI rather than @app.middleware, which adds a task per request.)
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        given = dict(scope["headers"]).get(b"x-request-id", b"").decode("latin-1")[:64]
+        request_id = given or uuid.uuid4().hex[:12]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", request_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id_var.reset(token)
+
+
+app.add_middleware(RequestIdMiddleware)
 
 
 # ── Request / Response Models ──────────────────────────────────
@@ -47,12 +124,14 @@ gene_pool = SOPGenePool()
 class QueryRequest(BaseModel):
     question: str = Field(..., description="The compliance question to ask")
     sop_version: Optional[str] = Field(None, description="Specific SOP version to use (e.g. 'v0'). Defaults to latest.")
+    include_timings: bool = Field(False, description="Attach a per-node / per-call latency and token breakdown.")
 
 class QueryResponse(BaseModel):
     answer: str
     sop_version: str
     agent_outputs: list
     timestamp: str
+    timings: Optional[dict] = None
 
 class EvalRequest(BaseModel):
     question: str
@@ -72,6 +151,22 @@ class EvolutionResponse(BaseModel):
     diagnosis: str
     scores: dict
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    stages: list
+    attempts: int
+    error: Optional[str]
+    created_at: str
+    started_at: Optional[str]
+    finished_at: Optional[str]
+
 class HealthResponse(BaseModel):
     status: str
     sop_version: str
@@ -87,17 +182,48 @@ async def health_check():
     return HealthResponse(
         status="healthy",
         sop_version=gene_pool.get_latest_version_id(),
-        total_generations=len(gene_pool.sops),
+        total_generations=gene_pool.count(),
         timestamp=datetime.utcnow().isoformat()
     )
 
 
+@app.get("/scheduler/stats", tags=["System"])
+async def scheduler_stats():
+    """
+    LLM scheduler metrics for this worker process: queue waits per priority class
+    (interactive, batch, evolution) and active/queued calls per backend/model lane.
+    `shared` holds the slots held and processes waiting per lane across all workers.
+    """
+    return llm_scheduler.stats()
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["System"])
+async def metrics():
+    """
+    Prometheus histograms for this worker process: request, LangGraph node, LLM call
+    (latency and tokens per role), LLM queue wait, embedding, vector search and SQL timings.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/llm/endpoints", tags=["System"])
+async def llm_endpoints():
+    """Health, load and hedging counters of the Ollama replicas in OLLAMA_BASE_URLS."""
+    return {
+        "replicas": replica_stats(),
+        "pools": {
+            role: model.wrapped.stats() for role, model in llm_config.items() if isinstance(model.wrapped, EndpointPool)
+        },
+    }
+
+
 @app.post("/query", response_model=QueryResponse, tags=["Core"])
+@prioritized(INTERACTIVE)
 async def query_compliance(req: QueryRequest):
     """
     Ask a compliance question. Uses the latest evolved SOP by default.
     """
-    logger.info(f"Query received: {req.question}")
+    logger.info("Query received: %s", log_payload(req.question))
     
     # Load SOP
     if req.sop_version:
@@ -119,11 +245,14 @@ async def query_compliance(req: QueryRequest):
             "final_response": None,
             "sop": sop
         }
-        final_state = await graph.ainvoke(initial_state)
+        with start_trace() as trace, span("query", "/query"):
+            final_state = await graph.ainvoke(initial_state)
     except Exception as e:
-        logger.error(f"Agent network failed: {e}")
+        logger.error("Agent network failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
     
+    logger.info("Answered with SOP %s: %s", version_id, log_payload(final_state["final_response"]))
+
     agent_outputs = [
         {"agent": o.agent_name, "findings": str(o.findings)[:500]}
         for o in final_state["agent_outputs"]
@@ -133,23 +262,29 @@ async def query_compliance(req: QueryRequest):
         answer=final_state["final_response"],
         sop_version=version_id,
         agent_outputs=agent_outputs,
-        timestamp=datetime.utcnow().isoformat()
+        timestamp=datetime.utcnow().isoformat(),
+        timings=trace.summary() if req.include_timings else None
     )
 
 
 @app.post("/evaluate", response_model=EvalResponse, tags=["Evaluation"])
+@prioritized(INTERACTIVE)
 async def evaluate_response(req: EvalRequest):
     """
     Evaluate a compliance response using the LLM Judge.
     """
-    logger.info(f"Evaluation requested for: {req.question[:50]}...")
+    logger.info("Evaluation requested for: %s", log_payload(req.question, 50))
     
     try:
-        result = evaluate_run(req.question, req.response, req.context)
+        result = await asyncio.to_thread(evaluate_run, req.question, req.response, req.context)
     except Exception as e:
-        logger.error(f"Evaluation failed: {e}")
+        logger.error("Evaluation failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Evaluation failed: {str(e)}")
     
+    return eval_response(result)
+
+
+def eval_response(result) -> EvalResponse:
     return EvalResponse(
         accuracy=result.accuracy.score,
         citations=result.citation_fidelity.score,
@@ -164,73 +299,171 @@ async def evaluate_response(req: EvalRequest):
     )
 
 
-@app.post("/evolve", response_model=EvolutionResponse, tags=["Evolution"])
-async def trigger_evolution(req: QueryRequest):
+@prioritized(EVOLUTION)
+async def run_evolution_job(payload: dict, ctx: JobContext) -> dict:
     """
-    Run one cycle of the evolution loop:
+    One cycle of the evolution loop, run as a background job:
     Query -> Evaluate -> Diagnose -> Evolve -> Save
+    Blocking LLM calls run in threads so the API stays responsive.
     """
-    logger.info(f"Evolution triggered for: {req.question}")
-    
-    sop = gene_pool.get_latest_sop()
-    old_version = gene_pool.get_latest_version_id()
-    
+    question = payload["question"]
+    logger.info("Evolution job %s running for: %s", ctx.job_id, log_payload(question))
+
+    sop = await asyncio.to_thread(gene_pool.get_latest_sop)
+    old_version = await asyncio.to_thread(gene_pool.get_latest_version_id)
+
     # 1. Run Agent
-    try:
+    async with ctx.stage("run_agent"):
         graph = create_compliance_graph()
         initial_state = {
-            "initial_request": req.question,
+            "initial_request": question,
             "plan": None,
             "agent_outputs": [],
             "final_response": None,
             "sop": sop
         }
-        final_state = await graph.ainvoke(initial_state)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Agent execution failed: {str(e)}")
-    
+        with start_trace() as trace:
+            final_state = await graph.ainvoke(initial_state)
+        metrics = run_metrics(trace, sop)
+
     response = final_state["final_response"]
     context = "\n".join([o.findings for o in final_state["agent_outputs"]])
-    
+
     # 2. Evaluate
-    eval_result = evaluate_run(req.question, response, context)
-    
+    async with ctx.stage("evaluate"):
+        eval_result = await asyncio.to_thread(evaluate_run, question, response, context, metrics)
+        await asyncio.to_thread(gene_pool.record_evaluation, old_version, question, eval_result)
+
     scores = {
         "accuracy": eval_result.accuracy.score,
         "citations": eval_result.citation_fidelity.score,
         "completeness": eval_result.completeness.score,
-        "tone": eval_result.regulatory_compliance.score
+        "tone": eval_result.regulatory_compliance.score,
+        "performance": eval_result.performance_score
     }
-    
+
     # 3. Diagnose
-    diagnosis = diagnose_failure(req.question, response, eval_result)
-    
+    async with ctx.stage("diagnose"):
+        diagnosis = await asyncio.to_thread(diagnose_failure, question, response, eval_result)
+
     # 4. Evolve
-    new_sop = evolve_sop(sop, diagnosis)
-    
-    # 5. Save
-    import re
-    match = re.search(r"v(\d+)", old_version)
-    next_num = int(match.group(1)) + 1 if match else 1
-    new_version = f"v{next_num}"
-    
-    gene_pool.add_sop(new_version, new_sop)
-    
+    async with ctx.stage("evolve"):
+        new_sop = await asyncio.to_thread(evolve_sop, sop, diagnosis)
+
+    # 5. Save (the next version ID is allocated atomically by the gene pool)
+    async with ctx.stage("save"):
+        new_version = await asyncio.to_thread(gene_pool.add_next_sop, new_sop, parent=old_version)
+
     return EvolutionResponse(
         old_version=old_version,
         new_version=new_version,
         diagnosis=diagnosis[:500],
         scores=scores
+    ).model_dump()
+
+
+@prioritized(BATCH)
+async def run_evaluation_job(payload: dict, ctx: JobContext) -> dict:
+    """LLM Judge evaluation of one response, run as a background job."""
+    async with ctx.stage("evaluate"):
+        result = await asyncio.to_thread(evaluate_run, payload["question"], payload["response"], payload["context"])
+    return eval_response(result).model_dump()
+
+
+@prioritized(BATCH)
+async def run_golden_set_job(payload: dict, ctx: JobContext) -> dict:
+    """Golden-set evaluation of one SOP version (cached per question), run as a background job."""
+    version = payload["version"]
+    sop = await asyncio.to_thread(gene_pool.get_sop, version)
+    async with ctx.stage("golden_set"):
+        report = await GoldenSetRunner(gene_pool).run(sop, version)
+    return report.model_dump()
+
+
+job_runner = JobRunner(job_store, {
+    "evolve": run_evolution_job,
+    "evaluate": run_evaluation_job,
+    "golden_eval": run_golden_set_job,
+})
+
+
+@app.post("/evolve", response_model=JobResponse, status_code=202, tags=["Evolution"])
+async def trigger_evolution(req: QueryRequest):
+    """
+    Queue one cycle of the evolution loop (Query -> Evaluate -> Diagnose -> Evolve -> Save).
+    Returns a job ID immediately; poll GET /jobs/{job_id} and fetch GET /jobs/{job_id}/result.
+    """
+    logger.info("Evolution requested for: %s", log_payload(req.question))
+    return await submit_job("evolve", {"question": req.question})
+
+
+@app.post("/evaluate/jobs", response_model=JobResponse, status_code=202, tags=["Evaluation"])
+async def submit_evaluation(req: EvalRequest):
+    """Queue an LLM Judge evaluation as a background job."""
+    return await submit_job("evaluate", req.model_dump())
+
+
+async def submit_job(kind: str, payload: dict) -> JobResponse:
+    # Job store calls run in a thread: they may wait on another worker's write lock
+    job_id = await asyncio.to_thread(job_store.submit, kind, payload)
+    job_runner.notify()
+    return JobResponse(job_id=job_id, status=QUEUED, status_url=f"/jobs/{job_id}")
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse, tags=["Jobs"])
+async def get_job(job_id: str):
+    """Status of a background job, with per-stage timings."""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    return JobStatusResponse(
+        job_id=job["id"],
+        kind=job["kind"],
+        status=job["status"],
+        stages=job["stages"],
+        attempts=job["attempts"],
+        error=job["error"],
+        created_at=job["created_at"],
+        started_at=job["started_at"],
+        finished_at=job["finished_at"]
     )
 
 
+@app.get("/jobs/{job_id}/result", tags=["Jobs"])
+async def get_job_result(job_id: str):
+    """
+    Result of a finished job (EvolutionResponse for 'evolve', EvalResponse for 'evaluate',
+    GoldenSetReport for 'golden_eval').
+    """
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    if job["status"] == FAILED:
+        raise HTTPException(status_code=500, detail=f"Job failed: {job['error']}")
+    if job["status"] != SUCCEEDED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}; no result available.")
+    return job["result"]
+
+
+@app.delete("/jobs/{job_id}", response_model=JobStatusResponse, tags=["Jobs"])
+async def cancel_job(job_id: str):
+    """
+    Cancel a job. Queued jobs never start; a running job is interrupted immediately on this
+    worker, or at its next stage boundary when another worker process is running it.
+    """
+    status = await asyncio.to_thread(job_store.cancel, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found.")
+    if status in FINISHED_STATES and status != CANCELLED:
+        raise HTTPException(status_code=409, detail=f"Job already {status}.")
+    await job_runner.cancel(job_id)
+    return await get_job(job_id)
+
+
 @app.get("/sop/versions", tags=["SOP Management"])
 async def list_sop_versions():
     """List all available SOP versions."""
-    versions = sorted(
-        gene_pool.sops.keys(),
-        key=lambda x: int(x[1:]) if x.startswith("v") and x[1:].isdigit() else 0
-    )
+    versions = gene_pool.list_versions()
     return {
         "versions": versions,
         "latest": gene_pool.get_latest_version_id(),
@@ -248,3 +481,43 @@ async def get_sop_detail(version: str):
     if hasattr(sop, "model_dump"):
         return {"version": version, "sop": sop.model_dump()}
     return {"version": version, "sop": sop.dict()}
+
+
+@app.get("/sop/{version}/lineage", tags=["SOP Management"])
+async def get_sop_lineage(version: str, max_depth: Optional[int] = None):
+    """
+    Get the ancestry of an SOP version, oldest first (optionally only the last `max_depth` ancestors),
+    with the mean measured quality, performance score and latency of each generation.
+    """
+    lineage = gene_pool.get_lineage(version, max_depth)
+    if not lineage:
+        raise HTTPException(status_code=404, detail=f"SOP version '{version}' not found.")
+    return {"version": version, "lineage": lineage}
+
+
+@app.get("/sop/{version}/evaluations", tags=["SOP Management"])
+async def get_sop_evaluations(version: str):
+    """Recorded evaluations of an SOP version: quality, performance score, latency, tokens and cost per run."""
+    if not gene_pool.get_sop(version):
+        raise HTTPException(status_code=404, detail=f"SOP version '{version}' not found.")
+    return gene_pool.get_evaluations(version)
+
+
+@app.post("/sop/{version}/golden-eval", response_model=JobResponse, status_code=202, tags=["Evaluation"])
+async def submit_golden_set_evaluation(version: str):
+    """
+    Queue an evaluation of an SOP version over the golden set. The job result is a
+    GoldenSetReport: per-question scores and policy recall, per-dimension means and pass/fail.
+    """
+    if not gene_pool.get_sop(version):
+        raise HTTPException(status_code=404, detail=f"SOP version '{version}' not found.")
+    return await submit_job("golden_eval", {"version": version})
+
+
+@app.get("/sop/{version}/diff", tags=["SOP Management"])
+async def get_sop_diff(version: str):
+    """Get what an SOP version changed relative to the version it was evolved from."""
+    diff = gene_pool.get_diff(version)
+    if diff is None:
+        raise HTTPException(status_code=404, detail=f"SOP version '{version}' not found.")
+    return diff
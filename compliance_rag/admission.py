@@ -0,0 +1,197 @@
+"""
+Cross-process admission for LLM scheduler lanes.
+
+Every process (each API worker with its job runner, ingestion, the evolution CLI)
+has its own `LLMScheduler`. With a `SharedAdmission` pool the schedulers take lane
+slots from one small SQLite database instead of counting them per process, so a
+lane's limit holds for all of them together:
+
+- A held slot is a lease row (lane, host, pid, priority). Leases of a process that
+  exited on this host are reclaimed on the next admission attempt, and any lease
+  older than `lease_s` is reclaimed too (a process on another host that died).
+- A process with queued calls on a lane keeps one waiting row carrying the
+  priority class of its next call. A free slot goes to the waiting row whose class
+  is next by weighted fair queuing across all processes, oldest first within a
+  class, using per-lane virtual times stored beside the rows. An interactive call
+  queued in one worker is therefore admitted ahead of evolution calls queued in
+  another, while background classes still get their share.
+
+There is no cross-process wake-up: a waiting process retries every `poll_s` seconds,
+and at once when its own queue changes.
+"""
+import os
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import closing
+from typing import Dict, Iterable, Optional
+
+from compliance_rag.scheduler import PRIORITY_CLASSES
+
+# Waiting rows are refreshed on every attempt; one not seen for this long was abandoned
+WAITING_STALE_S = 30.0
+# Virtual-time row of a lane's clock (the start tag of the last admitted call)
+CLOCK = ""
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SharedAdmission:
+    """Lane slots shared by every process that opens the same database (see module docstring)."""
+    def __init__(self, path: str, poll_s: float = 0.02, lease_s: float = 900.0):
+        self.path = path
+        self.poll_s = poll_s
+        self.lease_s = lease_s
+        self.host = socket.gethostname()
+        self._local = threading.local()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with closing(self._connect()) as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS slots (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    lane TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    pid INTEGER NOT NULL,
+                    priority TEXT NOT NULL,
+                    held INTEGER NOT NULL DEFAULT 0,
+                    since REAL NOT NULL,
+                    seen REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS slots_lane ON slots (lane, held)")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS vtimes (
+                    lane TEXT NOT NULL,
+                    priority TEXT NOT NULL,
+                    vtime REAL NOT NULL,
+                    PRIMARY KEY (lane, priority)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        con.execute("PRAGMA synchronous=NORMAL")
+        return con
+
+    def _con(self) -> sqlite3.Connection:
+        """One connection per thread, reopened in a forked child."""
+        if getattr(self._local, "pid", None) != os.getpid():
+            self._local.con = self._connect()
+            self._local.pid = os.getpid()
+        return self._local.con
+
+    def _reap(self, con: sqlite3.Connection, lane: str, now: float):
+        """Drops rows of exited local processes, abandoned waiting rows and expired leases."""
+        pids = [pid for (pid,) in con.execute(
+            "SELECT DISTINCT pid FROM slots WHERE lane = ? AND host = ?", [lane, self.host]
+        )]
+        dead = [pid for pid in pids if pid != os.getpid() and not _process_alive(pid)]
+        if dead:
+            con.execute(
+                f"DELETE FROM slots WHERE lane = ? AND host = ? AND pid IN ({','.join('?' * len(dead))})",
+                [lane, self.host, *dead]
+            )
+        con.execute(
+            "DELETE FROM slots WHERE lane = ? AND ((held = 0 AND seen < ?) OR (held = 1 AND since < ?))",
+            [lane, now - WAITING_STALE_S, now - self.lease_s]
+        )
+
+    def _next_in_line(self, con: sqlite3.Connection, lane: str) -> Optional[int]:
+        """The waiting row whose class has the lowest virtual time, oldest first within a class."""
+        vtimes = dict(con.execute("SELECT priority, vtime FROM vtimes WHERE lane = ?", [lane]).fetchall())
+        clock = vtimes.get(CLOCK, 0.0)
+        waiting = con.execute(
+            "SELECT id, priority FROM slots WHERE lane = ? AND held = 0 ORDER BY since, id", [lane]
+        ).fetchall()
+        if not waiting:
+            return None
+        # A class returning from idle doesn't get credit for the time it wasn't queued
+        return min(
+            waiting,
+            key=lambda row: (max(vtimes.get(row[1], 0.0), clock), PRIORITY_CLASSES.index(row[1]))
+        )[0]
+
+    def _advance(self, con: sqlite3.Connection, lane: str, priority: str, weight: float):
+        vtimes = dict(con.execute("SELECT priority, vtime FROM vtimes WHERE lane = ?", [lane]).fetchall())
+        clock = max(vtimes.get(CLOCK, 0.0), vtimes.get(priority, 0.0))
+        con.executemany(
+            "INSERT INTO vtimes VALUES (?, ?, ?) ON CONFLICT (lane, priority) DO UPDATE SET vtime = excluded.vtime",
+            [(lane, CLOCK, clock), (lane, priority, clock + 1.0 / weight)]
+        )
+
+    def acquire(self, lane: str, priority: str, limit: int, weight: float) -> Optional[int]:
+        """
+        One admission attempt for this process's next `priority` call on `lane`.
+        Leaves (or refreshes) the process's waiting row, and turns it into a lease if
+        fewer than `limit` slots are held and it is next in line; `weight` is the share
+        of the class (LLM_PRIORITY_WEIGHTS). Returns the lease ID or None; a None
+        leaves the waiting row in place until `cancel`.
+        """
+        con = self._con()
+        now = time.time()
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            self._reap(con, lane, now)
+            row = con.execute(
+                "SELECT id, priority FROM slots WHERE lane = ? AND host = ? AND pid = ? AND held = 0",
+                [lane, self.host, os.getpid()]
+            ).fetchone()
+            if row is None:
+                ticket = con.execute(
+                    "INSERT INTO slots (lane, host, pid, priority, since, seen) VALUES (?, ?, ?, ?, ?, ?)",
+                    [lane, self.host, os.getpid(), priority, now, now]
+                ).lastrowid
+            else:
+                ticket = row[0]
+                if row[1] != priority:
+                    con.execute("UPDATE slots SET priority = ?, since = ? WHERE id = ?", [priority, now, ticket])
+                con.execute("UPDATE slots SET seen = ? WHERE id = ?", [now, ticket])
+
+            held = con.execute("SELECT COUNT(*) FROM slots WHERE lane = ? AND held = 1", [lane]).fetchone()[0]
+            lease = None
+            if held < limit and self._next_in_line(con, lane) == ticket:
+                con.execute("UPDATE slots SET held = 1, since = ? WHERE id = ?", [now, ticket])
+                self._advance(con, lane, priority, weight)
+                lease = ticket
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return lease
+
+    def release(self, leases: Iterable[int]):
+        """Gives back held slots."""
+        leases = list(leases)
+        if leases:
+            self._con().execute(f"DELETE FROM slots WHERE id IN ({','.join('?' * len(leases))})", leases)
+
+    def cancel(self, lane: str):
+        """Withdraws this process's waiting row (its queue on `lane` is empty)."""
+        self._con().execute(
+            "DELETE FROM slots WHERE lane = ? AND host = ? AND pid = ? AND held = 0",
+            [lane, self.host, os.getpid()]
+        )
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Held slots and waiting processes per lane (and per class), across all processes."""
+        lanes: Dict[str, Dict] = {}
+        for lane, held, priority, count in self._con().execute(
+            "SELECT lane, held, priority, COUNT(*) FROM slots GROUP BY lane, held, priority"
+        ):
+            entry = lanes.setdefault(lane, {"held": 0, "waiting_processes": {p: 0 for p in PRIORITY_CLASSES}})
+            if held:
+                entry["held"] += count
+            else:
+                entry["waiting_processes"][priority] += count
+        return lanes
@@ -1,18 +1,24 @@
 import json
 import logging
+from typing import List, Optional
 from langchain_core.messages import HumanMessage
-from compliance_rag.config import llm_config
-from compliance_rag.core.sop import ComplianceSOP
+from pydantic import ValidationError
+from compliance_rag.config import llm_config, LOCAL_MODELS, PERF_SCORE_THRESHOLD
+from compliance_rag.core.sop import ComplianceSOP, EVOLVABLE_KNOBS
 from compliance_rag.evaluation.models import EvaluationResult
+from compliance_rag.evaluation.performance import budget_overruns
 from compliance_rag.utils.json_parser import parse_llm_json
+from compliance_rag.utils.logger import payload
 
 logger = logging.getLogger("compliance_rag.evolution")
 
 
-def diagnose_failure(request: str, response: str, evaluation: EvaluationResult) -> str:
+def diagnose_failure(request: str, response: str, evaluation: EvaluationResult,
+                     aggregate_failures: Optional[List[str]] = None) -> str:
     """
     The Performance Diagnostician Agent.
     Analyzes a failed run and explains WHY it failed based on the evaluation scores.
+    `aggregate_failures` adds thresholds missed across a whole golden set.
     """
     director = llm_config["director"]
     
@@ -26,6 +32,11 @@ def diagnose_failure(request: str, response: str, evaluation: EvaluationResult)
         failures.append(f"Completeness ({evaluation.completeness.score}/5): {evaluation.completeness.reasoning}")
     if evaluation.regulatory_compliance.score < 4:
         failures.append(f"Tone ({evaluation.regulatory_compliance.score}/5): {evaluation.regulatory_compliance.reasoning}")
+    if evaluation.performance_score < PERF_SCORE_THRESHOLD and evaluation.run_metrics:
+        overruns = "; ".join(budget_overruns(evaluation.run_metrics))
+        failures.append(f"Performance ({evaluation.performance_score:.2f}/1.00): over budget - {overruns}")
+    if aggregate_failures:
+        failures.append(f"Across the golden set: {'; '.join(aggregate_failures)}")
         
     failure_text = "\n".join(failures)
     
@@ -43,27 +54,64 @@ def diagnose_failure(request: str, response: str, evaluation: EvaluationResult)
     1. A failure to Retrieve the right policy? (Search Gap)
     2. A failure to Plan the right steps? (Planner Gap)
     3. A failure to Synthesize the answer correctly? (Writer Gap)
+    4. Too slow or too expensive, e.g. too many tasks or overly long prompts and answers? (Performance Gap)
     
     Provide a concise diagnosis (max 2 sentences) explaining exactly what instruction was missing or misinterpreted.
     """
     
     try:
         diagnosis = director.invoke([HumanMessage(content=prompt)]).content
-        logger.info(f"Diagnosis complete: {diagnosis[:100]}...")
+        logger.info("Diagnosis complete: %s", payload(diagnosis, 100))
         return diagnosis
     except Exception as e:
-        logger.error(f"Diagnosis failed: {e}")
+        logger.error("Diagnosis failed: %s", e)
         return f"Diagnosis unavailable due to error: {str(e)}"
 
 
-def evolve_sop(current_sop: ComplianceSOP, diagnosis: str) -> ComplianceSOP:
+def knob_range(name: str) -> str:
+    """The allowed values of an evolvable knob, as shown to the Architect."""
+    field = ComplianceSOP.model_fields[name]
+    if name.endswith("_model"):
+        return f"one of {', '.join(LOCAL_MODELS)}"
+    if field.annotation is bool:
+        return "true or false"
+    bounds = {key: getattr(m, key) for m in field.metadata for key in ("ge", "le") if hasattr(m, key)}
+    return f"{bounds.get('ge')} to {bounds.get('le')}"
+
+
+def describe_knobs(sop: ComplianceSOP) -> str:
+    return "\n".join(
+        f"- {name} = {json.dumps(getattr(sop, name))} ({knob_range(name)}): {ComplianceSOP.model_fields[name].description}"
+        for name in EVOLVABLE_KNOBS
+    )
+
+
+def apply_changes(current_sop: ComplianceSOP, changes: dict) -> ComplianceSOP:
     """
-    The SOP Architect Agent.
-    Rewrites the SOP (System Prompts) to prevent the diagnosed failure in the future.
+    `current_sop` with the proposed prompt and knob changes. Values outside a knob's
+    allowed range are rejected (the current value is kept) instead of failing the evolution.
     """
-    director = llm_config["director"]
-    
-    prompt = f"""
+    allowed = ("planner_prompt", "synthesizer_prompt") + EVOLVABLE_KNOBS
+    changes = {k: v for k, v in changes.items() if k in allowed}
+    # Loading an SOP tolerates unknown models (see ComplianceSOP._local_model); a proposal may not pick one
+    for name in [k for k in changes if k.endswith("_model") and changes[k] not in LOCAL_MODELS]:
+        logger.warning("Rejected evolved %s=%r; keeping %r.", name, changes.pop(name), getattr(current_sop, name))
+    data = {**current_sop.model_dump(), **changes}
+    while True:
+        try:
+            return ComplianceSOP(**data)
+        except ValidationError as e:
+            rejected = {err["loc"][0] for err in e.errors() if err["loc"]}
+            if not rejected:
+                raise
+            for name in rejected:
+                logger.warning("Rejected evolved %s=%r; keeping %r.", name, data[name], getattr(current_sop, name))
+                data[name] = getattr(current_sop, name)
+
+
+def architect_brief(current_sop: ComplianceSOP, diagnosis: str) -> str:
+    """The failure, the current SOP and the rules for rewriting it, shared by every Architect call."""
+    return f"""
     You are the Architect of a Compliance AI System.
     The current system failed a recent test.
     
@@ -76,17 +124,48 @@ def evolve_sop(current_sop: ComplianceSOP, diagnosis: str) -> ComplianceSOP:
     Current Synthesizer Prompt:
     "{current_sop.synthesizer_prompt}"
     
+    Current Settings (name = value (allowed values): meaning):
+{describe_knobs(current_sop)}
+    
     Your Task:
     Rewrite ONE or BOTH of the prompts to fix this failure.
     - If the Planner missed a step, update the Planner Prompt.
     - If the Synthesizer missed a constraint, update the Synthesizer Prompt.
+    - If the run was too slow or expensive, make the instructions leaner (fewer tasks, shorter answers)
+      and/or change settings: e.g. fewer retrieved documents, a smaller context budget, a faster model.
+    - If answers lacked evidence, settings may also trade latency for quality (more documents, more context).
     - Keep the rest of the instructions.
     - Be specific and directive.
+    """
+
+
+def sop_from_proposal(current_sop: ComplianceSOP, proposal: dict) -> ComplianceSOP:
+    """Applies one Architect proposal ({"planner_prompt", "synthesizer_prompt", "settings"}) to `current_sop`."""
+    settings = proposal.get("settings") if isinstance(proposal.get("settings"), dict) else {}
+    new_sop = apply_changes(current_sop, {
+        "planner_prompt": proposal.get("planner_prompt", current_sop.planner_prompt),
+        "synthesizer_prompt": proposal.get("synthesizer_prompt", current_sop.synthesizer_prompt),
+        **{name: value for name, value in settings.items() if name in EVOLVABLE_KNOBS},
+    })
+    changed = {n: getattr(new_sop, n) for n in EVOLVABLE_KNOBS if getattr(new_sop, n) != getattr(current_sop, n)}
+    logger.info("SOP evolution successful. Setting changes: %s", changed or "none")
+    return new_sop
+
+
+def evolve_sop(current_sop: ComplianceSOP, diagnosis: str) -> ComplianceSOP:
+    """
+    The SOP Architect Agent.
+    Rewrites the SOP (System Prompts and, for performance failures, the bounded
+    knobs in EVOLVABLE_KNOBS) to prevent the diagnosed failure in the future.
+    """
+    director = llm_config["director"]
     
-    Respond in JSON format with the new prompts:
+    prompt = f"""{architect_brief(current_sop, diagnosis)}
+    Respond in JSON format with the new prompts and only the settings you change:
     {{
         "planner_prompt": "...",
-        "synthesizer_prompt": "..."
+        "synthesizer_prompt": "...",
+        "settings": {{"researcher_retriever_k": 2}}
     }}
     """
     
@@ -97,21 +176,68 @@ def evolve_sop(current_sop: ComplianceSOP, diagnosis: str) -> ComplianceSOP:
             data = parse_llm_json(response.content)
             
             if not data:
-                logger.warning(f"Evolution attempt {attempt + 1}/{max_retries}: Empty JSON response. Retrying...")
+                logger.warning("Evolution attempt %d/%d: Empty JSON response. Retrying...", attempt + 1, max_retries)
                 continue
             
-            new_sop = ComplianceSOP(
-                planner_prompt=data.get("planner_prompt", current_sop.planner_prompt),
-                synthesizer_prompt=data.get("synthesizer_prompt", current_sop.synthesizer_prompt),
-                researcher_retriever_k=current_sop.researcher_retriever_k,
-                conflict_check_enabled=current_sop.conflict_check_enabled,
-                synthesizer_model=current_sop.synthesizer_model
-            )
-            logger.info("SOP evolution successful.")
-            return new_sop
+            return sop_from_proposal(current_sop, data)
             
         except Exception as e:
-            logger.warning(f"Evolution attempt {attempt + 1}/{max_retries} failed: {e}")
+            logger.warning("Evolution attempt %d/%d failed: %s", attempt + 1, max_retries, e)
     
-    logger.error(f"All {max_retries} evolution attempts failed. Returning current SOP unchanged.")
+    logger.error("All %d evolution attempts failed. Returning current SOP unchanged.", max_retries)
     return current_sop
+
+
+def propose_candidates(current_sop: ComplianceSOP, diagnosis: str, count: int) -> List[ComplianceSOP]:
+    """
+    The SOP Architect Agent, population mode.
+    Proposes up to `count` different rewrites of the SOP for one diagnosis, in one
+    call, so the candidates can be evaluated side by side. Duplicates and proposals
+    that change nothing are dropped; an empty list means the Architect failed.
+    """
+    director = llm_config["director"]
+    
+    prompt = f"""{architect_brief(current_sop, diagnosis)}
+    Propose {count} DIFFERENT candidate fixes, each trying a distinct strategy
+    (e.g. one changes the Planner, one the Synthesizer, one mainly the settings).
+    
+    Respond in JSON format with one entry per candidate and only the settings each one changes:
+    {{
+        "candidates": [
+            {{
+                "strategy": "...",
+                "planner_prompt": "...",
+                "synthesizer_prompt": "...",
+                "settings": {{"researcher_retriever_k": 2}}
+            }}
+        ]
+    }}
+    """
+    
+    max_retries = 3
+    for attempt in range(max_retries):
+        try:
+            response = director.invoke([HumanMessage(content=prompt)])
+            data = parse_llm_json(response.content)
+            proposals = data.get("candidates") if isinstance(data, dict) else None
+            
+            if not isinstance(proposals, list) or not proposals:
+                logger.warning("Evolution attempt %d/%d: No candidates in response. Retrying...", attempt + 1, max_retries)
+                continue
+            
+            candidates: List[ComplianceSOP] = []
+            for proposal in proposals[:count]:
+                if not isinstance(proposal, dict):
+                    continue
+                logger.info("Candidate strategy: %s", payload(proposal.get('strategy', ''), 100))
+                sop = sop_from_proposal(current_sop, proposal)
+                if sop != current_sop and sop not in candidates:
+                    candidates.append(sop)
+            if candidates:
+                return candidates
+            
+        except Exception as e:
+            logger.warning("Evolution attempt %d/%d failed: %s", attempt + 1, max_retries, e)
+    
+    logger.error("All %d evolution attempts failed. No candidates proposed.", max_retries)
+    return []
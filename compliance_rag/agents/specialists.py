@@ -1,14 +1,89 @@
 import json
 import logging
 from typing import Dict, Any, List
-from langchain_core.messages import HumanMessage, SystemMessage
-from compliance_rag.config import llm_config
+
+import httpx
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from compliance_rag.config import role_llm
 from compliance_rag.core.state import ComplianceState, AgentOutput
-from compliance_rag.tools.retrieval import policy_search_tool, policy_metadata_tool
+from compliance_rag.tools.retrieval import policy_search_tool, policy_metadata_tool, POLICY_FILTER_FIELDS
 from compliance_rag.utils.json_parser import parse_llm_json
+from compliance_rag.utils.logger import payload
 
 logger = logging.getLogger("compliance_rag.specialists")
 
+# Prompt layout: everything that is the same across requests (the SOP prompt and fixed
+# instructions) goes first, in a SystemMessage; the question and retrieved context follow.
+# Ollama keeps the evaluated prompt of a loaded model, so a stable prefix is only
+# processed once instead of on every call.
+
+PLANNER_FORMAT_INSTRUCTIONS = f"""
+Respond in JSON with:
+{{
+    "tasks": [
+        {{"agent": "researcher", "reasoning": "...", "query": "...", "filters": {{}}}},
+        {{"agent": "sql_analyst", "reasoning": "...", "query": "..."}}
+    ]
+}}
+
+Researcher "filters" are optional and restrict the search to matching policies.
+Allowed keys: {", ".join(POLICY_FILTER_FIELDS)}.
+Example: {{"department": "HR", "status": "Active"}}. Leave empty when the question is not scoped.
+"""
+
+SQL_ANALYST_PROMPT = """
+Generate a DuckDB SQL query to answer the given task.
+Table name: 'policies'
+Columns: policy_id, title, owner, version, last_updated, department, status, retention_years.
+
+ONLY return the SQL query, no explanation.
+"""
+
+
+# Rough size of a token in English text, for the SOP's context_token_budget
+CHARS_PER_TOKEN = 4
+
+
+def invoke_with_timeout(llm, messages: List[BaseMessage], timeout_s: float):
+    """
+    `llm.invoke(messages)` for an `llm` from `role_llm(..., timeout_s=timeout_s)`, raising
+    TimeoutError when the model takes longer than `timeout_s`. The limit is the client's own
+    request timeout, so it starts once the scheduler has admitted the call (queue wait doesn't
+    count, and priority is untouched), and a timed-out request is closed, which stops the
+    generation and frees the slot. The response isn't streamed, so the read timeout covers
+    the whole generation rather than the gap between tokens.
+    """
+    try:
+        return llm.invoke(messages, stream=False)
+    except httpx.TimeoutException:
+        raise TimeoutError(f"LLM call exceeded the SOP timeout of {timeout_s:.0f}s")
+
+
+def fit_context(findings: str, token_budget: int) -> str:
+    """Cuts research findings to about `token_budget` tokens."""
+    limit = token_budget * CHARS_PER_TOKEN
+    if len(findings) <= limit:
+        return findings
+    return findings[:limit] + "\n[... further findings cut to fit the context budget]"
+
+
+def planner_messages(sop, request: str) -> List[BaseMessage]:
+    return [
+        SystemMessage(content=f"{sop.planner_prompt}\n{PLANNER_FORMAT_INSTRUCTIONS}"),
+        HumanMessage(content=f"User Request: {request}"),
+    ]
+
+
+def sql_analyst_messages(task_query: str) -> List[BaseMessage]:
+    return [SystemMessage(content=SQL_ANALYST_PROMPT), HumanMessage(content=f"Task: '{task_query}'")]
+
+
+def synthesizer_messages(sop, findings: str, request: str) -> List[BaseMessage]:
+    return [
+        SystemMessage(content=sop.synthesizer_prompt),
+        HumanMessage(content=f"Context from Research:\n{findings}\n\nUser Original Request: {request}\n\nFinal Answer:"),
+    ]
+
 
 # 1. Planner Agent
 def planner_node(state: ComplianceState) -> Dict[str, Any]:
@@ -16,24 +91,10 @@ def planner_node(state: ComplianceState) -> Dict[str, Any]:
     sop = state["sop"]
     request = state["initial_request"]
     
-    planner_llm = llm_config["planner"]
-    
-    prompt = f"""
-    {sop.planner_prompt}
-    
-    User Request: {request}
-    
-    Respond in JSON with:
-    {{
-        "tasks": [
-            {{"agent": "researcher", "reasoning": "...", "query": "..."}},
-            {{"agent": "sql_analyst", "reasoning": "...", "query": "..."}}
-        ]
-    }}
-    """
+    planner_llm = role_llm("planner", sop.planner_model, sop.llm_timeout_s)
     
     try:
-        response = planner_llm.invoke([HumanMessage(content=prompt)])
+        response = invoke_with_timeout(planner_llm, planner_messages(sop, request), sop.llm_timeout_s)
         plan = parse_llm_json(response.content)
         
         if not plan or "tasks" not in plan:
@@ -42,16 +103,24 @@ def planner_node(state: ComplianceState) -> Dict[str, Any]:
                 {"agent": "researcher", "reasoning": "Fallback search", "query": request}
             ]}
         
-        # Validate that each task has a string query
+        # Validate that each task has a string query and only supported filters
         for task in plan.get("tasks", []):
             if not isinstance(task.get("query"), str):
                 task["query"] = str(task.get("query", request))
+            filters = task.get("filters")
+            if isinstance(filters, dict):
+                task["filters"] = {
+                    key: value for key, value in filters.items()
+                    if key in POLICY_FILTER_FIELDS and value not in (None, "", [])
+                }
+            else:
+                task.pop("filters", None)
         
-        logger.info(f"Plan created with {len(plan.get('tasks', []))} tasks.")
+        logger.info("Plan created with %d tasks.", len(plan.get('tasks', [])))
         return {"plan": plan}
         
     except Exception as e:
-        logger.error(f"Planner failed: {e}. Using fallback plan.")
+        logger.error("Planner failed: %s. Using fallback plan.", e)
         return {"plan": {"tasks": [
             {"agent": "researcher", "reasoning": "Fallback due to planner error", "query": request}
         ]}}
@@ -63,18 +132,22 @@ def researcher_node(state: ComplianceState) -> Dict[str, Any]:
     tasks = state["plan"].get("tasks", [])
     researcher_tasks = [t for t in tasks if t["agent"] == "researcher"]
     
+    sop = state["sop"]
     findings = []
     for task in researcher_tasks:
         try:
             query = str(task["query"])  # Ensure string
             result = policy_search_tool.invoke({
                 "query": query, 
-                "k": state["sop"].researcher_retriever_k
+                "k": sop.researcher_retriever_k,
+                "filters": task.get("filters") or None,
+                "rerank_candidates": sop.rerank_candidates if sop.rerank_enabled else 0,
+                "conflict_check": sop.conflict_check_enabled
             })
             findings.append(f"Query: {query}\nResults:\n{result}")
-            logger.info(f"Researcher found results for: {query[:50]}...")
+            logger.info("Researcher found results for: %s", payload(query, 50))
         except Exception as e:
-            logger.error(f"Researcher failed for query '{task.get('query', 'unknown')}': {e}")
+            logger.error("Researcher failed for query '%s': %s", payload(task.get('query', 'unknown'), 50), e)
             findings.append(f"Query: {task.get('query', 'unknown')}\nResults: Error - {str(e)}")
     
     output = AgentOutput(agent_name="researcher", findings="\n\n".join(findings))
@@ -90,27 +163,25 @@ def sql_analyst_node(state: ComplianceState) -> Dict[str, Any]:
     if not sql_tasks:
         logger.info("No SQL tasks assigned. Skipping.")
         return {}
+    if not state["sop"].sql_analyst_enabled:
+        logger.info("SQL Analyst disabled by the SOP; skipping %d tasks.", len(sql_tasks))
+        return {}
 
-    llm = llm_config["sql_analyst"]
+    sop = state["sop"]
+    llm = role_llm("sql_analyst", sop.sql_analyst_model, sop.llm_timeout_s)
     findings = []
     
     for task in sql_tasks:
         try:
-            prompt = f"""
-            Generate a DuckDB SQL query to answer this task: '{task['query']}'
-            Table name: 'policies'
-            Columns: policy_id, title, owner, version, last_updated, department, status, retention_years.
-            
-            ONLY return the SQL query, no explanation.
-            """
-            sql_query = llm.invoke([HumanMessage(content=prompt)]).content.strip()
+            response = invoke_with_timeout(llm, sql_analyst_messages(task["query"]), sop.llm_timeout_s)
+            sql_query = response.content.strip()
             sql_query = sql_query.replace("```sql", "").replace("```", "").strip()
             
             result = policy_metadata_tool.invoke({"sql_query": sql_query})
             findings.append(f"SQL: {sql_query}\nResult:\n{result}")
-            logger.info(f"SQL Analyst executed: {sql_query[:80]}...")
+            logger.info("SQL Analyst executed: %s", payload(sql_query, 80))
         except Exception as e:
-            logger.error(f"SQL Analyst failed: {e}")
+            logger.error("SQL Analyst failed: %s", e)
             findings.append(f"SQL Error: {str(e)}")
         
     output = AgentOutput(agent_name="sql_analyst", findings="\n\n".join(findings))
@@ -122,24 +193,15 @@ def synthesizer_node(state: ComplianceState) -> Dict[str, Any]:
     """Drafts the final response with citations."""
     sop = state["sop"]
     findings = "\n\n".join([f"Agent {o.agent_name} found:\n{o.findings}" for o in state["agent_outputs"]])
+    findings = fit_context(findings, sop.context_token_budget)
     
-    llm = llm_config["synthesizer"]
-    
-    prompt = f"""
-    {sop.synthesizer_prompt}
-    
-    Context from Research:
-    {findings}
-    
-    User Original Request: {state['initial_request']}
-    
-    Final Answer:
-    """
+    llm = role_llm("synthesizer", sop.synthesizer_model, sop.llm_timeout_s)
     
     try:
-        response = llm.invoke([HumanMessage(content=prompt)])
+        messages = synthesizer_messages(sop, findings, state["initial_request"])
+        response = invoke_with_timeout(llm, messages, sop.llm_timeout_s)
         logger.info("Synthesizer produced final response.")
         return {"final_response": response.content}
     except Exception as e:
-        logger.error(f"Synthesizer failed: {e}")
+        logger.error("Synthesizer failed: %s", e)
         return {"final_response": f"Error generating response: {str(e)}"}
@@ -0,0 +1,152 @@
+"""
+Startup time and resident memory of the columnar chunk store versus the
+pickled LangChain docstore that `FAISS.save_local` used to write.
+
+Both formats are written for the same synthetic chunks; each is then opened
+in a fresh subprocess that reports load time, RSS growth and the latency of
+fetching the text for random top-k hits.
+
+Usage:
+    python -m compliance_rag.benchmarks.chunk_store_load --n 1000000 --output chunk_store.json
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+from typing import Dict
+
+from langchain_core.documents import Document
+
+from compliance_rag.chunk_store import ChunkStore, CHUNK_STORE_FILE
+
+PICKLE_FILE = "index.pkl"
+WORDS = ("employee", "policy", "data", "access", "approval", "retention", "security",
+         "manager", "device", "remote", "classified", "audit", "vendor", "must", "shall")
+
+
+def synthetic_chunks(n: int, text_chars: int, seed: int = 0):
+    rng = random.Random(seed)
+    words_per_chunk = max(1, text_chars // 8)
+    for i in range(n):
+        yield Document(
+            page_content=" ".join(rng.choices(WORDS, k=words_per_chunk)),
+            metadata={
+                "source": f"data/policy_{i % 5000:05d}.md",
+                "policy_id": f"POL-{i % 5000:05d}",
+                "department": rng.choice(["HR", "Security", "Engineering", "Legal"]),
+                "status": "Active",
+                "last_updated": "2024-01-15",
+                "start_index": (i % 20) * text_chars,
+            },
+        )
+
+
+def write_formats(folder: str, n: int, text_chars: int, batch: int = 50_000):
+    """Writes the legacy pickle (docstore, index_to_docstore_id) and the chunk store."""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    docs = {}
+    store = ChunkStore(os.path.join(folder, CHUNK_STORE_FILE), read_only=False)
+    pending = []
+    for i, doc in enumerate(synthetic_chunks(n, text_chars)):
+        docs[str(i)] = doc
+        pending.append(doc)
+        if len(pending) == batch:
+            store.append(pending, start_row=i + 1 - batch)
+            pending = []
+    if pending:
+        store.append(pending, start_row=n - len(pending))
+    store.close()
+
+    with open(os.path.join(folder, PICKLE_FILE), "wb") as f:
+        pickle.dump((InMemoryDocstore(docs), {i: str(i) for i in range(n)}), f)
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def measure(fmt: str, folder: str, n: int, k: int = 10, lookups: int = 200) -> Dict:
+    """Runs inside a fresh process: open one format, then fetch random top-k hits."""
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    if fmt == "pickle":
+        with open(os.path.join(folder, PICKLE_FILE), "rb") as f:
+            docstore, index_to_id = pickle.load(f)
+        fetch = lambda ids: [docstore.search(index_to_id[i]) for i in ids]
+    else:
+        store = ChunkStore(os.path.join(folder, CHUNK_STORE_FILE), read_only=True)
+        fetch = store.get
+    load_s = time.perf_counter() - start
+    loaded_rss = _rss_mb()
+
+    rng = random.Random(1)
+    latencies = []
+    for _ in range(lookups):
+        ids = [rng.randrange(n) for _ in range(k)]
+        t = time.perf_counter()
+        fetch(ids)
+        latencies.append((time.perf_counter() - t) * 1000)
+    latencies.sort()
+
+    return {
+        "format": fmt,
+        "load_s": round(load_s, 3),
+        "rss_after_load_mb": round(loaded_rss - baseline, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "fetch_top_k_ms_p50": round(latencies[len(latencies) // 2], 3),
+        "fetch_top_k_ms_p95": round(latencies[int(len(latencies) * 0.95)], 3),
+        "file_bytes": os.path.getsize(
+            os.path.join(folder, PICKLE_FILE if fmt == "pickle" else CHUNK_STORE_FILE)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1_000_000, help="Number of chunks")
+    parser.add_argument("--text-chars", type=int, default=800)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--measure", choices=["pickle", "columnar"], help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.folder, args.n)))
+        return
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        write_formats(folder, args.n, args.text_chars)
+        print(f"Wrote {args.n} chunks in both formats in {time.perf_counter() - start:.1f}s")
+
+        results = []
+        for fmt in ("pickle", "columnar"):
+            out = subprocess.run(
+                [sys.executable, "-m", __spec__.name, "--measure", fmt, "--folder", folder, "--n", str(args.n)],
+                check=True, capture_output=True, text=True,
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    for r in results:
+        print(
+            f"{r['format']:<9} load {r['load_s']:>7.3f}s  rss +{r['rss_after_load_mb']:>8.1f} MB  "
+            f"top-k fetch p50 {r['fetch_top_k_ms_p50']:.3f} ms  file {r['file_bytes'] / 1e6:.1f} MB"
+        )
+
+    report = {"n_chunks": args.n, "text_chars": args.text_chars, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Ollama HTTP embeddings versus the in-process sentence-transformers backend.
+
+For each backend in `--backends`:
+  ollama      nomic-embed-text over HTTP (OLLAMA_BASE_URLS, or a stub with --stub)
+  local       EMBEDDING_LOCAL_MODEL with the torch runtime
+  local-onnx  the same model with the ONNX runtime (EMBEDDING_MODEL_FILE picks
+              e.g. a quantized export)
+
+it reports:
+  - ingestion throughput: `--chunks` chunks of the policies in DATA_DIR, embedded
+    with embed_documents in windows of `--window` chunks (chunks per second);
+  - query latency: `--queries` golden-set questions embedded one at a time (p50/p95);
+  - concurrent queries: the same questions from `--concurrency` threads at once,
+    where the local backend coalesces them into batches (queries per second).
+
+The first call of each backend (model load, connection setup) is excluded.
+A backend that can't be loaded (e.g. sentence-transformers not installed) is
+reported as unavailable.
+
+Usage:
+    python -m compliance_rag.benchmarks.embedding_backends --backends ollama,local,local-onnx --output embed.json
+Without Ollama (the HTTP path against a stub with --stub-latency-ms per call):
+    python -m compliance_rag.benchmarks.embedding_backends --backends ollama,local --stub
+"""
+import json
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from langchain_ollama import OllamaEmbeddings
+
+from compliance_rag.config import (
+    DATA_DIR,
+    GOLDEN_SET_PATH,
+    OLLAMA_BASE_URLS,
+    EMBEDDING_LOCAL_MODEL,
+    EMBEDDING_MODEL_FILE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_THREADS,
+    EMBEDDING_BATCH_WAIT_MS,
+)
+from compliance_rag.ingestion import discover_files, load_documents, make_text_splitter
+from compliance_rag.local_embeddings import LocalEmbeddings
+from compliance_rag.benchmarks.stub_servers import StubOllama
+
+BACKENDS = ("ollama", "local", "local-onnx")
+
+
+def make_backend(name: str, base_url: str):
+    if name == "ollama":
+        return OllamaEmbeddings(model="nomic-embed-text", base_url=base_url)
+    runtime = "onnx" if name == "local-onnx" else "torch"
+    return LocalEmbeddings(
+        EMBEDDING_LOCAL_MODEL, runtime=runtime, model_file=EMBEDDING_MODEL_FILE if runtime == "onnx" else None,
+        batch_size=EMBEDDING_BATCH_SIZE, threads=EMBEDDING_THREADS, batch_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+    )
+
+
+def corpus_chunks(count: int) -> List[str]:
+    """`count` chunks of the policies in DATA_DIR (repeated if the corpus is smaller)."""
+    docs = load_documents(discover_files(DATA_DIR), workers=1)
+    texts = [d.page_content for d in make_text_splitter().split_documents(docs)]
+    if not texts:
+        raise SystemExit(f"No policy documents in {DATA_DIR}")
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+def golden_questions(count: int) -> List[str]:
+    with open(GOLDEN_SET_PATH, encoding="utf-8") as f:
+        questions = [json.loads(line)["question"] for line in f if line.strip() and not line.startswith("#")]
+    return [questions[i % len(questions)] for i in range(count)]
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+
+def measure(embeddings, chunks: List[str], questions: List[str], window: int, concurrency: int) -> Dict:
+    embeddings.embed_query("warm-up")
+    dim = len(embeddings.embed_documents(chunks[:1])[0])
+
+    started = time.perf_counter()
+    for i in range(0, len(chunks), window):
+        embeddings.embed_documents(chunks[i:i + window])
+    ingest_s = time.perf_counter() - started
+
+    latencies = []
+    for question in questions:
+        started = time.perf_counter()
+        embeddings.embed_query(question)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        list(pool.map(embeddings.embed_query, questions))
+        concurrent_s = time.perf_counter() - started
+
+    return {
+        "dim": dim,
+        "chunks_per_s": round(len(chunks) / ingest_s, 1),
+        "query_ms": {
+            "mean": round(statistics.mean(latencies), 2),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+        },
+        "concurrent_queries_per_s": round(len(questions) / concurrent_s, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", default="ollama,local", help=f"Comma-separated subset of {', '.join(BACKENDS)}")
+    parser.add_argument("--chunks", type=int, default=512, help="Chunks embedded for the ingestion measurement")
+    parser.add_argument("--window", type=int, default=64, help="Chunks per embed_documents call")
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads for the concurrent query measurement")
+    parser.add_argument("--base-url", default=OLLAMA_BASE_URLS[0])
+    parser.add_argument("--stub", action="store_true", help="Embed over HTTP against a local stub instead of Ollama")
+    parser.add_argument("--stub-latency-ms", type=float, default=5)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    names = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = set(names) - set(BACKENDS)
+    if unknown:
+        parser.error(f"Unknown backends {sorted(unknown)}; choose from {', '.join(BACKENDS)}")
+
+    stub = None
+    if args.stub:
+        stub = StubOllama(latency_ms=args.stub_latency_ms).start()
+        args.base_url = stub.url
+
+    chunks = corpus_chunks(args.chunks)
+    questions = golden_questions(args.queries)
+    results = {}
+    try:
+        for name in names:
+            try:
+                results[name] = measure(make_backend(name, args.base_url), chunks, questions,
+                                        args.window, args.concurrency)
+            except (ImportError, OSError) as e:
+                results[name] = {"unavailable": f"{type(e).__name__}: {e}"}
+    finally:
+        if stub:
+            stub.stop()
+
+    print(f"{len(chunks)} chunks in windows of {args.window}, {len(questions)} queries "
+          f"(concurrency {args.concurrency}){' against a stub' if stub else ''}")
+    for name, r in results.items():
+        if "unavailable" in r:
+            print(f"  {name:<11} unavailable ({r['unavailable']})")
+            continue
+        print(f"  {name:<11} {r['chunks_per_s']:>8.1f} chunks/s   query p50 {r['query_ms']['p50']:>7.2f} ms "
+              f"p95 {r['query_ms']['p95']:>7.2f} ms   concurrent {r['concurrent_queries_per_s']:>7.1f} q/s   dim {r['dim']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Storage size, write cost and reconstruction latency of the delta-compressed
+SOP gene pool versus storing every generation in full.
+
+A synthetic evolution history is generated: each generation edits one sentence
+of the planner or synthesizer prompt of its parent (usually the latest version,
+sometimes an older one, so the lineage branches). The same history is written
+to a delta pool and to a full-snapshot pool (snapshot interval 1); every
+reconstructed version is checked against the SOP that was written.
+
+Usage:
+    python -m compliance_rag.benchmarks.gene_pool_lineage --generations 10000 --output gene_pool.json
+"""
+import os
+import json
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+from typing import Dict, List
+
+from compliance_rag.core.gene_pool import SOPGenePool
+from compliance_rag.core.sop import ComplianceSOP
+
+# Prompts drift around this many lines instead of growing without bound
+MAX_PROMPT_LINES = 40
+
+SENTENCES = (
+    "Always cite the policy ID for every requirement you state.",
+    "If two policies disagree, name both and explain which one takes precedence.",
+    "Prefer the most recently updated policy when versions differ.",
+    "Do not speculate about rules that are not in the findings.",
+    "Ask the SQL Analyst for owners, versions and dates.",
+    "Split multi-part questions into one research task per part.",
+    "Quote the exact clause when the answer depends on its wording.",
+    "Flag any requirement that applies only to contractors.",
+)
+
+
+def mutate(sop: ComplianceSOP, rng: random.Random) -> ComplianceSOP:
+    """One evolution step: insert, replace or drop a sentence in one prompt."""
+    field = rng.choice(["planner_prompt", "synthesizer_prompt"])
+    lines = getattr(sop, field).split("\n")
+    i = rng.randrange(len(lines))
+    action = rng.random()
+    if action < 0.4 and len(lines) < MAX_PROMPT_LINES:
+        lines.insert(i, rng.choice(SENTENCES))
+    elif action < 0.8 or len(lines) < 8:
+        lines[i] = rng.choice(SENTENCES) + f" (rule {rng.randrange(1000)})"
+    else:
+        del lines[i]
+    update = {field: "\n".join(lines)}
+    if rng.random() < 0.05:
+        update["researcher_retriever_k"] = rng.randint(2, 8)
+    return sop.model_copy(update=update)
+
+
+def build(path: str, generations: int, snapshot_interval: int, seed: int = 0) -> Dict:
+    rng = random.Random(seed)
+    pool = SOPGenePool(path, snapshot_interval=snapshot_interval, legacy_json_path=None)
+    expected: Dict[str, dict] = {"v0": pool.get_sop("v0").model_dump()}
+    versions: List[str] = ["v0"]
+    write_ms = []
+    for _ in range(generations - 1):
+        # Mostly extend the latest generation; sometimes branch from a recent ancestor
+        parent = versions[-1] if rng.random() < 0.8 else rng.choice(versions[-50:])
+        child = mutate(ComplianceSOP(**expected[parent]), rng)
+        start = time.perf_counter()
+        version = pool.add_next_sop(child, parent=parent)
+        write_ms.append((time.perf_counter() - start) * 1000)
+        expected[version] = child.model_dump()
+        versions.append(version)
+
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    body_bytes, snapshots = con.execute(
+        "SELECT SUM(LENGTH(body)), SUM(stored_as = 'snapshot') FROM sops"
+    ).fetchone()
+    con.close()
+    return {
+        "expected": expected,
+        "snapshot_interval": snapshot_interval,
+        "file_bytes": os.path.getsize(path),
+        "body_bytes": body_bytes,
+        "snapshots": snapshots,
+        "write_ms_mean": round(sum(write_ms) / len(write_ms), 3),
+        "write_ms_last_1000_mean": round(sum(write_ms[-1000:]) / len(write_ms[-1000:]), 3),
+    }
+
+
+def measure_reads(path: str, expected: Dict[str, dict], snapshot_interval: int, cache_size: int,
+                  samples: int, seed: int = 1) -> Dict:
+    rng = random.Random(seed)
+    versions = list(expected)
+    picks = [rng.choice(versions) for _ in range(samples)]
+
+    def timed(pool: SOPGenePool) -> List[float]:
+        latencies = []
+        for version in picks:
+            start = time.perf_counter()
+            sop = pool.get_sop(version)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert sop.model_dump() == expected[version], f"{version} reconstructed incorrectly"
+        return sorted(latencies)
+
+    # Cold: a fresh pool per lookup, so nothing is cached
+    cold = []
+    for version in picks:
+        pool = SOPGenePool(path, snapshot_interval=snapshot_interval, cache_size=cache_size, legacy_json_path=None)
+        start = time.perf_counter()
+        sop = pool.get_sop(version)
+        cold.append((time.perf_counter() - start) * 1000)
+        assert sop.model_dump() == expected[version], f"{version} reconstructed incorrectly"
+    cold.sort()
+
+    # Mixed: one long-lived pool with an LRU cache, random versions
+    pool = SOPGenePool(path, snapshot_interval=snapshot_interval, cache_size=cache_size, legacy_json_path=None)
+    mixed = timed(pool)
+
+    def pct(values, q):
+        return round(values[min(len(values) - 1, int(len(values) * q))], 3)
+
+    return {
+        "cold_ms_p50": pct(cold, 0.5), "cold_ms_p95": pct(cold, 0.95), "cold_ms_max": pct(cold, 1.0),
+        "cached_pool_ms_p50": pct(mixed, 0.5), "cached_pool_ms_p95": pct(mixed, 0.95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generations", type=int, default=10_000)
+    parser.add_argument("--snapshot-interval", type=int, default=32)
+    parser.add_argument("--cache-size", type=int, default=128)
+    parser.add_argument("--samples", type=int, default=500, help="Random versions reconstructed per measurement")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, interval in (("delta", args.snapshot_interval), ("full", 1)):
+            path = os.path.join(folder, f"{name}.db")
+            start = time.perf_counter()
+            built = build(path, args.generations, interval)
+            print(f"Wrote {args.generations} generations ({name}) in {time.perf_counter() - start:.1f}s")
+            expected = built.pop("expected")
+            built.update(measure_reads(path, expected, interval, args.cache_size, args.samples))
+            results.append({"storage": name, **built})
+
+    for r in results:
+        print(
+            f"{r['storage']:<6} file {r['file_bytes'] / 1e6:>7.2f} MB  bodies {r['body_bytes'] / 1e6:>7.2f} MB  "
+            f"write {r['write_ms_mean']:.2f} ms  cold read p50 {r['cold_ms_p50']:.2f} / p95 {r['cold_ms_p95']:.2f} ms  "
+            f"cached-pool read p50 {r['cached_pool_ms_p50']:.3f} ms"
+        )
+
+    report = {"generations": args.generations, "cache_size": args.cache_size, "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
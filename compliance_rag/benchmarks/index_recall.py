@@ -0,0 +1,137 @@
+"""
+Recall-vs-latency report for the supported FAISS index types.
+
+Builds every index configuration over the same vectors, measures recall@k
+against exact (flat) search and per-query latency for each nprobe / efSearch
+setting, and prints a table plus a JSON report.
+
+Usage:
+    python -m compliance_rag.benchmarks.index_recall --n 200000 --dim 768
+    python -m compliance_rag.benchmarks.index_recall --vectors embeddings.npy --output recall.json
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Dict, List
+
+import faiss
+import numpy as np
+
+from compliance_rag.vector_index import build_index, apply_search_params
+
+NPROBE_SWEEP = [1, 4, 16, 64]
+EF_SEARCH_SWEEP = [16, 32, 64, 128]
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Clustered Gaussian vectors, a rough stand-in for topic-structured embeddings."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dim)).astype("float32")
+    assignment = rng.integers(0, n_clusters, size=n)
+    noise = rng.normal(scale=0.35, size=(n, dim)).astype("float32")
+    return centers[assignment] + noise
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours present in the approximate top-k."""
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def index_size_bytes(index: faiss.Index) -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+
+
+def time_queries(index: faiss.Index, queries: np.ndarray, k: int):
+    """Runs queries one at a time (as the API does) and returns (ids, latencies_ms)."""
+    ids = np.empty((len(queries), k), dtype="int64")
+    latencies = []
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(q.reshape(1, -1), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = found[0]
+    return ids, np.asarray(latencies)
+
+
+def run_report(vectors: np.ndarray, queries: np.ndarray, k: int) -> List[Dict]:
+    dim = vectors.shape[1]
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(vectors)
+    _, truth = exact.search(queries, k)
+
+    rows = []
+    for index_type in ("flat", "ivf_flat", "ivf_pq", "hnsw"):
+        start = time.perf_counter()
+        index = build_index(vectors, index_type)
+        index.add(vectors)
+        build_s = time.perf_counter() - start
+
+        if faiss.try_extract_index_ivf(index) is not None:
+            sweep = [("nprobe", v) for v in NPROBE_SWEEP]
+        elif isinstance(index, faiss.IndexHNSW):
+            sweep = [("efSearch", v) for v in EF_SEARCH_SWEEP]
+        else:
+            sweep = [(None, None)]
+
+        size = index_size_bytes(index)
+        for param, value in sweep:
+            if param == "nprobe":
+                apply_search_params(index, nprobe=value)
+            elif param == "efSearch":
+                apply_search_params(index, ef_search=value)
+
+            found, latencies = time_queries(index, queries, k)
+            rows.append({
+                "index_type": index_type,
+                "param": param,
+                "value": value,
+                f"recall@{k}": round(recall_at_k(found, truth), 4),
+                "latency_ms_mean": round(float(latencies.mean()), 4),
+                "latency_ms_p95": round(float(np.percentile(latencies, 95)), 4),
+                "build_s": round(build_s, 3),
+                "index_bytes": size,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000, help="Synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=768, help="Synthetic vector dimension (nomic-embed-text is 768)")
+    parser.add_argument("--vectors", help="Optional .npy file of real embeddings to use instead")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    if args.vectors:
+        data = np.load(args.vectors).astype("float32")
+    else:
+        data = synthetic_vectors(args.n + args.queries, args.dim)
+    vectors, queries = data[:-args.queries], data[-args.queries:]
+
+    rows = run_report(np.ascontiguousarray(vectors), np.ascontiguousarray(queries), args.k)
+
+    print(f"{'index':<10} {'param':<9} {'value':>5} {'recall':>7} {'mean ms':>8} {'p95 ms':>8} {'MB':>8}")
+    for r in rows:
+        print(
+            f"{r['index_type']:<10} {str(r['param'] or '-'):<9} {str(r['value'] or '-'):>5} "
+            f"{r[f'recall@{args.k}']:>7.3f} {r['latency_ms_mean']:>8.3f} {r['latency_ms_p95']:>8.3f} "
+            f"{r['index_bytes'] / 1e6:>8.1f}"
+        )
+
+    report = {"n_vectors": len(vectors), "dim": vectors.shape[1], "k": args.k, "results": rows}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
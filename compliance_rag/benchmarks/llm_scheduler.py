@@ -0,0 +1,153 @@
+"""
+Interactive latency under background load, with and without the LLM scheduler.
+
+A simulated model server stands in for Ollama: each call takes `--service-ms`
+while at most `--capacity` calls run, and slows down proportionally beyond that
+(requests share the GPU). Background threads keep `--background` evolution calls
+in flight at all times, while interactive calls arrive every `--interval-ms`.
+
+Three setups are compared:
+    unscheduled - every call goes straight to the server (the old behaviour)
+    fifo        - the scheduler caps concurrency at --capacity, one queue for everyone
+    priority    - the scheduler with the default class weights (interactive first)
+    shared      - as priority, with slots taken from a SharedAdmission pool (the
+                  cross-process path, here with one process) to show its overhead
+
+Usage:
+    python -m compliance_rag.benchmarks.llm_scheduler --duration 20 --output llm_scheduler.json
+"""
+import os
+import json
+import time
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+from compliance_rag.admission import SharedAdmission
+from compliance_rag.scheduler import LLMScheduler, llm_priority, INTERACTIVE, BATCH, EVOLUTION
+
+
+class SimulatedServer:
+    """A model server whose per-call latency grows once more than `capacity` calls overlap."""
+    def __init__(self, service_ms: float, capacity: int):
+        self.service_s = service_ms / 1000
+        self.capacity = capacity
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def invoke(self, messages):
+        with self.lock:
+            self.active += 1
+            overlap = self.active
+        try:
+            time.sleep(self.service_s * max(1.0, overlap / self.capacity))
+        finally:
+            with self.lock:
+                self.active -= 1
+        return messages
+
+
+class SimulatedChatOllama:
+    """Looks like a ChatOllama model to the scheduler ('ollama/<model>' lane)."""
+    def __init__(self, server: SimulatedServer, model: str = "qwen2.5"):
+        self.server = server
+        self.model = model
+
+    def invoke(self, messages):
+        return self.server.invoke(messages)
+
+
+def pct(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * q))], 1) if values else 0.0
+
+
+def run(mode: str, args, workdir: str) -> Dict:
+    server = SimulatedServer(args.service_ms, args.capacity)
+    model = SimulatedChatOllama(server)
+    scheduler: Optional[LLMScheduler] = None
+    if mode != "unscheduled":
+        shared = SharedAdmission(os.path.join(workdir, f"{mode}.db")) if mode == "shared" else None
+        scheduler = LLMScheduler({"ollama": args.capacity}, shared=shared)
+        model = scheduler.wrap(model)
+    interactive_class = BATCH if mode == "fifo" else INTERACTIVE
+    background_class = BATCH if mode == "fifo" else EVOLUTION
+
+    stop = threading.Event()
+    background_calls = [0]
+
+    def background():
+        with llm_priority(background_class):
+            while not stop.is_set():
+                model.invoke(["evolve"])
+                background_calls[0] += 1
+
+    workers = [threading.Thread(target=background, daemon=True) for _ in range(args.background)]
+    for w in workers:
+        w.start()
+    time.sleep(args.service_ms / 1000)  # let the background load build up
+
+    latencies, callers = [], []
+
+    def interactive():
+        with llm_priority(interactive_class):
+            start = time.perf_counter()
+            model.invoke(["query"])
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    deadline = time.perf_counter() + args.duration
+    while time.perf_counter() < deadline:
+        t = threading.Thread(target=interactive)
+        t.start()
+        callers.append(t)
+        time.sleep(args.interval_ms / 1000)
+    for t in callers:
+        t.join()
+    stop.set()
+    for w in workers:
+        w.join()
+
+    result = {
+        "mode": mode,
+        "interactive_calls": len(latencies),
+        "interactive_ms_p50": pct(latencies, 0.5),
+        "interactive_ms_p95": pct(latencies, 0.95),
+        "interactive_ms_max": pct(latencies, 1.0),
+        "background_calls_per_s": round(background_calls[0] / args.duration, 2),
+    }
+    if scheduler:
+        result["scheduler"] = scheduler.stats()["classes"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of interactive traffic per setup")
+    parser.add_argument("--service-ms", type=float, default=200, help="Latency of one call on an idle server")
+    parser.add_argument("--capacity", type=int, default=2, help="Calls the server runs without slowing down")
+    parser.add_argument("--background", type=int, default=16, help="Evolution calls kept in flight")
+    parser.add_argument("--interval-ms", type=float, default=500, help="Gap between interactive calls")
+    parser.add_argument("--modes", default="unscheduled,fifo,priority,shared")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="llm_scheduler_")
+    for mode in args.modes.split(","):
+        result = run(mode.strip(), args, workdir)
+        results.append(result)
+        print(
+            f"{result['mode']:<12} interactive p50 {result['interactive_ms_p50']:>7.1f} ms  "
+            f"p95 {result['interactive_ms_p95']:>7.1f} ms  max {result['interactive_ms_max']:>7.1f} ms  "
+            f"background {result['background_calls_per_s']:.1f} calls/s"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+End-to-end load test of the API against local stub model servers.
+
+Starts `--replicas` stub servers (stub_servers.py) speaking the Ollama and
+OpenAI APIs with canned, valid replies for every agent role, a fixed
+`--latency-ms` per call and a `--tokens-per-s` generation speed. Then runs
+`uvicorn app:app` in a subprocess pointed at them (OLLAMA_BASE_URLS,
+OPENAI_BASE_URL), or targets an already running API with `--url`.
+
+`--concurrency` clients each send /query requests back to back (with
+include_timings) until `--requests` have completed, after `--warmup`
+unmeasured ones. The report has requests per second, p50/p95/p99 latency,
+p50/p95 per LangGraph node and per span kind (LLM calls, queue waits,
+vector search, SQL) from the per-request timings, and the load each stub saw.
+It is tagged with the git commit, so reports from two commits can be
+compared with `--baseline`.
+
+The API uses the vector store and metadata database in DATA_DIR as usual; the
+stub embeddings are hash vectors, so retrieval results are arbitrary but the
+search itself does the same work.
+
+Usage:
+    python -m compliance_rag.benchmarks.load_test --concurrency 8 --requests 200 --output load.json
+    python -m compliance_rag.benchmarks.load_test --concurrency 8 --requests 200 --baseline load.json
+Against a running API (whatever models it is configured with):
+    python -m compliance_rag.benchmarks.load_test --url http://localhost:8000 --concurrency 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from compliance_rag.benchmarks.stub_servers import start_stubs, canned_reply
+from compliance_rag.benchmarks.questions import QUESTIONS
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    return {
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_api(port: int, env: Dict[str, str], workers: int) -> subprocess.Popen:
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(command, cwd=REPO_ROOT, env={**os.environ, **env},
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+async def wait_until_healthy(client: httpx.AsyncClient, url: str, api: Optional[subprocess.Popen], timeout_s: float):
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        if api is not None and api.poll() is not None:
+            raise RuntimeError(f"API exited during startup:\n{api.stderr.read()[-2000:]}")
+        try:
+            if (await client.get(f"{url}/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"API at {url} not healthy after {timeout_s}s")
+
+
+async def drive(url: str, concurrency: int, requests: int, warmup: int, timeout_s: float, seed: int) -> Dict:
+    """Closed-loop clients; returns raw samples of the measured requests."""
+    rng = random.Random(seed)
+    questions = [rng.choice(QUESTIONS) for _ in range(warmup + requests)]
+    samples: List[Dict] = []
+    errors: Dict[str, int] = {}
+    next_index = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout_s, limits=limits) as client:
+        async def client_loop():
+            nonlocal next_index
+            while next_index < len(questions):
+                index, next_index = next_index, next_index + 1
+                started = time.perf_counter()
+                try:
+                    response = await client.post(f"{url}/query", json={"question": questions[index], "include_timings": True})
+                    outcome = str(response.status_code) if response.status_code != 200 else None
+                except httpx.HTTPError as e:
+                    response, outcome = None, type(e).__name__
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                if index < warmup:
+                    continue
+                if outcome:
+                    errors[outcome] = errors.get(outcome, 0) + 1
+                    continue
+                samples.append({"ms": elapsed_ms, "done": time.perf_counter(),
+                                "timings": response.json().get("timings") or {}})
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+        # Throughput over the measured part only (from the first measured request's start)
+        first_start = min((s["done"] - s["ms"] / 1000 for s in samples), default=started)
+        wall_s = max((s["done"] for s in samples), default=time.perf_counter()) - first_start
+    return {"samples": samples, "errors": errors, "wall_s": wall_s}
+
+
+def summarize(run: Dict) -> Dict:
+    samples = run["samples"]
+    nodes: Dict[str, List[float]] = {}
+    kinds: Dict[str, List[float]] = {}
+    tokens: Dict[str, List[int]] = {}
+    for s in samples:
+        for node, ms in s["timings"].get("nodes_ms", {}).items():
+            nodes.setdefault(node, []).append(ms)
+        for kind, ms in s["timings"].get("totals_ms", {}).items():
+            kinds.setdefault(kind, []).append(ms)
+        for role, used in s["timings"].get("tokens", {}).items():
+            tokens.setdefault(role, []).append(used["prompt"] + used["completion"])
+    return {
+        "completed": len(samples),
+        "errors": run["errors"],
+        "wall_s": round(run["wall_s"], 2),
+        "requests_per_s": round(len(samples) / run["wall_s"], 2) if run["wall_s"] > 0 else 0.0,
+        "latency_ms": distribution([s["ms"] for s in samples]),
+        "server_ms": distribution([s["timings"].get("total_ms", 0.0) for s in samples]),
+        "nodes_ms": {node: distribution(v) for node, v in sorted(nodes.items())},
+        "spans_ms": {kind: distribution(v) for kind, v in sorted(kinds.items())},
+        "tokens_per_request": {role: round(sum(v) / len(v), 1) for role, v in sorted(tokens.items())},
+    }
+
+
+def compare(current: Dict, baseline: Dict) -> List[str]:
+    """Lines with the change of the headline numbers against a baseline report."""
+    def change(now: float, then: float) -> str:
+        return f"{then:.1f} -> {now:.1f} ({(now - then) / then * 100:+.1f}%)" if then else f"{then} -> {now}"
+    now, then = current["results"], baseline["results"]
+    lines = [f"vs {baseline.get('commit') or 'baseline'}:",
+             f"  requests/s   {change(now['requests_per_s'], then['requests_per_s'])}"]
+    for q in ("p50", "p95", "p99"):
+        lines.append(f"  latency {q}  {change(now['latency_ms'][q], then['latency_ms'][q])} ms")
+    for node, d in now["nodes_ms"].items():
+        if node in then["nodes_ms"]:
+            lines.append(f"  {node:<12} p95 {change(d['p95'], then['nodes_ms'][node]['p95'])} ms")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="Measured requests")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--url", help="Target a running API instead of starting one against stubs")
+    parser.add_argument("--replicas", type=int, default=2, help="Stub model servers")
+    parser.add_argument("--latency-ms", type=float, default=100, help="Stub latency per call")
+    parser.add_argument("--tokens-per-s", type=float, default=200, help="Stub generation speed (0 = instant)")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the started API")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=120, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--baseline", help="Compare against a report written by an earlier run")
+    args = parser.parse_args()
+
+    stubs, api, url = [], None, args.url
+    if not url:
+        stubs = start_stubs(args.replicas, latency_ms=args.latency_ms, tokens_per_s=args.tokens_per_s,
+                            responder=canned_reply)
+        url = f"http://127.0.0.1:{args.port}"
+        api = start_api(args.port, {
+            "OLLAMA_BASE_URLS": ",".join(s.url for s in stubs),
+            "OPENAI_BASE_URL": stubs[0].openai_url,
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub"),
+        }, args.workers)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            await wait_until_healthy(client, url, api, timeout_s=120)
+        return await drive(url, args.concurrency, args.requests, args.warmup, args.timeout, args.seed)
+
+    try:
+        results = summarize(asyncio.run(run()))
+    finally:
+        if api is not None:
+            api.terminate()
+            api.wait(timeout=30)
+        for stub in stubs:
+            stub.stop()
+    results["stubs"] = [{"requests": s.requests, "max_in_flight": s.max_in_flight} for s in stubs]
+
+    report = {"commit": git_commit(), "config": vars(args), "results": results}
+    latency = results["latency_ms"]
+    print(f"{results['completed']} requests ({sum(results['errors'].values())} errors) at concurrency "
+          f"{args.concurrency}: {results['requests_per_s']} req/s, latency p50 {latency['p50']:.0f} / "
+          f"p95 {latency['p95']:.0f} / p99 {latency['p99']:.0f} ms")
+    for node, d in results["nodes_ms"].items():
+        print(f"  {node:<12} p50 {d['p50']:>8.1f} ms   p95 {d['p95']:>8.1f} ms")
+    for kind, d in results["spans_ms"].items():
+        print(f"  [{kind}]{'':<{max(0, 10 - len(kind))}} p50 {d['p50']:>8.1f} ms   p95 {d['p95']:>8.1f} ms")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            print("\n".join(compare(report, json.load(f))))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
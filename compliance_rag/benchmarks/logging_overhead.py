@@ -0,0 +1,173 @@
+"""
+Request-path cost of logging: what a log call costs the thread that makes it.
+
+`--threads` threads each log `--records` records in the shape of the /query
+logs (a short line with the question, then the answer as a `--payload-chars`
+payload), grouped into requests of `--per-request` records with their own
+request ID. Output goes to a stream that takes `--write-us` per write, standing
+in for a slow or contended stdout (container log driver, pipe to a collector).
+
+Configurations:
+  sync-text          the handler writes inline, payloads in full
+  sync-text-trunc    the same, payloads cut to LOG_PAYLOAD_MAX_CHARS
+  async-text         queue handler + writer thread, payloads in full
+  async-text-trunc   queue handler, truncated payloads
+  async-json-trunc   queue handler, JSON lines, truncated payloads
+  async-json-sampled queue handler, JSON lines, truncated, `--sample-rate` of requests
+
+Per configuration the report has the caller-side time per call (mean, p50,
+p99 in microseconds), caller throughput, how long the writer took to drain
+afterwards, bytes written and records dropped by a full queue. It also
+times a call below the logger's level written as an f-string, with %-style
+arguments, and with a payload() argument. Only the f-string pays for formatting
+there, so the gap grows with the cost of building the message; payload() adds a
+small constant for the wrapper object.
+
+Usage:
+    python -m compliance_rag.benchmarks.logging_overhead --threads 8 --records 2000 --output logging.json
+"""
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+from typing import Dict, List
+
+from compliance_rag.config import LOG_PAYLOAD_MAX_CHARS
+from compliance_rag.utils.logger import setup_logger, flush_logging, request_id_var, Payload
+
+CONFIGS = {
+    "sync-text": {"fmt": "text", "use_queue": False, "truncate": False, "sampled": False},
+    "sync-text-trunc": {"fmt": "text", "use_queue": False, "truncate": True, "sampled": False},
+    "async-text": {"fmt": "text", "use_queue": True, "truncate": False, "sampled": False},
+    "async-text-trunc": {"fmt": "text", "use_queue": True, "truncate": True, "sampled": False},
+    "async-json-trunc": {"fmt": "json", "use_queue": True, "truncate": True, "sampled": False},
+    "async-json-sampled": {"fmt": "json", "use_queue": True, "truncate": True, "sampled": True},
+}
+
+
+class SlowStream:
+    """A write target that takes a fixed time per write."""
+    def __init__(self, write_us: float):
+        self.write_s = write_us / 1_000_000
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, text: str):
+        if self.write_s:
+            time.sleep(self.write_s)
+        self.writes += 1
+        self.bytes += len(text)
+
+    def flush(self):
+        pass
+
+
+def answer_text(chars: int) -> str:
+    sentence = "Employees must not paste confidential data into public AI tools [POL-001]. "
+    return (sentence * (chars // len(sentence) + 1))[:chars]
+
+
+def run_config(name: str, options: Dict, args) -> Dict:
+    stream = SlowStream(args.write_us)
+    logger = setup_logger(f"bench_logging.{name}", level="INFO", fmt=options["fmt"],
+                          use_queue=options["use_queue"], stream=stream)
+    logger.propagate = False
+    queue_handler = logger.handlers[0]
+    max_chars = LOG_PAYLOAD_MAX_CHARS if options["truncate"] else 0
+    sample_rate = args.sample_rate if options["sampled"] else 1.0
+    answer = answer_text(args.payload_chars)
+    durations: List[List[int]] = [[] for _ in range(args.threads)]
+
+    def worker(index: int):
+        own = durations[index]
+        for n in range(args.records):
+            if n % args.per_request == 0:
+                request_id_var.set(f"t{index}-r{n // args.per_request}")
+            started = time.perf_counter_ns()
+            if n % 2 == 0:
+                logger.info("Query received: %s", Payload("Can I use ChatGPT for personal work?", max_chars, sample_rate))
+            else:
+                logger.info("Answered with SOP %s: %s", "v3", Payload(answer, max_chars, sample_rate))
+            own.append(time.perf_counter_ns() - started)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    caller_s = time.perf_counter() - started
+    flush_logging()
+    drained_s = time.perf_counter() - started
+
+    calls_us = sorted(d / 1000 for own in durations for d in own)
+    return {
+        "calls": len(calls_us),
+        "mean_us": round(statistics.mean(calls_us), 2),
+        "p50_us": round(calls_us[len(calls_us) // 2], 2),
+        "p99_us": round(calls_us[min(len(calls_us) - 1, int(len(calls_us) * 0.99))], 2),
+        "max_us": round(calls_us[-1], 2),
+        "caller_calls_per_s": round(len(calls_us) / caller_s),
+        "caller_s": round(caller_s, 3),
+        "drained_s": round(drained_s, 3),
+        "bytes_written": stream.bytes,
+        "dropped": getattr(queue_handler, "dropped", 0),
+    }
+
+
+def disabled_level_cost(payload_chars: int, calls: int) -> Dict[str, float]:
+    """Per-call cost (ns) of a log call below the logger's level: f-string vs %-style arguments."""
+    logger = logging.getLogger("bench_logging.disabled")
+    logger.setLevel(logging.WARNING)
+    answer = answer_text(payload_chars)
+
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        logger.info(f"Answered with SOP {'v3'}: {answer[:LOG_PAYLOAD_MAX_CHARS]}")
+    eager = (time.perf_counter_ns() - started) / calls
+
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        logger.info("Answered with SOP %s: %s", "v3", answer)
+    lazy = (time.perf_counter_ns() - started) / calls
+
+    started = time.perf_counter_ns()
+    for _ in range(calls):
+        logger.info("Answered with SOP %s: %s", "v3", Payload(answer))
+    wrapped = (time.perf_counter_ns() - started) / calls
+    return {"f_string_ns": round(eager, 1), "lazy_ns": round(lazy, 1), "lazy_payload_ns": round(wrapped, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent logging threads (requests in flight)")
+    parser.add_argument("--records", type=int, default=2000, help="Records per thread")
+    parser.add_argument("--per-request", type=int, default=10, help="Records per request ID")
+    parser.add_argument("--payload-chars", type=int, default=4000, help="Size of the logged answer")
+    parser.add_argument("--write-us", type=float, default=20, help="Time the output stream takes per write")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="Payload sample rate for async-json-sampled")
+    parser.add_argument("--configs", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    results = {name: run_config(name, CONFIGS[name], args) for name in args.configs}
+    disabled = disabled_level_cost(args.payload_chars, calls=100_000)
+
+    print(f"{args.threads} threads x {args.records} records, {args.payload_chars}-char payloads, "
+          f"{args.write_us:.0f} us per write")
+    for name, r in results.items():
+        print(f"  {name:<19} mean {r['mean_us']:>8.1f} us   p50 {r['p50_us']:>8.1f} us   p99 {r['p99_us']:>9.1f} us   "
+              f"drained {r['drained_s']:>6.2f}s   {r['bytes_written'] / 1e6:>6.1f} MB   dropped {r['dropped']}")
+    print(f"  disabled level: f-string {disabled['f_string_ns']:.0f} ns/call, lazy {disabled['lazy_ns']:.0f} ns/call, "
+          f"lazy with payload() {disabled['lazy_payload_ns']:.0f} ns/call")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results, "disabled_level": disabled}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Prompt-eval time of the specialist prompts before and after the prefix-cache layout.
+
+"before" sends each specialist one HumanMessage with the SOP prompt, the question
+and the fixed instructions interleaved, with Ollama's default context size and
+keep-alive. "after" sends the SOP prompt and fixed instructions first as a
+SystemMessage, followed by the per-request parts, with the per-role keep_alive
+and num_ctx from config. For each question the planner, SQL analyst and
+synthesizer are called as in one /query; Ollama reports how many prompt tokens
+it had to evaluate and how long that took.
+
+The findings passed to the synthesizer are excerpts of the policies in data/,
+about `--context-chars` long, so the context varies per question the way
+retrieval results do. A prompt longer than the context window is truncated by
+Ollama; those calls are counted as "truncated" (they are cheaper only because
+part of the context was thrown away).
+
+Usage (against the configured Ollama):
+    python -m compliance_rag.benchmarks.prompt_cache --questions 20 --output prompt_cache.json
+Dry run against a stub server that models Ollama's prompt cache:
+    python -m compliance_rag.benchmarks.prompt_cache --stub
+"""
+import glob
+import json
+import random
+import argparse
+import statistics
+from typing import Dict, List
+
+from langchain_core.messages import BaseMessage, HumanMessage
+from langchain_ollama import ChatOllama
+
+from compliance_rag.config import OLLAMA_BASE_URLS, DATA_DIR, role_options
+from compliance_rag.core.defaults import get_baseline_sop
+from compliance_rag.tools.retrieval import POLICY_FILTER_FIELDS
+from compliance_rag.agents.specialists import planner_messages, sql_analyst_messages, synthesizer_messages
+from compliance_rag.benchmarks.stub_servers import StubOllama, DEFAULT_NUM_CTX
+from compliance_rag.benchmarks.questions import QUESTIONS
+
+ROLES = {"planner": "llama3.1", "sql_analyst": "qwen2.5", "synthesizer": "qwen2.5"}
+
+
+# ── The prompts as they were built before (one HumanMessage each) ──
+
+def legacy_planner_messages(sop, request: str) -> List[BaseMessage]:
+    prompt = f"""
+    {sop.planner_prompt}
+
+    User Request: {request}
+
+    Respond in JSON with:
+    {{
+        "tasks": [
+            {{"agent": "researcher", "reasoning": "...", "query": "...", "filters": {{}}}},
+            {{"agent": "sql_analyst", "reasoning": "...", "query": "..."}}
+        ]
+    }}
+
+    Researcher "filters" are optional and restrict the search to matching policies.
+    Allowed keys: {", ".join(POLICY_FILTER_FIELDS)}.
+    Example: {{"department": "HR", "status": "Active"}}. Leave empty when the question is not scoped.
+    """
+    return [HumanMessage(content=prompt)]
+
+
+def legacy_sql_analyst_messages(task_query: str) -> List[BaseMessage]:
+    prompt = f"""
+            Generate a DuckDB SQL query to answer this task: '{task_query}'
+            Table name: 'policies'
+            Columns: policy_id, title, owner, version, last_updated, department, status, retention_years.
+
+            ONLY return the SQL query, no explanation.
+            """
+    return [HumanMessage(content=prompt)]
+
+
+def legacy_synthesizer_messages(sop, findings: str, request: str) -> List[BaseMessage]:
+    prompt = f"""
+    {sop.synthesizer_prompt}
+
+    Context from Research:
+    {findings}
+
+    User Original Request: {request}
+
+    Final Answer:
+    """
+    return [HumanMessage(content=prompt)]
+
+
+LAYOUTS = {
+    "before": (legacy_planner_messages, legacy_sql_analyst_messages, legacy_synthesizer_messages),
+    "after": (planner_messages, sql_analyst_messages, synthesizer_messages),
+}
+
+
+def policy_excerpts(context_chars: int, count: int, seed: int = 0) -> List[str]:
+    text = "\n\n".join(open(p, encoding="utf-8").read() for p in sorted(glob.glob(f"{DATA_DIR}/*.md")))
+    text = text or "Policy text. " * 1000
+    while len(text) < context_chars * 2:
+        text += "\n\n" + text
+    rng = random.Random(seed)
+    excerpts = []
+    for _ in range(count):
+        start = rng.randrange(0, len(text) - context_chars)
+        excerpts.append(f"Agent researcher found:\nQuery: ...\nResults:\n{text[start:start + context_chars]}")
+    return excerpts
+
+
+def run_layout(layout: str, base_url: str, questions: List[str], findings: List[str]) -> Dict:
+    planner_fn, sql_fn, synth_fn = LAYOUTS[layout]
+    models = {
+        role: ChatOllama(model=model, base_url=base_url, temperature=0.0, num_predict=16,
+                         **(role_options(role) if layout == "after" else {}))
+        for role, model in ROLES.items()
+    }
+    sop = get_baseline_sop()
+    samples: Dict[str, List[dict]] = {role: [] for role in ROLES}
+    for question, context in zip(questions, findings):
+        calls = {
+            "planner": planner_fn(sop, question),
+            "sql_analyst": sql_fn(question),
+            "synthesizer": synth_fn(sop, context, question),
+        }
+        for role, messages in calls.items():
+            meta = models[role].invoke(messages).response_metadata
+            samples[role].append({
+                "prompt_tokens_evaluated": meta.get("prompt_eval_count") or 0,
+                "prompt_eval_ms": (meta.get("prompt_eval_duration") or 0) / 1e6,
+                "load_ms": (meta.get("load_duration") or 0) / 1e6,
+            })
+
+    report = {}
+    for role, rows in samples.items():
+        warm = rows[1:] or rows  # the first call of a role pays for loading the model and the cold prefix
+        num_ctx = models[role].num_ctx or DEFAULT_NUM_CTX
+        report[role] = {
+            # Evaluating a full window means Ollama cut the prompt (and the answer lost context)
+            "truncated_calls": sum(r["prompt_tokens_evaluated"] >= num_ctx for r in rows),
+            "first_call_load_ms": round(rows[0]["load_ms"], 1),
+            "prompt_tokens_evaluated_mean": round(statistics.mean(r["prompt_tokens_evaluated"] for r in warm), 1),
+            "prompt_eval_ms_mean": round(statistics.mean(r["prompt_eval_ms"] for r in warm), 2),
+            "prompt_eval_ms_p95": round(sorted(r["prompt_eval_ms"] for r in warm)[int(len(warm) * 0.95) - 1], 2),
+            "load_ms_after_first": round(sum(r["load_ms"] for r in warm), 1),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=20)
+    parser.add_argument("--context-chars", type=int, default=9000, help="Length of the findings per question")
+    parser.add_argument("--base-url", default=OLLAMA_BASE_URLS[0])
+    parser.add_argument("--stub", action="store_true", help="Use a local stub that models the prompt cache")
+    parser.add_argument("--stub-ms-per-token", type=float, default=0.5)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        stub = StubOllama(latency_ms=0, prompt_ms_per_token=args.stub_ms_per_token).start()
+        args.base_url = stub.url
+
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(args.questions)]
+    findings = policy_excerpts(args.context_chars, args.questions)
+    results = {layout: run_layout(layout, args.base_url, questions, findings) for layout in LAYOUTS}
+    if stub:
+        stub.stop()
+
+    for role in ROLES:
+        before, after = results["before"][role], results["after"][role]
+        print(
+            f"{role:<12} prompt tokens evaluated {before['prompt_tokens_evaluated_mean']:>7.0f} -> "
+            f"{after['prompt_tokens_evaluated_mean']:<7.0f} prompt eval {before['prompt_eval_ms_mean']:>8.1f} -> "
+            f"{after['prompt_eval_ms_mean']:.1f} ms (mean), reloads {before['load_ms_after_first']:.0f} -> "
+            f"{after['load_ms_after_first']:.0f} ms, truncated {before['truncated_calls']} -> {after['truncated_calls']}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
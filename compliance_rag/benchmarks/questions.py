@@ -0,0 +1,19 @@
+"""
+Typical compliance questions shared by the benchmarks.
+
+Kept free of imports so a benchmark that only needs the questions (e.g. a
+load test against a remote API) doesn't load models, stores or config.
+"""
+
+QUESTIONS = (
+    "Can I use ChatGPT for personal work?",
+    "Who owns the remote work policy and when was it last updated?",
+    "Which policies apply to contractors handling confidential data?",
+    "Can I work from another country for two weeks?",
+    "How must restricted data be labelled in email?",
+    "Are employees allowed to paste source code into AI assistants?",
+    "What equipment does the company provide for home offices?",
+    "How long are HR records retained?",
+    "Which department owns the data classification standard?",
+    "Do I need approval before installing a browser extension with AI features?",
+)
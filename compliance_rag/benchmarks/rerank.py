@@ -0,0 +1,121 @@
+"""
+Synthesizer context size, policy recall and latency with and without the rerank stage.
+
+For every golden-set question (GOLDEN_SET_PATH) the configured vector store is
+searched three ways:
+  wide     top `--wide-k` hits, no reranking (recall bought with context)
+  narrow   top `--k` hits, no reranking
+  rerank   top `--candidates` hits, reranked by the cross-encoder to `--k`
+
+Per strategy the report has the mean policy recall (expected policies whose ID
+or source document appears in the context), the context handed to the
+synthesizer in characters and approximate tokens, search and rerank latency
+(p50/p95; rerank both with a cold and a warm score cache) and the net change
+in time per query: rerank time minus the prompt-eval time saved on the tokens
+cut, at `--prompt-tokens-per-s` (measure it with prompt_cache.py; the
+default is roughly qwen2.5 7B on CPU). Real end-to-end numbers come from
+load_test.py with an SOP that has rerank_enabled.
+
+Usage:
+    python -m compliance_rag.benchmarks.rerank --k 3 --wide-k 10 --candidates 20 --output rerank.json
+"""
+import json
+import time
+import argparse
+import statistics
+from typing import Dict, List
+
+from compliance_rag.agents.specialists import CHARS_PER_TOKEN
+from compliance_rag.evaluation.runner import load_golden_set, policy_sources, policy_recall
+from compliance_rag.tools import retrieval
+from compliance_rag.tools.retrieval import _format_chunk
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "p50": round(ordered[len(ordered) // 2], 2),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2),
+    }
+
+
+def run_strategy(questions, sources, fetch_k: int, keep_k: int, rerank: bool) -> Dict:
+    search_ms, rerank_cold_ms, rerank_warm_ms, chars, recalls = [], [], [], [], []
+    store = retrieval.get_vector_store()  # loaded outside the timed searches
+    for item in questions:
+        started = time.perf_counter()
+        docs = store.similarity_search(item.question, k=fetch_k)
+        search_ms.append((time.perf_counter() - started) * 1000)
+        if rerank:
+            for timings in (rerank_cold_ms, rerank_warm_ms):
+                started = time.perf_counter()
+                ranked = retrieval.reranker.rerank(item.question, docs, keep_k)
+                timings.append((time.perf_counter() - started) * 1000)
+            docs = [doc for doc, _ in ranked]
+        context = "\n\n".join(_format_chunk(d) for d in docs)
+        chars.append(len(context))
+        recalls.append(policy_recall(item.expected_policy_ids, context, "", sources))
+
+    result = {
+        "fetched": fetch_k,
+        "kept": keep_k,
+        "policy_recall": round(statistics.mean(recalls), 3),
+        "context_chars": round(statistics.mean(chars)),
+        "context_tokens": round(statistics.mean(chars) / CHARS_PER_TOKEN),
+        "search_ms": percentiles(search_ms),
+    }
+    if rerank:
+        result["rerank_cold_ms"] = percentiles(rerank_cold_ms)
+        result["rerank_warm_ms"] = percentiles(rerank_warm_ms)
+        result["rerank_cold_mean_ms"] = round(statistics.mean(rerank_cold_ms), 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", type=int, default=3, help="Chunks passed to the synthesizer")
+    parser.add_argument("--wide-k", type=int, default=10, help="k of the no-rerank high-recall baseline")
+    parser.add_argument("--candidates", type=int, default=20, help="Hits fetched for reranking")
+    parser.add_argument("--prompt-tokens-per-s", type=float, default=150, help="Synthesizer prompt-eval speed")
+    parser.add_argument("--golden", help="Golden-set JSONL file (default: GOLDEN_SET_PATH)")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    questions = load_golden_set(args.golden) if args.golden else load_golden_set()
+    sources = policy_sources()
+    results = {
+        "wide": run_strategy(questions, sources, args.wide_k, args.wide_k, rerank=False),
+        "narrow": run_strategy(questions, sources, args.k, args.k, rerank=False),
+        "rerank": run_strategy(questions, sources, args.candidates, args.k, rerank=True),
+    }
+    if retrieval.reranker.stats()["unavailable"]:
+        print(f"Cross-encoder unavailable ({retrieval.reranker.stats()['unavailable']}); 'rerank' is FAISS order.")
+
+    # Net time per query against the wide baseline: rerank cost minus prompt-eval time saved
+    saved_tokens = results["wide"]["context_tokens"] - results["rerank"]["context_tokens"]
+    saved_ms = saved_tokens / args.prompt_tokens_per_s * 1000
+    net_ms = results["rerank"]["rerank_cold_mean_ms"] - saved_ms
+    summary = {"prompt_tokens_saved": saved_tokens, "prompt_eval_ms_saved": round(saved_ms, 1),
+               "net_ms_per_query": round(net_ms, 1)}
+
+    print(f"{len(questions)} questions, synthesizer context from k={args.k} (wide k={args.wide_k}, "
+          f"rerank {args.candidates} -> {args.k})")
+    for name, r in results.items():
+        line = (f"  {name:<7} recall {r['policy_recall']:.2f}   ~{r['context_tokens']:>5} tokens   "
+                f"search p50 {r['search_ms']['p50']:>7.1f} ms")
+        if "rerank_cold_ms" in r:
+            line += (f"   rerank p50 {r['rerank_cold_ms']['p50']:.1f} ms cold / "
+                     f"{r['rerank_warm_ms']['p50']:.1f} ms cached")
+        print(line)
+    print(f"  vs wide: {saved_tokens} prompt tokens fewer (~{saved_ms:.0f} ms at {args.prompt_tokens_per_s:g} tok/s), "
+          f"net {net_ms:+.0f} ms per query")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": vars(args), "results": results, "net_vs_wide": summary,
+                       "reranker": retrieval.reranker.stats()}, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,335 @@
+"""
+Retrieval scaling on a synthetic policy corpus at multiples of the bundled one.
+
+For each scale in `--scales` (multiples of the number of policies in data/):
+
+1. Generate that many policy documents (markdown with header fields and
+   numbered sections, about as long as the bundled ones) plus a CSV metadata
+   export with one row per policy.
+2. Ingest them the way `compliance_rag.metadata_db` and `compliance_rag.ingestion`
+   do: bulk-load the export into DuckDB, then parse (process pool), tag, split,
+   drop near-duplicates, embed and append to a StreamingIndexBuilder in windows.
+   Embeddings come from `HashEmbeddings`, deterministic offline vectors, so
+   only the pipeline itself is timed. Reports per-stage seconds, docs/s,
+   chunks/s, index build time and the size on disk of the index, chunk store
+   and metadata database.
+3. In a fresh process with DATA_DIR pointing at that corpus: load time and
+   resident memory of the vector store, then latency (p50/p95) of
+   `policy_search_tool` for every k in `--ks`, unfiltered and filtered by
+   department, of the DuckDB filter lookup and of typical SQL Analyst queries.
+
+Usage:
+    python -m compliance_rag.benchmarks.retrieval_scaling --scales 1,10,100,1000 --output retrieval_scaling.json
+"""
+import io
+import os
+import csv
+import sys
+import json
+import glob
+import time
+import random
+import hashlib
+import argparse
+import resource
+import tempfile
+import subprocess
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+import duckdb
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from compliance_rag.config import (
+    DATA_DIR, FAISS_INDEX_TYPE, INGEST_WORKERS, INGEST_WINDOW_FILES, CHUNKER, DEDUP_MAX_HAMMING
+)
+from compliance_rag.metadata_db import POLICY_COLUMNS, load_policy_exports, load_front_matter
+from compliance_rag.ingestion import discover_files, load_documents, tag_policy_metadata, make_text_splitter
+from compliance_rag.chunking import NearDuplicateFilter
+from compliance_rag.chunk_store import CHUNK_STORE_FILE
+from compliance_rag.vector_index import StreamingIndexBuilder, INDEX_FILE, embedding_fingerprint
+from compliance_rag.benchmarks.chunk_store_load import _rss_mb
+from compliance_rag.benchmarks.questions import QUESTIONS
+
+DEFAULT_KS = (1, 3, 5, 10, 20)
+
+DEPARTMENTS = ("HR", "IT Security", "Engineering", "Legal", "Finance", "Security")
+STATUSES = ("Active", "Active", "Active", "Draft", "Retired")
+OWNERS = ("Sarah Chen", "Marcus Thorne", "Elena Rodriguez", "Priya Nair", "Tom Okafor", "Ana Silva")
+TOPICS = ("AI Usage", "Remote Work", "Data Classification", "Data Retention", "Access Control", "Travel",
+          "Vendor Management", "Incident Response", "Acceptable Use", "Expense", "Device Security", "Email")
+SECTIONS = ("Purpose", "Scope", "Requirements", "Prohibited Use", "Exceptions", "Violation")
+SUBJECTS = ("Employees", "Contractors", "Managers", "Third parties", "System owners", "All staff")
+MODALS = ("must", "must not", "should", "may", "shall")
+ACTIONS = ("store", "share", "approve", "encrypt", "review", "report", "delete", "label", "access", "retain")
+OBJECTS = ("confidential data", "customer records", "source code", "company devices", "AI-generated content",
+           "personal information", "financial reports", "access credentials", "vendor contracts", "audit logs")
+CONDITIONS = ("without written approval", "within 30 days", "using approved tools only", "outside the office",
+              "before deployment", "on a quarterly basis", "when requested by Legal", "in line with the standard")
+
+
+# ── Synthetic corpus ─────────────────────────────────────────
+
+def synthetic_policies(n: int, doc_chars: int = 1300, seed: int = 0) -> Iterator[Tuple[str, str, Dict]]:
+    """(file name, markdown text, metadata row) for `n` deterministic synthetic policies."""
+    rng = random.Random(seed)
+    for i in range(n):
+        topic = f"{rng.choice(TOPICS)} Policy {i + 1}"
+        row = {
+            "policy_id": f"POL-{i + 1:06d}",
+            "title": topic,
+            "owner": rng.choice(OWNERS),
+            "version": f"{rng.randint(1, 4)}.{rng.randint(0, 9)}",
+            "last_updated": f"{rng.randint(2019, 2025)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "department": rng.choice(DEPARTMENTS),
+            "status": rng.choice(STATUSES),
+            "retention_years": rng.randint(1, 10),
+            "source_file": f"policy_{i + 1:06d}.md",
+        }
+        lines = [f"# {topic}", "", f"**Version:** {row['version']}",
+                 f"**Effective Date:** {row['last_updated']}", f"**Department:** {row['department']}", ""]
+        section = 0
+        while sum(len(line) + 1 for line in lines) < doc_chars:
+            lines += [f"## {section + 1}. {SECTIONS[section % len(SECTIONS)]}", ""]
+            for _ in range(rng.randint(2, 4)):
+                lines.append(f"- {rng.choice(SUBJECTS)} {rng.choice(MODALS)} {rng.choice(ACTIONS)} "
+                             f"{rng.choice(OBJECTS)} {rng.choice(CONDITIONS)}.")
+            lines.append("")
+            section += 1
+        yield row["source_file"], "\n".join(lines), row
+
+
+def write_corpus(folder: str, n: int, doc_chars: int) -> Dict:
+    """Writes `n` policies to folder/docs and their metadata to folder/metadata.csv."""
+    docs_dir = os.path.join(folder, "docs")
+    os.makedirs(docs_dir, exist_ok=True)
+    total_bytes = 0
+    with open(os.path.join(folder, "metadata.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(POLICY_COLUMNS))
+        writer.writeheader()
+        for file_name, text, row in synthetic_policies(n, doc_chars):
+            with open(os.path.join(docs_dir, file_name), "w", encoding="utf-8") as doc:
+                total_bytes += doc.write(text)
+            writer.writerow(row)
+    return {"documents": n, "corpus_bytes": total_bytes}
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings: hashed bag of words, L2-normalized.
+    Texts sharing words get similar vectors, so searches behave like a (weak) real model.
+    """
+    def __init__(self, dim: int = 768):
+        self.dim = dim
+        self.fingerprint = f"hash/{dim}"
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype="float32")
+        for word in text.lower().split():
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+# ── Ingestion ────────────────────────────────────────────────
+
+def ingest(folder: str, dim: int, index_type: str, window_files: int) -> Dict:
+    """Loads the metadata export and indexes the documents like the real pipeline, timing each stage."""
+    timings = {"metadata_s": 0.0, "parse_s": 0.0, "split_s": 0.0, "dedup_s": 0.0, "embed_s": 0.0, "index_s": 0.0}
+    embeddings = HashEmbeddings(dim)
+    db_path = os.path.join(folder, "policy_metadata.db")
+    store_path = os.path.join(folder, "vector_store")
+    start = time.perf_counter()
+
+    # Pipeline output is noisy per window; only the measurements are reported
+    with contextlib.redirect_stdout(io.StringIO()):
+        con = duckdb.connect(db_path)
+        t = time.perf_counter()
+        rows = load_policy_exports([os.path.join(folder, "metadata.csv")], con)
+        timings["metadata_s"] = time.perf_counter() - t
+
+        builder = StreamingIndexBuilder(store_path, index_type, embedding=embedding_fingerprint(embeddings))
+        splitter = make_text_splitter()
+        dedup = NearDuplicateFilter(DEDUP_MAX_HAMMING) if DEDUP_MAX_HAMMING >= 0 else None
+        paths = discover_files(os.path.join(folder, "docs"))
+        produced = 0
+        try:
+            with ProcessPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+                for window_start in range(0, len(paths), window_files):
+                    window = paths[window_start:window_start + window_files]
+                    t = time.perf_counter()
+                    raw_docs = load_documents(window, pool=pool)
+                    tag_policy_metadata(raw_docs, load_front_matter(raw_docs, con))
+                    timings["parse_s"] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    splits = splitter.split_documents(raw_docs)
+                    produced += len(splits)
+                    timings["split_s"] += time.perf_counter() - t
+                    if dedup:
+                        t = time.perf_counter()
+                        splits = dedup.filter(splits)
+                        timings["dedup_s"] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    vectors = embeddings.embed_documents([d.page_content for d in splits]) if splits else []
+                    timings["embed_s"] += time.perf_counter() - t
+
+                    t = time.perf_counter()
+                    builder.add(splits, vectors, files=window, duplicates=dedup.take_dropped() if dedup else None)
+                    timings["index_s"] += time.perf_counter() - t
+            t = time.perf_counter()
+            chunks = builder.finish()
+            timings["index_s"] += time.perf_counter() - t
+        finally:
+            builder.close()
+            con.close()
+
+    wall_s = time.perf_counter() - start
+    return {
+        "metadata_rows": rows,
+        "metadata_rows_per_s": round(rows / max(timings["metadata_s"], 1e-9), 1),
+        "chunks_produced": produced,
+        "chunks_indexed": chunks,
+        "ingest_s": round(wall_s, 3),
+        "docs_per_s": round(len(paths) / wall_s, 1),
+        "chunks_per_s": round(chunks / wall_s, 1),
+        "stages_s": {name: round(value, 3) for name, value in timings.items()},
+        "index_build_s": round(timings["index_s"], 3),
+        "index_bytes": os.path.getsize(os.path.join(store_path, INDEX_FILE)),
+        "chunk_store_bytes": os.path.getsize(os.path.join(store_path, CHUNK_STORE_FILE)),
+        "metadata_db_bytes": os.path.getsize(db_path),
+    }
+
+
+# ── Query side (runs in a fresh process with DATA_DIR=<corpus folder>) ──
+
+SQL_QUERIES = {
+    "by_department": "SELECT policy_id, title, owner FROM policies WHERE department = 'HR' AND status = 'Active'",
+    "count_by_department": "SELECT department, COUNT(*) AS policies FROM policies GROUP BY department",
+    "recently_updated": "SELECT policy_id, title, last_updated FROM policies ORDER BY last_updated DESC LIMIT 10",
+    "by_id": "SELECT owner, version, retention_years FROM policies WHERE policy_id = 'POL-000001'",
+}
+
+
+def _latency(fn, repeats: int) -> Dict[str, float]:
+    samples = []
+    for i in range(repeats):
+        t = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t) * 1000)
+    samples.sort()
+    return {"p50_ms": round(samples[len(samples) // 2], 3), "p95_ms": round(samples[int(len(samples) * 0.95)], 3)}
+
+
+def measure_queries(dim: int, ks: List[int], repeats: int) -> Dict:
+    from compliance_rag.config import VECTOR_STORE_PATH
+    from compliance_rag.vector_index import load_vector_store
+
+    baseline = _rss_mb()
+    start = time.perf_counter()
+    store = load_vector_store(VECTOR_STORE_PATH, HashEmbeddings(dim))
+    load_s = time.perf_counter() - start
+    loaded_rss = _rss_mb()
+
+    # The tools search the module's store; point it at the one just measured. The module
+    # loads its own store lazily, so importing it here (or earlier) loads nothing else.
+    from compliance_rag.tools import retrieval
+    retrieval.vector_store = store
+
+    search = {}
+    for k in ks:
+        search[str(k)] = {
+            "unfiltered": _latency(lambda i: retrieval.policy_search_tool.invoke(
+                {"query": QUESTIONS[i % len(QUESTIONS)], "k": k}), repeats),
+            "filtered": _latency(lambda i: retrieval.policy_search_tool.invoke(
+                {"query": QUESTIONS[i % len(QUESTIONS)], "k": k,
+                 "filters": {"department": DEPARTMENTS[i % len(DEPARTMENTS)], "status": "Active"}}), repeats),
+        }
+    return {
+        "vectors": store.index.ntotal,
+        "load_s": round(load_s, 4),
+        "rss_after_load_mb": round(loaded_rss - baseline, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "search": search,
+        "policy_filter": _latency(lambda i: retrieval.resolve_policy_ids(
+            {"department": DEPARTMENTS[i % len(DEPARTMENTS)], "status": "Active"}), repeats),
+        "sql": {name: _latency(lambda i: retrieval.policy_metadata_tool.invoke({"sql_query": sql}), repeats)
+                for name, sql in SQL_QUERIES.items()},
+    }
+
+
+def run_scale(scale: int, base_docs: int, args) -> Dict:
+    n = max(1, scale * base_docs)
+    with tempfile.TemporaryDirectory() as folder:
+        corpus = write_corpus(folder, n, args.doc_chars)
+        ingested = ingest(folder, args.dim, args.index_type, args.window_files)
+        env = {**os.environ, "DATA_DIR": folder, "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "unused")}
+        out = subprocess.run(
+            [sys.executable, "-m", __spec__.name, "--measure", "--dim", str(args.dim),
+             "--ks", ",".join(map(str, args.ks)), "--repeats", str(args.repeats)],
+            check=True, capture_output=True, text=True, env=env,
+        )
+        queries = json.loads(out.stdout.strip().splitlines()[-1])
+    return {"scale": scale, **corpus, "ingestion": ingested, "queries": queries}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1,10,100,1000", help="Multiples of the bundled corpus")
+    parser.add_argument("--base-docs", type=int, help="Documents at scale 1 (default: policies in DATA_DIR)")
+    parser.add_argument("--doc-chars", type=int, default=1300, help="Approximate length of each document")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension")
+    parser.add_argument("--ks", default=",".join(map(str, DEFAULT_KS)))
+    parser.add_argument("--repeats", type=int, default=100, help="Queries per measurement")
+    parser.add_argument("--index-type", default=FAISS_INDEX_TYPE)
+    parser.add_argument("--window-files", type=int, default=INGEST_WINDOW_FILES)
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.ks = [int(k) for k in str(args.ks).split(",") if k]
+
+    if args.measure:
+        with contextlib.redirect_stdout(io.StringIO()):
+            report = measure_queries(args.dim, args.ks, args.repeats)
+        print(json.dumps(report))
+        return
+
+    base_docs = args.base_docs or len(glob.glob(os.path.join(DATA_DIR, "*.md"))) or 3
+    results = []
+    for scale in [int(s) for s in args.scales.split(",") if s]:
+        result = run_scale(scale, base_docs, args)
+        results.append(result)
+        ing, q = result["ingestion"], result["queries"]
+        k_mid = str(args.ks[len(args.ks) // 2])
+        print(
+            f"{scale:>5}x {result['documents']:>7} docs {ing['chunks_indexed']:>8} chunks  "
+            f"ingest {ing['ingest_s']:>8.2f}s ({ing['docs_per_s']:>7.1f} docs/s)  "
+            f"index {ing['index_bytes'] / 1e6:>7.1f} MB  load {q['load_s'] * 1000:>7.1f} ms  "
+            f"rss +{q['rss_after_load_mb']:>6.1f} MB  search k={k_mid} p95 "
+            f"{q['search'][k_mid]['unfiltered']['p95_ms']:.2f} / filtered {q['search'][k_mid]['filtered']['p95_ms']:.2f} ms"
+        )
+
+    report = {
+        "config": {**{k: v for k, v in vars(args).items() if k != "measure"}, "base_docs": base_docs,
+                   "chunker": CHUNKER, "dedup_max_hamming": DEDUP_MAX_HAMMING},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+"""
+Local stand-ins for Ollama replicas (and the OpenAI API), for tests and load benchmarks.
+
+Each `StubOllama` is a small threaded HTTP server speaking the parts of the
+Ollama API the app uses (/api/chat, /api/embed, /api/embeddings, /api/tags)
+and of the OpenAI API (/v1/chat/completions, /v1/embeddings, /v1/models; point
+OPENAI_BASE_URL at `openai_url`). Chat replies echo the last user message, or
+come from a `responder` such as `canned_reply`, which answers every agent role
+(including the population-mode Architect and the conflict check) with a fixed,
+valid output; embeddings are deterministic hash vectors.
+Latency, generation speed (`tokens_per_s`), slow-tail behaviour and failures
+are configurable per stub and can be changed while it runs, so tests can slow
+down or break a replica.
+
+With `prompt_ms_per_token` set, chat calls also model Ollama's prompt cache:
+each model has PROMPT_CACHE_SLOTS slots (like OLLAMA_NUM_PARALLEL) remembering
+their last prompt, a request takes the slot sharing the longest prefix, only
+the tokens after that prefix are "evaluated" (and cost time), and a prompt
+longer than `num_ctx` (default 2048) is truncated, which discards the cache.
+
+Usage (three replicas on ports 11501-11503):
+    python -m compliance_rag.benchmarks.stub_servers --count 3 --base-port 11501 --latency-ms 200
+    OLLAMA_BASE_URLS=http://127.0.0.1:11501,http://127.0.0.1:11502,http://127.0.0.1:11503 uvicorn app:app
+"""
+import os
+import json
+import time
+import random
+import socket
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Optional
+
+EMBEDDING_DIM = 768
+
+# Ollama's context size when a request sets no num_ctx
+DEFAULT_NUM_CTX = 2048
+PROMPT_CACHE_SLOTS = 4
+
+
+def canned_reply(messages: List[dict]) -> str:
+    """A deterministic, well-formed reply for whichever agent role sent `messages`."""
+    text = "\n".join(str(m.get("content", "")) for m in messages)
+    question = str(messages[-1].get("content", "")).replace("User Request:", "").strip()
+    if '"conflict": true or false' in text:  # conflict check (conflicts.py); about one pair in four conflicts
+        conflict = hashlib.sha256(text.encode("utf-8")).digest()[0] % 4 == 0
+        return json.dumps({"conflict": conflict, "explanation": "Canned verdict: the clauses set "
+                           + ("different approval requirements." if conflict else "compatible requirements.")})
+    if '"candidates"' in text:  # architect, population mode: distinct candidates, as asked
+        return json.dumps({"candidates": [
+            {"strategy": "Tighten the synthesizer.", "synthesizer_prompt": "Answer briefly, citing every policy ID."},
+            {"strategy": "Plan fewer tasks.", "planner_prompt": "Plan one focused search per question."},
+            {"strategy": "Retrieve less.", "settings": {"researcher_retriever_k": 2}},
+        ]})
+    if '"tasks"' in text:  # planner
+        return json.dumps({"tasks": [
+            {"agent": "researcher", "reasoning": "Find the governing policy.", "query": question, "filters": {}},
+            {"agent": "sql_analyst", "reasoning": "Look up owners and status.", "query": "Active policies and owners"},
+        ]})
+    if "DuckDB SQL" in text:  # SQL analyst
+        return "SELECT policy_id, title, owner, status FROM policies WHERE status = 'Active' LIMIT 5"
+    if '"score"' in text:  # judge
+        return json.dumps({"score": 4, "reasoning": "Canned judge reply."})
+    if '"planner_prompt"' in text:  # architect
+        return json.dumps({"planner_prompt": "Plan the search.", "synthesizer_prompt": "Answer with citations."})
+    return ("According to the AI Usage Policy [POL-001], company data must not be entered into unapproved "
+            "AI tools, and exceptions require written approval from the policy owner. [POL-003]")
+
+
+def stub_embedding(text: str, dim: int = EMBEDDING_DIM) -> List[float]:
+    """Deterministic unit-ish vector for `text` (same text, same vector)."""
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+    rng = random.Random(seed)
+    return [rng.uniform(-1, 1) for _ in range(dim)]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        # Headers and body are written separately; don't let Nagle delay the body
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stub._connections.add(self.connection)
+
+    def finish(self):
+        self.server.stub._connections.discard(self.connection)
+        super().finish()
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        stub: StubOllama = self.server.stub
+        if self.path.rstrip("/") in ("", "/api/tags", "/api/version"):
+            if stub.fail:
+                return self._send(503, b'{"error": "stub unavailable"}')
+            return self._send(200, json.dumps({"models": [{"name": stub.model, "model": stub.model}]}).encode())
+        if self.path.rstrip("/") == "/v1/models":
+            return self._send(200, json.dumps({"object": "list", "data": [{"id": stub.model, "object": "model"}]}).encode())
+        self._send(404, b'{"error": "not found"}')
+
+    def do_POST(self):
+        stub: StubOllama = self.server.stub
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        stub._begin()
+        try:
+            time.sleep(stub.sample_latency())
+            if stub.fail:
+                return self._send(500, b'{"error": "stub failure"}')
+            if self.path == "/api/chat":
+                return self._chat(request)
+            if self.path == "/v1/chat/completions":
+                return self._openai_chat(request)
+            if self.path == "/v1/embeddings":
+                inputs = request.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                data = [{"object": "embedding", "index": i, "embedding": stub_embedding(str(t))}
+                        for i, t in enumerate(inputs)]
+                body = {"object": "list", "model": request.get("model"), "data": data,
+                        "usage": {"prompt_tokens": 0, "total_tokens": 0}}
+                return self._send(200, json.dumps(body).encode())
+            if self.path == "/api/embed":
+                inputs = request.get("input", [])
+                inputs = [inputs] if isinstance(inputs, str) else inputs
+                body = {"model": request.get("model"), "embeddings": [stub_embedding(t) for t in inputs]}
+                return self._send(200, json.dumps(body).encode())
+            if self.path == "/api/embeddings":
+                body = {"embedding": stub_embedding(request.get("prompt", ""))}
+                return self._send(200, json.dumps(body).encode())
+            self._send(404, b'{"error": "not found"}')
+        finally:
+            stub._end()
+
+    def _chat(self, request: dict):
+        stub: StubOllama = self.server.stub
+        content = stub.reply_to(request.get("messages") or [{}])
+        created = datetime.now(timezone.utc).isoformat()
+        evaluated, prompt_s = stub.evaluate_prompt(request)
+        stub.generate(content)
+        final = {
+            "model": request.get("model"), "created_at": created, "done": True, "done_reason": "stop",
+            "message": {"role": "assistant", "content": ""},
+            "total_duration": 0, "load_duration": 0,
+            "prompt_eval_count": evaluated, "prompt_eval_duration": int(prompt_s * 1e9),
+            "eval_count": len(content) // 4,
+        }
+        if request.get("stream", True):
+            chunk = {"model": request.get("model"), "created_at": created, "done": False,
+                     "message": {"role": "assistant", "content": content}}
+            body = (json.dumps(chunk) + "\n" + json.dumps(final) + "\n").encode()
+            return self._send(200, body, "application/x-ndjson")
+        final["message"]["content"] = content
+        self._send(200, json.dumps(final).encode())
+
+    def _openai_chat(self, request: dict):
+        stub: StubOllama = self.server.stub
+        content = stub.reply_to(request.get("messages") or [{}])
+        evaluated, _ = stub.evaluate_prompt(request)
+        stub.generate(content)
+        completion_id, created = f"chatcmpl-{stub.requests}", int(time.time())
+        usage = {"prompt_tokens": evaluated, "completion_tokens": len(content) // 4,
+                 "total_tokens": evaluated + len(content) // 4}
+        if request.get("stream"):
+            chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                     "model": request.get("model"),
+                     "choices": [{"index": 0, "delta": {"role": "assistant", "content": content}, "finish_reason": "stop"}]}
+            body = f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode()
+            return self._send(200, body, "text/event-stream")
+        body = {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage,
+        }
+        self._send(200, json.dumps(body).encode())
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients abandon requests on purpose (hedging, cancellation); a broken pipe is not an error here
+        pass
+
+
+class StubOllama:
+    """
+    One stub replica. `latency_ms` is the normal response time; a `slow_fraction`
+    of requests take `slow_ms` instead (a slow tail). With `tokens_per_s`, chat
+    replies also take their length in tokens / tokens_per_s to "generate".
+    Setting `fail` makes every request (including health checks) return an error.
+    """
+    def __init__(self, port: int = 0, latency_ms: float = 50, slow_fraction: float = 0.0,
+                 slow_ms: float = 0.0, model: str = "stub", reply: Optional[str] = None, seed: int = 0,
+                 prompt_ms_per_token: float = 0.0, tokens_per_s: float = 0.0,
+                 responder: Optional[Callable[[List[dict]], str]] = None):
+        self.latency_ms = latency_ms
+        self.slow_fraction = slow_fraction
+        self.slow_ms = slow_ms
+        self.model = model
+        self.reply = reply
+        self.responder = responder
+        self.tokens_per_s = tokens_per_s
+        self.fail = False
+        self.prompt_ms_per_token = prompt_ms_per_token
+        self._prompt_cache = {}
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._server = _Server(("127.0.0.1", port), _Handler)
+        self._server.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def openai_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def name(self) -> str:
+        return f"stub:{self.port}"
+
+    def reply_to(self, messages: List[dict]) -> str:
+        if self.reply:
+            return self.reply
+        if self.responder:
+            return self.responder(messages)
+        return f"[{self.name}] {messages[-1].get('content', '')[:200]}"
+
+    def generate(self, content: str):
+        """Sleeps for the simulated generation of `content`."""
+        if self.tokens_per_s:
+            time.sleep(max(1, len(content) // 4) / self.tokens_per_s)
+
+    def sample_latency(self) -> float:
+        with self._lock:
+            slow = self._rng.random() < self.slow_fraction
+        return (self.slow_ms if slow else self.latency_ms) / 1000
+
+    def evaluate_prompt(self, request: dict):
+        """(tokens evaluated, seconds spent) for a chat request; sleeps for the simulated prompt eval."""
+        prompt = "".join(f"<|{m.get('role')}|>{m.get('content', '')}" for m in request.get("messages") or [])
+        tokens = max(1, len(prompt) // 4)
+        if not self.prompt_ms_per_token:
+            return tokens, 0.0
+        num_ctx = (request.get("options") or {}).get("num_ctx") or DEFAULT_NUM_CTX
+        with self._lock:
+            slots = self._prompt_cache.setdefault(request.get("model"), [])
+            prefixes = [len(os.path.commonprefix([cached, prompt])) for cached in slots]
+            best = max(range(len(slots)), key=prefixes.__getitem__) if slots else None
+            shared = prefixes[best] if best is not None else 0
+            if best is not None and shared * 2 >= len(slots[best]):
+                slots.pop(best)  # this request continues that slot's prompt
+            elif len(slots) >= PROMPT_CACHE_SLOTS:
+                slots.pop(0)  # a short match: keep the longer prompt, evict the least recently used slot
+            slots.append(prompt)
+        if tokens > num_ctx:
+            evaluated = num_ctx  # truncated: the kept tokens no longer line up with the cache
+        else:
+            evaluated = max(1, tokens - shared // 4)
+        seconds = evaluated * self.prompt_ms_per_token / 1000
+        time.sleep(seconds)
+        return evaluated, seconds
+
+    def _begin(self):
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+
+    def _end(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def start(self) -> "StubOllama":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops listening and drops open keep-alive connections, like a crashed replica."""
+        self._server.shutdown()
+        self._server.server_close()
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def start_stubs(count: int, base_port: int = 0, **kwargs) -> List[StubOllama]:
+    """Starts `count` stubs on consecutive ports from `base_port` (0 = any free ports)."""
+    return [StubOllama(port=base_port + i if base_port else 0, seed=i, **kwargs).start() for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=3)
+    parser.add_argument("--base-port", type=int, default=11501)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--slow-fraction", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--tokens-per-s", type=float, default=0.0, help="Generation speed (0 = instant)")
+    parser.add_argument("--canned", action="store_true", help="Answer every agent role with a valid canned reply")
+    args = parser.parse_args()
+
+    stubs = start_stubs(args.count, args.base_port, latency_ms=args.latency_ms,
+                        slow_fraction=args.slow_fraction, slow_ms=args.slow_ms, tokens_per_s=args.tokens_per_s,
+                        responder=canned_reply if args.canned else None)
+    print("OLLAMA_BASE_URLS=" + ",".join(s.url for s in stubs))
+    print(f"OPENAI_BASE_URL={stubs[0].openai_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for stub in stubs:
+            stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+Columnar chunk store for the policy vector index.
+
+Chunk text and metadata live in a DuckDB table keyed by the FAISS row ID,
+replacing the pickled LangChain docstore. Nothing is deserialized at startup;
+text is fetched lazily for the top-k hits of each search.
+
+A clause shared by several policies is stored once (near-duplicates are dropped
+at ingestion); `chunk_aliases` lists the other policies and sources that contain
+it, so policy filters and citations still cover every one of them.
+"""
+import json
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import duckdb
+import numpy as np
+import pandas as pd
+from langchain_core.documents import Document
+
+logger = logging.getLogger("compliance_rag.chunk_store")
+
+CHUNK_STORE_FILE = "chunks.duckdb"
+
+# Metadata promoted to real columns so they can be filtered without parsing JSON.
+# Everything else stays in the `metadata` JSON column.
+INDEXED_METADATA = ("source", "policy_id", "department", "status", "last_updated")
+
+
+class ChunkStore:
+    """
+    Chunk text and metadata stored column-wise in DuckDB, addressed by vector row ID.
+    """
+    def __init__(self, path: str, read_only: bool = True):
+        self.path = path
+        self.con = duckdb.connect(path, read_only=read_only)
+        if not read_only:
+            self._create_table()
+        # Stores built before duplicates were attributed have no alias table
+        self._has_aliases = self.con.execute(
+            "SELECT COUNT(*) FROM duckdb_tables() WHERE table_name = 'chunk_aliases'"
+        ).fetchone()[0] > 0
+
+    def _create_table(self):
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row_id BIGINT PRIMARY KEY,
+                source VARCHAR,
+                policy_id VARCHAR,
+                department VARCHAR,
+                status VARCHAR,
+                last_updated VARCHAR,
+                metadata VARCHAR,
+                text VARCHAR
+            )
+        """)
+        # Dropped near-duplicates by the SimHash signature of the chunk kept in their place,
+        # resolved to that chunk's row ID once the build is complete (`resolve_duplicates`)
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS duplicates (
+                simhash VARCHAR, policy_id VARCHAR, source VARCHAR, section_path VARCHAR
+            )
+        """)
+        self.con.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_aliases (
+                row_id BIGINT, policy_id VARCHAR, source VARCHAR, section_path VARCHAR
+            )
+        """)
+
+    def append(self, documents: List[Document], start_row: int):
+        """Bulk-inserts documents as rows `start_row .. start_row + len(documents) - 1`."""
+        frame = pd.DataFrame({
+            "row_id": np.arange(start_row, start_row + len(documents), dtype="int64"),
+            **{
+                column: [_as_text(d.metadata.get(column)) for d in documents]
+                for column in INDEXED_METADATA
+            },
+            "metadata": [
+                json.dumps({k: v for k, v in d.metadata.items() if k not in INDEXED_METADATA}, default=str)
+                for d in documents
+            ],
+            "text": [d.page_content for d in documents],
+        })
+        self.con.execute("INSERT INTO chunks SELECT * FROM frame")
+
+    def delete_from(self, row_id: int):
+        """Removes rows with IDs >= `row_id` (an interrupted ingestion window)."""
+        self.con.execute("DELETE FROM chunks WHERE row_id >= ?", [row_id])
+        self.con.execute("DELETE FROM chunk_aliases WHERE row_id >= ?", [row_id])
+
+    def add_duplicates(self, duplicates: List[Dict[str, Optional[str]]]):
+        """Records dropped near-duplicates ({"simhash" of the kept chunk, "policy_id", "source", "section_path"})."""
+        if not duplicates:
+            return
+        frame = pd.DataFrame(duplicates).reindex(columns=["simhash", "policy_id", "source", "section_path"])
+        self.con.execute("INSERT INTO duplicates SELECT * FROM frame")
+
+    def resolve_duplicates(self) -> int:
+        """
+        Attaches the recorded duplicates to the chunks kept in their place, skipping copies
+        from the kept chunk's own policy and source. Returns the number of aliases added.
+        """
+        before = self.con.execute("SELECT COUNT(*) FROM chunk_aliases").fetchone()[0]
+        self.con.execute("""
+            INSERT INTO chunk_aliases
+            SELECT DISTINCT c.row_id, d.policy_id, d.source, d.section_path
+            FROM duplicates d
+            JOIN chunks c ON json_extract_string(c.metadata, '$.simhash') = d.simhash
+            WHERE d.policy_id IS DISTINCT FROM c.policy_id OR d.source IS DISTINCT FROM c.source
+        """)
+        self.con.execute("DELETE FROM duplicates")
+        return self.con.execute("SELECT COUNT(*) FROM chunk_aliases").fetchone()[0] - before
+
+    def get(self, row_ids: Iterable[int]) -> List[Document]:
+        """Fetches the documents for `row_ids`, preserving the requested order."""
+        row_ids = [int(r) for r in row_ids]
+        if not row_ids:
+            return []
+        rows = self.con.cursor().execute(
+            f"""
+            SELECT row_id, text, metadata, {", ".join(INDEXED_METADATA)}
+            FROM chunks
+            WHERE row_id = ANY(?)
+            """,
+            [row_ids],
+        ).fetchall()
+
+        aliases: Dict[int, List[Dict[str, Optional[str]]]] = {}
+        if self._has_aliases:
+            for row_id, policy_id, source, section_path in self.con.cursor().execute(
+                "SELECT row_id, policy_id, source, section_path FROM chunk_aliases"
+                " WHERE row_id = ANY(?) ORDER BY source, section_path",
+                [row_ids],
+            ).fetchall():
+                aliases.setdefault(row_id, []).append(
+                    {"policy_id": policy_id, "source": source, "section_path": section_path}
+                )
+
+        by_id = {}
+        for row_id, text, metadata, *indexed in rows:
+            meta = json.loads(metadata) if metadata else {}
+            meta.update({k: v for k, v in zip(INDEXED_METADATA, indexed) if v is not None})
+            meta["row_id"] = row_id
+            if row_id in aliases:
+                meta["also_in"] = aliases[row_id]
+            by_id[row_id] = Document(page_content=text, metadata=meta)
+        return [by_id[r] for r in row_ids if r in by_id]
+
+    def rows_for_policies(self, policy_ids: List[str]) -> np.ndarray:
+        """Vector row IDs of every chunk tagged with, or also found in (`chunk_aliases`), one of `policy_ids`."""
+        if not policy_ids:
+            return np.empty(0, dtype="int64")
+        sql = "SELECT row_id FROM chunks WHERE policy_id IN (SELECT UNNEST($1))"
+        if self._has_aliases:
+            sql += " UNION SELECT row_id FROM chunk_aliases WHERE policy_id IN (SELECT UNNEST($1))"
+        rows = self.con.cursor().execute(f"{sql} ORDER BY row_id", [list(policy_ids)]).fetchnumpy()
+        return rows["row_id"].astype("int64")
+
+    def metadata_values(self, key: str) -> List[str]:
+        """Every non-null value of one JSON metadata key, e.g. the stored SimHash signatures."""
+        path = f"$.{key}"
+        rows = self.con.cursor().execute(
+            "SELECT json_extract_string(metadata, ?) FROM chunks WHERE json_extract_string(metadata, ?) IS NOT NULL",
+            [path, path],
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def count(self) -> int:
+        return self.con.cursor().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def close(self):
+        self.con.close()
+
+
+def _as_text(value) -> Optional[str]:
+    return None if value is None else str(value)
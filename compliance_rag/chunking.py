@@ -0,0 +1,212 @@
+"""
+Structure-aware chunking and near-duplicate elimination for ingestion.
+
+Policies are split on markdown section and clause boundaries instead of a
+fixed character window, and every chunk records its heading path. Chunks whose
+SimHash signature is within a small Hamming distance of an already indexed
+chunk (boilerplate repeated across policies) are dropped before embedding.
+"""
+import re
+import hashlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+# Numbered clauses ("1.", "3.2", "4.1.a)") and bullet items start a new clause
+CLAUSE_RE = re.compile(r"^\s*(?:\d+(?:\.\d+)*[.)]?|[a-z][.)]|[-*+])\s+")
+
+SIMHASH_BITS = 64
+SIMHASH_BANDS = 4
+
+
+class StructuredChunker:
+    """
+    Splits documents on section and clause boundaries.
+
+    Headings up to `split_level` always start a new chunk; deeper headings, numbered
+    clauses, bullets and paragraphs are packed greedily up to `max_chars`. A clause is
+    only cut when it alone exceeds `max_chars`. Sections shorter than `min_chars`
+    (title blocks, one-line preambles) are carried into the next chunk rather than
+    embedded on their own. No overlap is added between chunks.
+
+    A chunk's section_path lists every section it holds text from ("A > 1. Scope; 2. Roles"),
+    leaving out headings whose subsections are listed, so each clause can be cited correctly.
+    """
+    def __init__(self, max_chars: int = 1000, min_chars: int = 200, split_level: int = 2):
+        self.max_chars = max_chars
+        self.min_chars = min_chars
+        self.split_level = split_level
+        self._fallback = RecursiveCharacterTextSplitter(chunk_size=max_chars, chunk_overlap=0)
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        chunks = []
+        for doc in documents:
+            chunks.extend(self._split(doc))
+        return chunks
+
+    def _units(self, text: str) -> Iterable[Tuple[int, str, List[str], bool]]:
+        """Yields (offset, unit_text, heading_path, starts_section) clause units."""
+        path: List[Tuple[int, str]] = []
+        unit_lines: List[str] = []
+        unit_start = 0
+        starts_section = False
+        heading_only = False  # a heading stays attached to the clause that follows it
+        offset = 0
+
+        def flush():
+            body = "\n".join(unit_lines).strip()
+            return (unit_start, body, [title for _, title in path], starts_section) if body else None
+
+        for line in text.splitlines(keepends=True):
+            stripped = line.rstrip("\n")
+            heading = HEADING_RE.match(stripped)
+            is_break = heading or not stripped.strip() or CLAUSE_RE.match(stripped)
+            if is_break and unit_lines and not (heading_only and not heading):
+                unit = flush()
+                if unit:
+                    yield unit
+                unit_lines, starts_section = [], False
+
+            if heading:
+                level = len(heading.group(1))
+                path = [(lvl, title) for lvl, title in path if lvl < level] + [(level, heading.group(2))]
+                starts_section = level <= self.split_level
+            if stripped.strip():
+                if not unit_lines:
+                    unit_start = offset
+                unit_lines.append(stripped)
+                heading_only = bool(heading)
+            offset += len(line)
+
+        unit = flush()
+        if unit:
+            yield unit
+
+    def _split(self, doc: Document) -> List[Document]:
+        chunks: List[Document] = []
+        parts: List[str] = []
+        start: Optional[int] = None
+        paths: List[List[str]] = []
+
+        def emit():
+            if parts:
+                metadata = {**doc.metadata, "start_index": start, "section_path": section_label(paths)}
+                chunks.append(Document(page_content="\n".join(parts), metadata=metadata))
+
+        for offset, unit, path, starts_section in self._units(doc.page_content):
+            size = sum(len(p) + 1 for p in parts)
+            boundary = starts_section and size >= self.min_chars
+            if parts and (boundary or size + len(unit) > self.max_chars):
+                emit()
+                parts, start = [], None
+
+            pieces = [unit] if len(unit) <= self.max_chars else self._fallback.split_text(unit)
+            for piece in pieces:
+                if parts and sum(len(p) + 1 for p in parts) + len(piece) > self.max_chars:
+                    emit()
+                    parts, start = [], None
+                if start is None:
+                    start = offset
+                if not parts:
+                    paths = []
+                if path not in paths:
+                    paths.append(path)
+                parts.append(piece)
+        emit()
+        return chunks
+
+
+def section_label(paths: List[List[str]]) -> str:
+    """Heading paths of a chunk's text, minus those that only lead into a listed subsection."""
+    leaves = [p for p in paths if p and not any(len(o) > len(p) and o[:len(p)] == p for o in paths)]
+    if len(leaves) < 2:
+        return " > ".join(leaves[0]) if leaves else ""
+    # Shared headings are written once: "A > 1. Scope; 2. Roles"
+    shared = 0
+    while all(len(p) > shared + 1 and p[shared] == leaves[0][shared] for p in leaves):
+        shared += 1
+    tails = "; ".join(" > ".join(p[shared:]) for p in leaves)
+    return " > ".join(leaves[0][:shared] + [tails]) if shared else tails
+
+
+def simhash(text: str, shingle: int = 3) -> int:
+    """64-bit SimHash over word shingles; similar texts get signatures a few bits apart."""
+    words = re.findall(r"\w+", text.lower())
+    features = [" ".join(words[i:i + shingle]) for i in range(max(1, len(words) - shingle + 1))]
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "big")
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit, w in enumerate(weights) if w > 0)
+
+
+class NearDuplicateFilter:
+    """
+    Detects near-duplicate chunks by SimHash Hamming distance.
+
+    Signatures are split into SIMHASH_BANDS bands; two signatures within
+    `max_distance` <= SIMHASH_BANDS - 1 bits must agree on at least one band,
+    so only chunks sharing a band are compared.
+
+    A dropped chunk is remembered in `dropped` with the signature of the chunk
+    kept in its place, so the kept chunk can be attributed to its policy too
+    (`ChunkStore.add_duplicates`); `take_dropped()` drains the list.
+    """
+    def __init__(self, max_distance: int = 3):
+        if max_distance >= SIMHASH_BANDS:
+            raise ValueError(f"max_distance must be below {SIMHASH_BANDS} for banded lookup.")
+        self.max_distance = max_distance
+        self._band_bits = SIMHASH_BITS // SIMHASH_BANDS
+        self._buckets: List[Dict[int, List[int]]] = [defaultdict(list) for _ in range(SIMHASH_BANDS)]
+        self.dropped: List[Dict[str, Optional[str]]] = []
+
+    def _bands(self, signature: int) -> Iterable[Tuple[int, int]]:
+        mask = (1 << self._band_bits) - 1
+        for band in range(SIMHASH_BANDS):
+            yield band, signature >> (band * self._band_bits) & mask
+
+    def match(self, signature: int) -> Optional[int]:
+        """A known signature within `max_distance` bits of `signature`, if any."""
+        for band, value in self._bands(signature):
+            for other in self._buckets[band].get(value, ()):
+                if bin(signature ^ other).count("1") <= self.max_distance:
+                    return other
+        return None
+
+    def is_duplicate(self, signature: int) -> bool:
+        return self.match(signature) is not None
+
+    def add(self, signature: int):
+        for band, value in self._bands(signature):
+            self._buckets[band][value].append(signature)
+
+    def filter(self, chunks: List[Document]) -> List[Document]:
+        """Keeps the first occurrence of each near-duplicate group, tagging kept chunks with their signature."""
+        kept = []
+        for chunk in chunks:
+            signature = simhash(chunk.page_content)
+            original = self.match(signature)
+            if original is not None:
+                self.dropped.append({
+                    "simhash": str(original),
+                    "policy_id": _as_optional_text(chunk.metadata.get("policy_id")),
+                    "source": _as_optional_text(chunk.metadata.get("source")),
+                    "section_path": _as_optional_text(chunk.metadata.get("section_path")),
+                })
+                continue
+            self.add(signature)
+            chunk.metadata["simhash"] = str(signature)
+            kept.append(chunk)
+        return kept
+
+    def take_dropped(self) -> List[Dict[str, Optional[str]]]:
+        dropped, self.dropped = self.dropped, []
+        return dropped
+
+
+def _as_optional_text(value) -> Optional[str]:
+    return None if value is None else str(value)
@@ -1,6 +1,12 @@
 import os
+import threading
 from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain_openai import ChatOpenAI
+from compliance_rag.scheduler import LLMScheduler, parse_limits, parse_weights
+from compliance_rag.admission import SharedAdmission
+from compliance_rag.endpoint_pool import pooled
+from compliance_rag.tracing import TracedModel
+from compliance_rag.local_embeddings import LocalEmbeddings
 
 # Load environment variables
 from dotenv import load_dotenv
@@ -8,31 +14,138 @@ load_dotenv()
 
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://host.docker.internal:11434")
 
+# Ollama Replicas
+# A comma-separated OLLAMA_BASE_URLS spreads every local model over several Ollama servers
+# (least-outstanding-requests routing, health checks, failover; compliance_rag/endpoint_pool.py).
+OLLAMA_BASE_URLS = [u.strip() for u in os.getenv("OLLAMA_BASE_URLS", OLLAMA_BASE_URL).split(",") if u.strip()]
+# A replica is ejected for OLLAMA_EJECT_S after this many consecutive failures (or one connection error)
+OLLAMA_EJECT_AFTER = int(os.getenv("OLLAMA_EJECT_AFTER", "3"))
+OLLAMA_EJECT_S = float(os.getenv("OLLAMA_EJECT_S", "30"))
+# Seconds between health checks that re-admit (or eject) replicas; 0 disables them
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", "10"))
+# Hedged requests: a call slower than this percentile of recent calls is duplicated on a second
+# replica and the first answer wins (0 disables; needs OLLAMA_HEDGE_MIN_SAMPLES calls of history).
+# Hedging makes LLM_CONCURRENCY a soft limit: duplicates and losing requests run beyond it.
+OLLAMA_HEDGE_PERCENTILE = float(os.getenv("OLLAMA_HEDGE_PERCENTILE", "0"))
+OLLAMA_HEDGE_MIN_SAMPLES = int(os.getenv("OLLAMA_HEDGE_MIN_SAMPLES", "20"))
+
+
+def ollama_endpoints(model_class, **kwargs):
+    """`model_class(**kwargs)` on every replica in OLLAMA_BASE_URLS (a plain client if there is only one)."""
+    return pooled(
+        lambda url: model_class(base_url=url, **kwargs),
+        OLLAMA_BASE_URLS,
+        eject_after=OLLAMA_EJECT_AFTER,
+        eject_s=OLLAMA_EJECT_S,
+        health_interval=OLLAMA_HEALTH_INTERVAL,
+        hedge_percentile=OLLAMA_HEDGE_PERCENTILE,
+        hedge_min_samples=OLLAMA_HEDGE_MIN_SAMPLES,
+    )
+
+
+# Model Residency
+# keep_alive: how long Ollama keeps a model loaded after its last call ("30m", "2h", seconds, -1 = forever),
+# so models aren't unloaded and reloaded between bursts of requests.
+# num_ctx: context window in tokens. A prompt longer than the window is truncated from the front,
+# which also discards the cached SOP prefix, so it should fit SOP + retrieved context + question.
+# Each role can override both with <ROLE>_KEEP_ALIVE / <ROLE>_NUM_CTX (e.g. SYNTHESIZER_NUM_CTX).
+# Roles sharing a model (synthesizer and sql_analyst use qwen2.5) should share num_ctx: Ollama
+# reloads a model whenever its context size changes.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "8192"))
+
+
+def parse_keep_alive(value: str) -> int:
+    """'30m' / '2h' / '45s' / '300' / '-1' -> seconds (-1 keeps the model loaded indefinitely)."""
+    value = str(value).strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1:] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(float(value))
+
+
+def role_options(role: str, num_ctx=OLLAMA_NUM_CTX) -> dict:
+    """keep_alive and num_ctx for an Ollama-served role, honouring per-role overrides."""
+    prefix = role.upper()
+    options = {"keep_alive": parse_keep_alive(os.getenv(f"{prefix}_KEEP_ALIVE", OLLAMA_KEEP_ALIVE))}
+    num_ctx = os.getenv(f"{prefix}_NUM_CTX", num_ctx)
+    if num_ctx:
+        options["num_ctx"] = int(num_ctx)
+    return options
+
+
+# Embedding Backend
+# "ollama" embeds over HTTP with nomic-embed-text; "local" runs a sentence-transformers model
+# in-process on CPU (compliance_rag/local_embeddings.py). Indexes record the embeddings they
+# were built with, so switching backend or model means re-running ingestion.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "ollama").lower()
+EMBEDDING_LOCAL_MODEL = os.getenv("EMBEDDING_LOCAL_MODEL", "BAAI/bge-small-en-v1.5")
+# "torch", or "onnx" / "openvino"; EMBEDDING_MODEL_FILE selects an exported (e.g. quantized) file,
+# such as "onnx/model_qint8_avx512_vnni.onnx"
+EMBEDDING_RUNTIME = os.getenv("EMBEDDING_RUNTIME", "torch").lower()
+EMBEDDING_MODEL_FILE = os.getenv("EMBEDDING_MODEL_FILE") or None
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+# CPU threads for the local model (0 = runtime default, usually all cores)
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", "0"))
+# Concurrent query embeddings arriving within this window are encoded as one batch.
+# At most the scheduler's limit for the "local" backend run at once (LLM_CONCURRENCY="local=16").
+EMBEDDING_BATCH_WAIT_MS = float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "2"))
+# Instruction prefixes some models expect (bge: "Represent this sentence for searching relevant passages: ")
+EMBEDDING_QUERY_PREFIX = os.getenv("EMBEDDING_QUERY_PREFIX", "")
+EMBEDDING_DOCUMENT_PREFIX = os.getenv("EMBEDDING_DOCUMENT_PREFIX", "")
+
+
+def embedding_backend():
+    """The embedding model selected by EMBEDDING_BACKEND."""
+    if EMBEDDING_BACKEND == "local":
+        return LocalEmbeddings(
+            EMBEDDING_LOCAL_MODEL,
+            runtime=EMBEDDING_RUNTIME,
+            model_file=EMBEDDING_MODEL_FILE,
+            batch_size=EMBEDDING_BATCH_SIZE,
+            threads=EMBEDDING_THREADS,
+            batch_wait_ms=EMBEDDING_BATCH_WAIT_MS,
+            query_prefix=EMBEDDING_QUERY_PREFIX,
+            document_prefix=EMBEDDING_DOCUMENT_PREFIX,
+        )
+    if EMBEDDING_BACKEND != "ollama":
+        raise ValueError(f"Unknown EMBEDDING_BACKEND '{EMBEDDING_BACKEND}'. Use ollama or local.")
+    return ollama_endpoints(
+        OllamaEmbeddings,
+        model="nomic-embed-text",
+        # The embedding model keeps its own context size unless EMBEDDING_MODEL_NUM_CTX is set
+        **role_options("embedding_model", num_ctx=None)
+    )
+
+
 # Centralized LLM Foundry
 # Based on the tutorial's `llm_config`
 # Maps agent roles to specific specialized models for optimal performance
 
 llm_config = {
     # Planner: Needs strong instruction following to break down complex compliance queries
-    "planner": ChatOllama(
+    "planner": ollama_endpoints(
+        ChatOllama,
         model="llama3.1", 
-        base_url=OLLAMA_BASE_URL,
         temperature=0.0, 
-        format="json"
+        format="json",
+        **role_options("planner")
     ),
 
     # Synthesizer: Needs to write clear, professional, and well-cited answers
-    "synthesizer": ChatOllama(
+    "synthesizer": ollama_endpoints(
+        ChatOllama,
         model="qwen2.5", 
-        base_url=OLLAMA_BASE_URL,
-        temperature=0.2
+        temperature=0.2,
+        **role_options("synthesizer")
     ),
 
     # SQL Analyst: Needs to generate valid SQL for structured metadata queries
-    "sql_analyst": ChatOllama(
+    "sql_analyst": ollama_endpoints(
+        ChatOllama,
         model="qwen2.5", 
-        base_url=OLLAMA_BASE_URL,
-        temperature=0.0
+        temperature=0.0,
+        **role_options("sql_analyst")
     ),
 
     # Director: Switched to gpt-4o-mini (OpenAI) for superior reasoning
@@ -42,14 +155,214 @@ llm_config = {
         temperature=0.0
     ),
 
-    # Embeddings: High-performance vector embeddings for retrieval
-    "embedding_model": OllamaEmbeddings(
-        model="nomic-embed-text",
-        base_url=OLLAMA_BASE_URL
-    )
+    # Embeddings: High-performance vector embeddings for retrieval (Ollama or in-process, see above)
+    "embedding_model": embedding_backend()
 }
 
-# Knowledge Store Paths
+# Data directory shared by every process: knowledge stores, gene pool, jobs and LLM admission
 DATA_DIR = os.getenv("DATA_DIR", "./data")
+
+# LLM Scheduler
+# Every LLM and embedding call goes through one scheduler per process (compliance_rag/scheduler.py).
+# LLM_CONCURRENCY caps concurrent calls per backend ("ollama=2") or per model ("ollama/qwen2.5=1"),
+# per replica when OLLAMA_BASE_URLS lists several;
+# model entries override their backend's, anything unlisted gets LLM_DEFAULT_CONCURRENCY.
+# The caps hold across processes (every API worker and its job runner, ingestion, the evolution CLI):
+# schedulers take slots from a shared SQLite pool at LLM_ADMISSION_DB, and a free slot goes to the
+# highest-priority call queued in any of them (compliance_rag/admission.py). Set LLM_ADMISSION_DB
+# empty to count the caps per process instead (each of the WEB_CONCURRENCY workers gets the full cap).
+# The SOP's llm_timeout_s is the Ollama client's request timeout, so it runs from admission
+# (queue wait excluded) and a timed-out request is closed, freeing its slot; with
+# OLLAMA_HEDGE_PERCENTILE set the limit is soft (see compliance_rag/endpoint_pool.py).
+LLM_CONCURRENCY = parse_limits(os.getenv("LLM_CONCURRENCY", "ollama=2,openai=16"))
+LLM_DEFAULT_CONCURRENCY = int(os.getenv("LLM_DEFAULT_CONCURRENCY", "4"))
+# Share of freed slots each priority class gets while several classes are queued
+LLM_PRIORITY_WEIGHTS = parse_weights(os.getenv("LLM_PRIORITY_WEIGHTS", "interactive=8,batch=2,evolution=1"))
+
+# Shared admission pool (empty: caps per process)
+LLM_ADMISSION_DB = os.getenv("LLM_ADMISSION_DB", os.path.join(DATA_DIR, "llm_admission.db"))
+# How often a process with queued calls retries for a slot freed by another process
+LLM_ADMISSION_POLL_MS = int(os.getenv("LLM_ADMISSION_POLL_MS", "20"))
+# Slots held longer than this are reclaimed (a process on another host died holding them); keep it
+# above the largest SOP llm_timeout_s (600). Slots of exited processes on this host are reclaimed at once.
+LLM_ADMISSION_LEASE_S = float(os.getenv("LLM_ADMISSION_LEASE_S", "900"))
+
+shared_admission = SharedAdmission(
+    LLM_ADMISSION_DB, poll_s=LLM_ADMISSION_POLL_MS / 1000, lease_s=LLM_ADMISSION_LEASE_S
+) if LLM_ADMISSION_DB else None
+llm_scheduler = LLMScheduler(LLM_CONCURRENCY, LLM_DEFAULT_CONCURRENCY, LLM_PRIORITY_WEIGHTS, shared=shared_admission)
+# Calls are also timed per role (queueing included) for /metrics and query timings (compliance_rag/tracing.py)
+llm_config = {role: TracedModel(role, llm_scheduler.wrap(model)) for role, model in llm_config.items()}
+
+# Model Selection
+# An SOP may move the planner, synthesizer or SQL analyst to another local model (planner_model, ...).
+# Allowed are the models configured above plus any listed in OLLAMA_MODELS (e.g. "llama3.2:3b,phi3").
+LOCAL_ROLES = ("planner", "synthesizer", "sql_analyst")
+LOCAL_MODELS = list(dict.fromkeys(
+    [llm_config[role].model for role in LOCAL_ROLES]
+    + [m.strip() for m in os.getenv("OLLAMA_MODELS", "").split(",") if m.strip()]
+))
+
+_role_variants = {}
+_role_variants_lock = threading.Lock()
+
+
+def role_llm(role: str, model: str = None, timeout_s: float = None):
+    """
+    The client for `role`, or the same role (temperature, format, keep_alive, num_ctx)
+    served by another local `model` and/or with an HTTP request timeout of `timeout_s`
+    (the SOP's llm_timeout_s). Variants are built on first use and reused; they share
+    the scheduler lane of their model.
+    """
+    default = llm_config[role]
+    model = model or default.model
+    if model == default.model and not timeout_s:
+        return default
+    key = (role, model, timeout_s)
+    with _role_variants_lock:
+        if key not in _role_variants:
+            settings = {name: getattr(default, name) for name in ("temperature", "format", "keep_alive", "num_ctx")}
+            if timeout_s:
+                settings["client_kwargs"] = {"timeout": timeout_s}
+            variant = ollama_endpoints(ChatOllama, model=model, **settings)
+            _role_variants[key] = TracedModel(role, llm_scheduler.wrap(variant))
+        return _role_variants[key]
+
+# Knowledge Store Paths
 VECTOR_STORE_PATH = os.path.join(DATA_DIR, "vector_store")
 METADATA_DB_PATH = os.path.join(DATA_DIR, "policy_metadata.db")
+
+# Ingestion Settings
+# Number of processes used to parse documents (PDF parsing is CPU-bound)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+# Files per streaming window; each window is loaded, split, embedded, written to its own
+# vector shard and checkpointed. The shards are merged into the FAISS index once, at the end
+INGEST_WINDOW_FILES = int(os.getenv("INGEST_WINDOW_FILES", "64"))
+# DuckDB locks the metadata database per process: a writer needs every reader (API workers) to be
+# out of the file. Ingestion writes front-matter once, at the end, retrying this long for the lock.
+METADATA_LOCK_TIMEOUT_S = float(os.getenv("METADATA_LOCK_TIMEOUT_S", "60"))
+
+# Chunking Settings
+# "structured" splits on section/clause boundaries and records the heading path;
+# "recursive" is the original fixed-size splitter (1000 chars, 200 overlap)
+CHUNKER = os.getenv("CHUNKER", "structured")
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "1000"))
+# Chunks within this SimHash Hamming distance of an indexed chunk are dropped (-1 disables)
+DEDUP_MAX_HAMMING = int(os.getenv("DEDUP_MAX_HAMMING", "3"))
+# Also run the recursive splitter over every window to report how many chunks the structured
+# chunker saved; this doubles the splitting work, so it is off for routine ingestion
+CHUNK_COMPARE_RECURSIVE = os.getenv("CHUNK_COMPARE_RECURSIVE", "false").lower() == "true"
+
+# Vector Index Settings
+# FAISS_INDEX_TYPE selects the index built at ingestion:
+#   "flat"     - exact search (default, best for small corpora)
+#   "ivf_flat" - inverted file over full vectors
+#   "ivf_pq"   - inverted file over product-quantized codes (smallest footprint)
+#   "hnsw"     - graph-based search (no training step)
+FAISS_INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+FAISS_NLIST = int(os.getenv("FAISS_NLIST", "0"))  # 0 = derive from corpus size
+FAISS_PQ_M = int(os.getenv("FAISS_PQ_M", "16"))
+FAISS_HNSW_M = int(os.getenv("FAISS_HNSW_M", "32"))
+FAISS_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "50000"))
+
+# Query-time knobs (applied when the index is loaded)
+FAISS_NPROBE = int(os.getenv("FAISS_NPROBE", "16"))
+FAISS_EF_SEARCH = int(os.getenv("FAISS_EF_SEARCH", "64"))
+
+# Memory-map the index read-only so worker processes share the same pages
+FAISS_MMAP = os.getenv("FAISS_MMAP", "true").lower() == "true"
+
+# Reranking (compliance_rag/rerank.py; switched on per SOP with rerank_enabled)
+# A small CPU cross-encoder re-scores the over-fetched FAISS candidates before the synthesizer sees them
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+# (query, chunk) scores kept in memory per process
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "20000"))
+# Torch CPU threads for the cross-encoder (0 = torch default)
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "0"))
+
+# Gene Pool Settings
+# Evolved SOPs are stored as diffs against their parent; every N-th generation
+# in a lineage is stored in full so reconstruction never replays long chains
+SOP_SNAPSHOT_INTERVAL = int(os.getenv("SOP_SNAPSHOT_INTERVAL", "32"))
+# Reconstructed SOP versions kept in memory (least recently used are evicted)
+SOP_CACHE_SIZE = int(os.getenv("SOP_CACHE_SIZE", "128"))
+# Seconds an API worker may serve a stale "latest" SOP before noticing versions
+# added by other workers (via the gene pool's generation counter)
+SOP_POLL_INTERVAL = float(os.getenv("SOP_POLL_INTERVAL", "2"))
+
+# Background Jobs (/evolve and evaluation jobs)
+# Concurrent jobs per API worker process; jobs are stored in DATA_DIR/jobs.db
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Seconds an idle job worker waits before checking the queue again
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+# A job whose worker died this many times is marked failed instead of re-queued
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# Performance Budget
+# Each evaluated run's end-to-end latency, tokens and estimated cost are scored against these
+# budgets (compliance_rag/evaluation/performance.py): 1.0 within budget, falling to 0.0 at twice
+# the budget. The worst dimension is the run's performance_score; 0 disables a dimension.
+# Latency excludes time spent waiting for an LLM scheduler slot, which depends on concurrent load.
+PERF_LATENCY_BUDGET_S = float(os.getenv("PERF_LATENCY_BUDGET_S", "30"))
+PERF_TOKEN_BUDGET = int(os.getenv("PERF_TOKEN_BUDGET", "8000"))
+PERF_COST_BUDGET_USD = float(os.getenv("PERF_COST_BUDGET_USD", "0.01"))
+# Runs scoring below this are treated as failures by the evolution loop and /evolve
+PERF_SCORE_THRESHOLD = float(os.getenv("PERF_SCORE_THRESHOLD", "0.75"))
+
+
+def parse_prices(spec: str) -> dict:
+    """'gpt-4o-mini=0.15/0.60' -> {model: (input, output)} in USD per million tokens."""
+    prices = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, value = item.partition("=")
+        prompt, _, completion = value.partition("/")
+        try:
+            prices[model.strip().lower()] = (float(prompt), float(completion or prompt))
+        except ValueError:
+            raise ValueError(f"Invalid LLM price '{item}' (expected model=input/output per 1M tokens)")
+    return prices
+
+
+# Models not listed (the local Ollama models) cost nothing
+LLM_PRICES = parse_prices(os.getenv("LLM_PRICES", "gpt-4o-mini=0.15/0.60"))
+
+# Golden-Set Evaluation (compliance_rag/evaluation/runner.py)
+# Questions with the policy IDs a good answer must draw on, one JSON object per line
+GOLDEN_SET_PATH = os.getenv("GOLDEN_SET_PATH", os.path.join(DATA_DIR, "golden_set.jsonl"))
+# Questions run (graph + judge) at the same time; LLM calls are still capped by the scheduler
+EVAL_CONCURRENCY = int(os.getenv("EVAL_CONCURRENCY", "4"))
+# Results cached per (SOP version, question); versions never change, so entries stay valid
+EVAL_CACHE_PATH = os.path.join(DATA_DIR, "eval_cache.db")
+# A generation passes when every judge dimension averages at least this (1-5), the expected
+# policies were found in at least EVAL_MIN_POLICY_RECALL of cases on average, and the mean
+# performance score reaches PERF_SCORE_THRESHOLD
+EVAL_QUALITY_THRESHOLD = float(os.getenv("EVAL_QUALITY_THRESHOLD", "3.75"))
+EVAL_MIN_POLICY_RECALL = float(os.getenv("EVAL_MIN_POLICY_RECALL", "0.8"))
+
+# Logging (compliance_rag/utils/logger.py)
+# "text" (human-readable lines) or "json" (one object per line, with request_id)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# Callers only enqueue records; a background thread formats and writes them
+LOG_ASYNC = os.getenv("LOG_ASYNC", "true").lower() == "true"
+# Records beyond this many waiting are dropped (and counted) rather than blocking a request
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Large payloads logged via payload() (answers, findings, questions) are cut to this many chars (0 = no limit)
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+# Share of requests whose payloads are logged at all; the choice is per request ID, so a request is all-or-nothing
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+# Conflict Index (compliance_rag/conflicts.py)
+# Clauses of different policies that contradict each other, found at ingestion time and looked up
+# for the retrieved chunks when the SOP has conflict_check_enabled. Kept across ingestions:
+# only pairs involving new or changed chunks are sent to the LLM.
+CONFLICT_INDEX_PATH = os.path.join(DATA_DIR, "conflict_index.duckdb")
+# Also update the index at the end of every ingestion run. Off by default: an update makes up to
+# CONFLICT_MAX_CHECKS Director calls, so run it as its own step (python -m compliance_rag.conflicts)
+CONFLICT_INDEX_ENABLED = os.getenv("CONFLICT_INDEX_ENABLED", "false").lower() == "true"
+# Candidate pairs: each chunk's nearest neighbours from other policies with at least this cosine similarity
+CONFLICT_NEIGHBOURS = int(os.getenv("CONFLICT_NEIGHBOURS", "5"))
+CONFLICT_MIN_SIMILARITY = float(os.getenv("CONFLICT_MIN_SIMILARITY", "0.75"))
+# LLM checks run concurrently (the Director, batch priority); at most CONFLICT_MAX_CHECKS per run (0 = all)
+CONFLICT_CHECK_WORKERS = int(os.getenv("CONFLICT_CHECK_WORKERS", "4"))
+CONFLICT_MAX_CHECKS = int(os.getenv("CONFLICT_MAX_CHECKS", "2000"))
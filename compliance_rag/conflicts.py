@@ -0,0 +1,386 @@
+"""
+Cross-policy conflict index, built after ingestion.
+
+Comparing every retrieved clause with every other clause at query time would
+take a quadratic number of LLM calls per request. Instead, after ingestion:
+
+1. Candidate pairs come from the vector index itself: each chunk's
+   CONFLICT_NEIGHBOURS nearest neighbours that belong to a different policy
+   and reach CONFLICT_MIN_SIMILARITY (cosine). Clauses about the same subject
+   in different policies are the ones that can contradict each other.
+2. Only candidates get an LLM check (the Director, at batch priority).
+3. Verdicts are stored in a DuckDB file (CONFLICT_INDEX_PATH) keyed by chunk
+   ID, a hash of the chunk's source, position (page and start offset) and text.
+   IDs survive re-ingestion, so the next run only checks pairs involving new or
+   changed chunks, and it drops verdicts for chunks that no longer exist.
+
+The update makes up to CONFLICT_MAX_CHECKS Director calls, so it is a separate
+step by default (below); CONFLICT_INDEX_ENABLED runs it at the end of ingestion.
+
+At query time, with the SOP's conflict_check_enabled, the researcher looks up
+the retrieved chunks' confirmed conflicts (one indexed query) and adds them to
+the synthesizer context.
+
+The index is updated in a staging copy and swapped into place, so API workers
+reading it are never blocked by an update.
+
+Usage:
+    python -m compliance_rag.conflicts              # update after re-ingesting
+    python -m compliance_rag.conflicts --rebuild    # re-check every candidate pair
+"""
+import os
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import duckdb
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+from compliance_rag.config import (
+    llm_config,
+    VECTOR_STORE_PATH,
+    CONFLICT_INDEX_PATH,
+    CONFLICT_NEIGHBOURS,
+    CONFLICT_MIN_SIMILARITY,
+    CONFLICT_CHECK_WORKERS,
+    CONFLICT_MAX_CHECKS,
+)
+from compliance_rag.chunk_store import ChunkStore, CHUNK_STORE_FILE
+from compliance_rag.vector_index import read_index, INDEX_FILE
+from compliance_rag.tracing import span
+from compliance_rag.utils.json_parser import parse_llm_json
+
+logger = logging.getLogger("compliance_rag.conflicts")
+
+# Rows reconstructed and searched at a time while finding candidates
+CANDIDATE_BLOCK = 4096
+# Characters of the other clause shown to the synthesizer
+CONFLICT_EXCERPT_CHARS = 400
+
+CONFLICT_PROMPT = """
+You are a Corporate Compliance Analyst. Two clauses come from different company policies.
+Decide whether they CONFLICT: following one would violate the other, or they set incompatible
+requirements (different limits, approvals, retention periods, permissions) for the same situation.
+Clauses that cover different situations, or where one is merely stricter but both can be met, do not conflict.
+
+Clause A (from {source_a}{section_a}):
+{text_a}
+
+Clause B (from {source_b}{section_b}):
+{text_b}
+
+Respond ONLY with a JSON object: {{"conflict": true or false, "explanation": "<one sentence>"}}
+"""
+
+Pair = Tuple[str, str]
+
+
+def chunk_id(doc: Document) -> str:
+    """
+    Stable ID of a chunk: the same text at the same place in a source gets the same ID in
+    every ingestion, while identical chunks at different places (kept when deduplication is
+    off) get different ones. Without a start offset, the vector row ID tells chunks apart.
+    """
+    meta = doc.metadata
+    position = meta.get("start_index")
+    if position is None:
+        position = f"row {meta.get('row_id')}"
+    key = f"{meta.get('source', '')}\x00{meta.get('page', '')}\x00{position}\x00{doc.page_content}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def _policy_key(doc: Document) -> str:
+    return str(doc.metadata.get("policy_id") or doc.metadata.get("source") or "")
+
+
+class ConflictIndex:
+    """Checked chunk pairs and their verdicts, in DuckDB (see module docstring)."""
+    def __init__(self, path: str = CONFLICT_INDEX_PATH, read_only: bool = False):
+        self.path = path
+        self.con = duckdb.connect(path, read_only=read_only)
+        if not read_only:
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS clauses (
+                    chunk_id VARCHAR PRIMARY KEY,
+                    source VARCHAR,
+                    policy_id VARCHAR,
+                    section_path VARCHAR,
+                    text VARCHAR
+                )
+            """)
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS pair_checks (
+                    chunk_a VARCHAR NOT NULL,
+                    chunk_b VARCHAR NOT NULL,
+                    similarity DOUBLE,
+                    conflict BOOLEAN NOT NULL,
+                    explanation VARCHAR,
+                    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (chunk_a, chunk_b)
+                )
+            """)
+
+    def known_pairs(self) -> Set[Pair]:
+        return set(self.con.execute("SELECT chunk_a, chunk_b FROM pair_checks").fetchall())
+
+    def prune(self, current_ids: Iterable[str]) -> int:
+        """Drops verdicts and clauses of chunks that are no longer indexed. Returns verdicts dropped."""
+        self.con.execute("CREATE OR REPLACE TEMP TABLE current_ids AS SELECT UNNEST(?) AS chunk_id",
+                         [list(current_ids)])
+        removed = self.con.execute("""
+            SELECT COUNT(*) FROM pair_checks
+            WHERE chunk_a NOT IN (SELECT chunk_id FROM current_ids) OR chunk_b NOT IN (SELECT chunk_id FROM current_ids)
+        """).fetchone()[0]
+        self.con.execute("""
+            DELETE FROM pair_checks
+            WHERE chunk_a NOT IN (SELECT chunk_id FROM current_ids) OR chunk_b NOT IN (SELECT chunk_id FROM current_ids)
+        """)
+        self.con.execute("DELETE FROM clauses WHERE chunk_id NOT IN (SELECT chunk_id FROM current_ids)")
+        self.con.execute("DROP TABLE current_ids")
+        return removed
+
+    def record(self, a: Document, b: Document, similarity: float, conflict: bool, explanation: str):
+        for doc in (a, b):
+            self.con.execute(
+                "INSERT OR REPLACE INTO clauses VALUES (?, ?, ?, ?, ?)",
+                [chunk_id(doc), doc.metadata.get("source"), doc.metadata.get("policy_id"),
+                 doc.metadata.get("section_path"), doc.page_content],
+            )
+        self.con.execute(
+            "INSERT OR REPLACE INTO pair_checks (chunk_a, chunk_b, similarity, conflict, explanation)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [chunk_id(a), chunk_id(b), similarity, conflict, explanation],
+        )
+
+    def conflicts_for(self, chunk_ids: List[str]) -> List[Dict]:
+        """Confirmed conflicts of `chunk_ids`, with the other clause of each pair."""
+        if not chunk_ids:
+            return []
+        rows = self.con.execute("""
+            WITH hits AS (
+                SELECT chunk_a AS chunk_id, chunk_b AS other_id, explanation FROM pair_checks
+                WHERE conflict AND chunk_a IN (SELECT UNNEST(?))
+                UNION ALL
+                SELECT chunk_b, chunk_a, explanation FROM pair_checks
+                WHERE conflict AND chunk_b IN (SELECT UNNEST(?))
+            )
+            SELECT hits.chunk_id, hits.explanation, c.source, c.policy_id, c.section_path, c.text
+            FROM hits JOIN clauses c ON c.chunk_id = hits.other_id
+            ORDER BY hits.chunk_id
+        """, [chunk_ids, chunk_ids]).fetchall()
+        keys = ("chunk_id", "explanation", "other_source", "other_policy_id", "other_section", "other_text")
+        return [dict(zip(keys, row)) for row in rows]
+
+    def close(self):
+        self.con.close()
+
+
+# ── Building ─────────────────────────────────────────────────
+
+def _reconstructable(index: faiss.Index) -> faiss.Index:
+    """IVF indexes need a direct map before vectors can be reconstructed by row ID."""
+    try:
+        faiss.extract_index_ivf(index).make_direct_map()
+    except RuntimeError:
+        pass  # not an IVF index
+    return index
+
+
+def candidate_pairs(
+    index: faiss.Index,
+    chunks: ChunkStore,
+    neighbours: int = CONFLICT_NEIGHBOURS,
+    min_similarity: float = CONFLICT_MIN_SIMILARITY,
+) -> Tuple[Dict[str, Document], Dict[Pair, float]]:
+    """
+    (every indexed chunk by ID, candidate pairs -> cosine similarity). A pair is two
+    chunks of different policies where one is among the other's nearest neighbours.
+    """
+    index = _reconstructable(index)
+    total = index.ntotal
+    norms = np.empty(total, dtype="float32")
+    for start in range(0, total, CANDIDATE_BLOCK):
+        block = index.reconstruct_n(start, min(CANDIDATE_BLOCK, total - start))
+        norms[start:start + len(block)] = np.linalg.norm(block, axis=1)
+
+    docs: Dict[str, Document] = {}
+    pairs: Dict[Pair, float] = {}
+    for start in range(0, total, CANDIDATE_BLOCK):
+        vectors = index.reconstruct_n(start, min(CANDIDATE_BLOCK, total - start))
+        distances, ids = index.search(vectors, neighbours + 1)
+        rows = set(range(start, start + len(vectors))) | {int(i) for i in ids.ravel() if i >= 0}
+        by_row = {d.metadata["row_id"]: d for d in chunks.get(sorted(rows))}
+        for offset in range(len(vectors)):
+            row = start + offset
+            doc = by_row.get(row)
+            if doc is None:
+                continue
+            docs[chunk_id(doc)] = doc
+            for distance, other in zip(distances[offset], ids[offset]):
+                other = int(other)
+                if other < 0 or other == row or other not in by_row:
+                    continue
+                other_doc = by_row[other]
+                if _policy_key(other_doc) == _policy_key(doc):
+                    continue
+                # Squared L2 distance -> cosine similarity, using the stored vectors' norms
+                denominator = 2 * norms[row] * norms[other]
+                if not denominator:
+                    continue
+                similarity = float((norms[row] ** 2 + norms[other] ** 2 - distance) / denominator)
+                if similarity < min_similarity:
+                    continue
+                pair = tuple(sorted((chunk_id(doc), chunk_id(other_doc))))
+                pairs[pair] = max(pairs.get(pair, -1.0), min(similarity, 1.0))
+    return docs, pairs
+
+
+def check_pair(llm, a: Document, b: Document) -> Tuple[bool, str]:
+    """Asks the LLM whether two clauses conflict. Raises if it gives no usable verdict."""
+    def section(doc: Document) -> str:
+        return f", section {doc.metadata['section_path']}" if doc.metadata.get("section_path") else ""
+
+    prompt = CONFLICT_PROMPT.format(
+        source_a=a.metadata.get("source", "unknown"), section_a=section(a), text_a=a.page_content,
+        source_b=b.metadata.get("source", "unknown"), section_b=section(b), text_b=b.page_content,
+    )
+    verdict = parse_llm_json(llm.invoke([HumanMessage(content=prompt)]).content)
+    if not isinstance(verdict.get("conflict"), bool):
+        raise ValueError(f"No conflict verdict in LLM output: {verdict}")
+    return verdict["conflict"], str(verdict.get("explanation", ""))
+
+
+def update_conflict_index(
+    store_path: str = VECTOR_STORE_PATH,
+    index_path: str = CONFLICT_INDEX_PATH,
+    neighbours: int = CONFLICT_NEIGHBOURS,
+    min_similarity: float = CONFLICT_MIN_SIMILARITY,
+    workers: int = CONFLICT_CHECK_WORKERS,
+    max_checks: int = CONFLICT_MAX_CHECKS,
+    rebuild: bool = False,
+    llm=None,
+) -> Dict:
+    """
+    Brings the conflict index in line with the vector store at `store_path`
+    (see module docstring) and returns counts of what was done.
+    Pairs whose LLM check fails are left unchecked and retried on the next update.
+    """
+    llm = llm or llm_config["director"]
+    started = time.perf_counter()
+
+    index = read_index(os.path.join(store_path, INDEX_FILE), mmap=False)
+    chunks = ChunkStore(os.path.join(store_path, CHUNK_STORE_FILE), read_only=True)
+    try:
+        docs, pairs = candidate_pairs(index, chunks, neighbours, min_similarity)
+    finally:
+        chunks.close()
+
+    staging_path = f"{index_path}.staging"
+    if os.path.exists(staging_path):
+        os.remove(staging_path)
+    if os.path.exists(index_path) and not rebuild:
+        shutil.copyfile(index_path, staging_path)
+
+    conflict_index = ConflictIndex(staging_path)
+    stats = {"chunks": len(docs), "all_pairs": len(docs) * (len(docs) - 1) // 2, "candidates": len(pairs)}
+    try:
+        stats["pruned"] = conflict_index.prune(docs.keys())
+        known = conflict_index.known_pairs()
+        todo = sorted((p for p in pairs if p not in known), key=lambda p: -pairs[p])
+        stats["already_checked"] = len(pairs) - len(todo)
+        if max_checks and len(todo) > max_checks:
+            logger.warning("%d pairs to check; checking the %d most similar this run.", len(todo), max_checks)
+            todo = todo[:max_checks]
+
+        stats.update(checked=0, conflicts=0, failed=0)
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="conflict-check") as pool:
+            futures = {
+                pool.submit(contextvars.copy_context().run, check_pair, llm, docs[a], docs[b]): (a, b)
+                for a, b in todo
+            }
+            for future in as_completed(futures):
+                a, b = futures[future]
+                try:
+                    conflict, explanation = future.result()
+                except Exception as e:
+                    stats["failed"] += 1
+                    logger.warning("Conflict check of %s / %s failed: %s", a, b, e)
+                    continue
+                conflict_index.record(docs[a], docs[b], pairs[(a, b)], conflict, explanation)
+                stats["checked"] += 1
+                stats["conflicts"] += conflict
+        stats["conflicts_indexed"] = conflict_index.con.execute(
+            "SELECT COUNT(*) FROM pair_checks WHERE conflict"
+        ).fetchone()[0]
+    finally:
+        conflict_index.close()
+    os.replace(staging_path, index_path)
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    logger.info(
+        "Conflict index updated: %d chunks, %d candidate pairs (of %d), %d checked, %d new conflicts, %d stale dropped.",
+        stats["chunks"], stats["candidates"], stats["all_pairs"], stats["checked"], stats["conflicts"], stats["pruned"],
+    )
+    return stats
+
+
+# ── Query time ───────────────────────────────────────────────
+
+def lookup_conflicts(docs: List[Document], index_path: str = CONFLICT_INDEX_PATH) -> List[Dict]:
+    """Confirmed conflicts of the retrieved `docs` (empty if there is no conflict index yet)."""
+    if not docs or not os.path.exists(index_path):
+        return []
+    try:
+        conflict_index = ConflictIndex(index_path, read_only=True)
+    except duckdb.Error as e:
+        logger.warning("Conflict index unavailable (%s); skipping the conflict check.", e)
+        return []
+    try:
+        with span("sql", "conflict_lookup"):
+            conflicts = conflict_index.conflicts_for([chunk_id(d) for d in docs])
+    finally:
+        conflict_index.close()
+    sources = {chunk_id(d): d.metadata.get("source", "Unknown") for d in docs}
+    for conflict in conflicts:
+        conflict["source"] = sources.get(conflict["chunk_id"], "Unknown")
+    return conflicts
+
+
+def format_conflicts(conflicts: List[Dict]) -> str:
+    lines = ["Known conflicts with other policies:"]
+    for c in conflicts:
+        other = c["other_source"] or "Unknown"
+        if c["other_section"]:
+            other += f" | Section: {c['other_section']}"
+        excerpt = c["other_text"][:CONFLICT_EXCERPT_CHARS]
+        lines.append(f"- {c['source']} conflicts with {other}: {c['explanation']}\n  Conflicting clause: {excerpt}")
+    return "\n".join(lines)
+
+
+def main():
+    from compliance_rag.utils.logger import setup_logger
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rebuild", action="store_true", help="Discard stored verdicts and check every pair")
+    parser.add_argument("--neighbours", type=int, default=CONFLICT_NEIGHBOURS)
+    parser.add_argument("--min-similarity", type=float, default=CONFLICT_MIN_SIMILARITY)
+    parser.add_argument("--max-checks", type=int, default=CONFLICT_MAX_CHECKS, help="LLM checks this run (0 = all)")
+    args = parser.parse_args()
+
+    setup_logger("compliance_rag", level="INFO")
+    stats = update_conflict_index(neighbours=args.neighbours, min_similarity=args.min_similarity,
+                                  max_checks=args.max_checks, rebuild=args.rebuild)
+    for name, value in stats.items():
+        print(f"{name:<18} {value}")
+
+
+if __name__ == "__main__":
+    main()
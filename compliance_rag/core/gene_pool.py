@@ -1,85 +1,464 @@
+import re
 import json
 import os
+import sqlite3
+import difflib
 import logging
-from typing import Dict
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
 from compliance_rag.core.sop import ComplianceSOP
 from compliance_rag.core.defaults import get_baseline_sop
-from compliance_rag.config import DATA_DIR
+from compliance_rag.evaluation.models import EvaluationResult
+from compliance_rag.config import DATA_DIR, SOP_SNAPSHOT_INTERVAL, SOP_CACHE_SIZE
 
 logger = logging.getLogger("compliance_rag.gene_pool")
 
-SOP_DB_PATH = os.path.join(DATA_DIR, "sop_gene_pool.json")
+SOP_DB_PATH = os.path.join(DATA_DIR, "sop_gene_pool.db")
+# Gene pools written before the SQLite store; imported once into an empty database
+LEGACY_SOP_JSON_PATH = os.path.join(DATA_DIR, "sop_gene_pool.json")
+
+# Seconds a writer waits for another process's transaction before failing
+BUSY_TIMEOUT_S = 30
+
+# Words and the whitespace between them; changed lines are diffed at this granularity
+TOKEN_RE = re.compile(r"\s+|\S+")
 
 
 class SOPGenePool:
     """
     Manages the evolution of Compliance SOPs.
     Acts as a persistent store for different versions of the agent's 'genome'.
+
+    Generations are rows in an append-only SQLite table (WAL mode), so adding one
+    writes a single row regardless of history size, and concurrent writers from
+    several processes are serialized by SQLite transactions.
+
+    Each generation records the version it was evolved from and is stored as a
+    word-level diff against it, with a full snapshot every `snapshot_interval`
+    generations of a lineage. Reconstructed versions are kept in an LRU cache.
+
+    The latest version ID is held in memory and re-read only when the store's
+    generation counter changes, checked at most every `poll_interval` seconds
+    (0 checks on every call). Versions added by other processes therefore become
+    visible within `poll_interval`.
     """
-    def __init__(self):
-        self.sops: Dict[str, ComplianceSOP] = {}
+    def __init__(self, db_path: str = SOP_DB_PATH, snapshot_interval: int = SOP_SNAPSHOT_INTERVAL,
+                 cache_size: int = SOP_CACHE_SIZE, legacy_json_path: Optional[str] = LEGACY_SOP_JSON_PATH,
+                 poll_interval: float = 0.0):
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.legacy_json_path = legacy_json_path
+        self.snapshot_interval = max(1, snapshot_interval)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, ComplianceSOP]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._generation: Optional[int] = None
+        self._latest: Optional[str] = None
+        self._count = 0
+        self._checked_at = 0.0
         self.load_db()
-    
+        self.refresh()
+
+    @contextmanager
+    def _connect(self, write: bool = False):
+        con = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+        try:
+            if write:
+                # Take the write lock up front so version allocation can't interleave
+                con.execute("BEGIN IMMEDIATE")
+                try:
+                    yield con
+                    con.execute("COMMIT")
+                except BaseException:
+                    con.execute("ROLLBACK")
+                    raise
+            else:
+                yield con
+        finally:
+            con.close()
+
     def load_db(self):
-        """Loads SOP history from disk or initializes baseline."""
-        if os.path.exists(SOP_DB_PATH):
-            try:
-                with open(SOP_DB_PATH, "r") as f:
-                    data = json.load(f)
-                    for version, sop_data in data.items():
-                        self.sops[version] = ComplianceSOP(**sop_data)
-                logger.info(f"Loaded {len(self.sops)} SOP generations from disk.")
-            except Exception as e:
-                logger.error(f"Error loading SOP DB: {e}. Starting fresh.")
-                self._init_baseline()
-        else:
-            self._init_baseline()
-            
-    def _init_baseline(self):
-        """Creates the v0 baseline from defaults."""
-        logger.info("Initializing new SOP Gene Pool with Baseline v0.")
-        baseline = get_baseline_sop()
-        self.add_sop("v0", baseline)
-
-    def add_sop(self, version: str, sop: ComplianceSOP):
-        """Persists a new SOP version."""
-        self.sops[version] = sop
-        self.save_db()
-        logger.info(f"Added SOP version {version} to Gene Pool.")
-
-    def get_sop(self, version: str) -> ComplianceSOP:
-        return self.sops.get(version)
+        """Creates the store if needed, importing the legacy JSON pool or initializing the baseline."""
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+        with self._connect(write=True) as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS sops (
+                    version TEXT PRIMARY KEY,
+                    number INTEGER UNIQUE,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    body TEXT NOT NULL
+                )
+            """)
+            # Lineage columns: stored_as is 'snapshot' (body is the full SOP) or 'delta'
+            # (body is a diff against parent); depth counts deltas since the last snapshot
+            columns = {row[1] for row in con.execute("PRAGMA table_info(sops)")}
+            if "parent" not in columns:
+                con.execute("ALTER TABLE sops ADD COLUMN parent TEXT")
+                con.execute("ALTER TABLE sops ADD COLUMN stored_as TEXT NOT NULL DEFAULT 'snapshot'")
+                con.execute("ALTER TABLE sops ADD COLUMN depth INTEGER NOT NULL DEFAULT 0")
+            # Bumped on every write, so other workers can cheaply tell their caches are stale
+            con.execute("CREATE TABLE IF NOT EXISTS pool_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            con.execute("INSERT OR IGNORE INTO pool_state VALUES ('generation', 0)")
+            # Measured quality/latency tradeoff of each generation, one row per evaluated run
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS evaluations (
+                    version TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    recorded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    quality REAL NOT NULL,
+                    performance_score REAL NOT NULL,
+                    latency_s REAL,
+                    tokens INTEGER,
+                    cost_usd REAL,
+                    scores TEXT NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS evaluations_version ON evaluations (version)")
+
+            if con.execute("SELECT COUNT(*) FROM sops").fetchone()[0]:
+                return
+            if self.legacy_json_path and os.path.exists(self.legacy_json_path):
+                con.execute("SAVEPOINT legacy_import")
+                try:
+                    self._import_legacy_json(con)
+                    con.execute("RELEASE legacy_import")
+                    return
+                except Exception as e:
+                    con.execute("ROLLBACK TO legacy_import")
+                    logger.error("Error importing legacy SOP pool %s: %s. Starting fresh.", self.legacy_json_path, e)
+            logger.info("Initializing new SOP Gene Pool with Baseline v0.")
+            self._insert(con, "v0", get_baseline_sop(), parent=None)
+
+    def _import_legacy_json(self, con: sqlite3.Connection):
+        with open(self.legacy_json_path, "r") as f:
+            data = json.load(f)
+        # The JSON pool kept no lineage; generations were evolved one after another
+        parent = None
+        for version in sorted(data, key=lambda v: _version_number(v) if _version_number(v) is not None else -1):
+            self._insert(con, version, ComplianceSOP(**data[version]), parent=parent)
+            parent = version
+        logger.info("Imported %d SOP generations from %s.", len(data), self.legacy_json_path)
+
+    def _insert(self, con: sqlite3.Connection, version: str, sop: ComplianceSOP, parent: Optional[str]):
+        full = sop.model_dump()
+        body, stored_as, depth = json.dumps(full), "snapshot", 0
+        if parent is not None:
+            row = con.execute("SELECT depth FROM sops WHERE version = ?", (parent,)).fetchone()
+            if row is None:
+                raise ValueError(f"Parent SOP version '{parent}' not found.")
+            if row[0] + 1 < self.snapshot_interval:
+                delta = json.dumps(make_delta(self._reconstruct(con, parent).model_dump(), full))
+                # A rewrite of most of the prompt is cheaper to store in full
+                if len(delta) < len(body):
+                    body, stored_as, depth = delta, "delta", row[0] + 1
+
+        con.execute(
+            "INSERT INTO sops (version, number, body, parent, stored_as, depth) VALUES (?, ?, ?, ?, ?, ?)",
+            (version, _version_number(version), body, parent, stored_as, depth),
+        )
+        con.execute("UPDATE pool_state SET value = value + 1 WHERE key = 'generation'")
+
+    def add_sop(self, version: str, sop: ComplianceSOP, parent: Optional[str] = None):
+        """
+        Persists a new SOP version under an explicit ID, derived from `parent`
+        (None stores a root snapshot). Existing versions are never overwritten.
+        """
+        with self._connect(write=True) as con:
+            self._insert(con, version, sop, parent)
+        self._remember(version, sop)
+        self.refresh()
+        logger.info("Added SOP version %s to Gene Pool.", version)
+
+    def add_next_sop(self, sop: ComplianceSOP, parent: Optional[str] = None) -> str:
+        """
+        Persists `sop` as the next version (v<latest + 1>) and returns its ID.
+        `parent` is the version it was evolved from (defaults to the latest).
+        Allocation and insert share one transaction, so concurrent callers never collide.
+        """
+        with self._connect(write=True) as con:
+            latest = con.execute("SELECT MAX(number) FROM sops").fetchone()[0]
+            version = f"v{(latest if latest is not None else -1) + 1}"
+            if parent is None and latest is not None:
+                parent = f"v{latest}"
+            self._insert(con, version, sop, parent)
+        self._remember(version, sop)
+        self.refresh()
+        logger.info("Added SOP version %s (from %s) to Gene Pool.", version, parent)
+        return version
+
+    def _remember(self, version: str, sop: ComplianceSOP):
+        with self._cache_lock:
+            self._cache[version] = sop
+            self._cache.move_to_end(version)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _cached(self, version: str) -> Optional[ComplianceSOP]:
+        with self._cache_lock:
+            sop = self._cache.get(version)
+            if sop is not None:
+                self._cache.move_to_end(version)
+            return sop
+
+    def _reconstruct(self, con: sqlite3.Connection, version: str) -> Optional[ComplianceSOP]:
+        """Rebuilds `version` from its nearest cached ancestor or snapshot by replaying diffs."""
+        sop = self._cached(version)
+        if sop is not None:
+            return sop
+
+        # The chain from `version` back to its snapshot: at most snapshot_interval rows
+        chain = con.execute("""
+            WITH RECURSIVE chain(version, parent, stored_as, body, hops) AS (
+                SELECT version, parent, stored_as, body, 0 FROM sops WHERE version = ?
+                UNION ALL
+                SELECT s.version, s.parent, s.stored_as, s.body, chain.hops + 1
+                FROM sops s JOIN chain ON s.version = chain.parent
+                WHERE chain.stored_as = 'delta'
+            )
+            SELECT version, stored_as, body FROM chain ORDER BY hops
+        """, (version,)).fetchall()
+        if not chain:
+            return None
+
+        # Start from the closest ancestor already in memory, else the snapshot at the end
+        start, data = len(chain) - 1, None
+        for i, (ancestor, _, _) in enumerate(chain[1:], start=1):
+            cached = self._cached(ancestor)
+            if cached is not None:
+                start, data = i, cached.model_dump()
+                break
+        if data is None:
+            data = _snapshot(chain[start][2])
+        for _, stored_as, body in reversed(chain[:start]):
+            data = _snapshot(body) if stored_as == "snapshot" else apply_delta(data, json.loads(body))
+
+        sop = ComplianceSOP(**data)
+        self._remember(version, sop)
+        return sop
+
+    def get_sop(self, version: str) -> Optional[ComplianceSOP]:
+        sop = self._cached(version)
+        if sop is not None:
+            return sop
+        with self._connect() as con:
+            return self._reconstruct(con, version)
 
     def get_latest_sop(self) -> ComplianceSOP:
         """Returns the most recent SOP version."""
-        try:
-            versions = sorted(
-                self.sops.keys(), 
-                key=lambda x: int(x[1:]) if x.startswith("v") and x[1:].isdigit() else 0
-            )
-            return self.sops[versions[-1]]
-        except Exception:
-            return self.sops.get("v0")
+        return self.get_sop(self.get_latest_version_id())
 
     def get_latest_version_id(self) -> str:
         """Returns the version ID of the latest SOP."""
-        try:
-            versions = sorted(
-                self.sops.keys(),
-                key=lambda x: int(x[1:]) if x.startswith("v") and x[1:].isdigit() else 0
+        self._refresh_if_stale()
+        return self._latest or "v0"
+
+    def list_versions(self) -> List[str]:
+        """All version IDs, oldest first. Prompt bodies are not read."""
+        with self._connect() as con:
+            return [row[0] for row in con.execute("SELECT version FROM sops ORDER BY number")]
+
+    def count(self) -> int:
+        self._refresh_if_stale()
+        return self._count
+
+    def generation(self) -> int:
+        """Write counter of the store; changes whenever any process adds a version."""
+        with self._connect() as con:
+            return con.execute("SELECT value FROM pool_state WHERE key = 'generation'").fetchone()[0]
+
+    def refresh(self) -> bool:
+        """
+        Re-reads the latest version and count if the generation counter moved.
+        Returns True when the store changed since the last refresh.
+        """
+        with self._connect() as con:
+            generation = con.execute("SELECT value FROM pool_state WHERE key = 'generation'").fetchone()[0]
+            if generation == self._generation:
+                self._checked_at = time.monotonic()
+                return False
+            row = con.execute("SELECT version FROM sops ORDER BY number DESC LIMIT 1").fetchone()
+            count = con.execute("SELECT COUNT(*) FROM sops").fetchone()[0]
+        self._latest, self._count = (row[0] if row else None), count
+        self._generation, self._checked_at = generation, time.monotonic()
+        return True
+
+    def _refresh_if_stale(self):
+        if time.monotonic() - self._checked_at >= self.poll_interval:
+            self.refresh()
+
+    def record_evaluation(self, version: str, question: str, evaluation: EvaluationResult):
+        """Stores the scores and measured latency/cost of one evaluated run of `version`."""
+        metrics = evaluation.run_metrics
+        scores = evaluation.to_vector()
+        with self._connect(write=True) as con:
+            con.execute(
+                "INSERT INTO evaluations (version, question, quality, performance_score, latency_s, tokens, cost_usd, scores)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    version, question, sum(scores[:4]) / 4, evaluation.performance_score,
+                    metrics.latency_s if metrics else None, metrics.total_tokens if metrics else None,
+                    metrics.cost_usd if metrics else None, json.dumps(scores),
+                ),
             )
-            return versions[-1]
-        except Exception:
-            return "v0"
-
-    def save_db(self):
-        """Saves all SOPs to JSON."""
-        data = {}
-        for v, sop in self.sops.items():
-            if hasattr(sop, "model_dump"):
-                data[v] = sop.model_dump()
+
+    def get_evaluations(self, version: str) -> Dict[str, Any]:
+        """Recorded runs of `version` and their means: quality (1-5), performance score, latency, tokens, cost."""
+        with self._connect() as con:
+            rows = con.execute(
+                "SELECT question, recorded_at, quality, performance_score, latency_s, tokens, cost_usd"
+                " FROM evaluations WHERE version = ? ORDER BY rowid", (version,)
+            ).fetchall()
+        names = ("question", "recorded_at", "quality", "performance_score", "latency_s", "tokens", "cost_usd")
+        runs = [dict(zip(names, row)) for row in rows]
+        return {"version": version, "runs": runs, "summary": _evaluation_summary(runs)}
+
+    def get_lineage(self, version: str, max_depth: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Ancestry of `version`, oldest first and ending with `version` itself.
+        `max_depth` limits how many ancestors are returned. Empty if the version doesn't exist.
+        """
+        with self._connect() as con:
+            rows = con.execute("""
+                WITH RECURSIVE lineage(version, parent, created_at, stored_as, hops) AS (
+                    SELECT version, parent, created_at, stored_as, 0 FROM sops WHERE version = ?
+                    UNION ALL
+                    SELECT s.version, s.parent, s.created_at, s.stored_as, lineage.hops + 1
+                    FROM sops s JOIN lineage ON s.version = lineage.parent
+                    WHERE ? IS NULL OR lineage.hops < ?
+                ),
+                measured AS (
+                    SELECT version, COUNT(*) AS runs, AVG(quality) AS quality, AVG(performance_score) AS performance,
+                           AVG(latency_s) AS latency, AVG(tokens) AS tokens, AVG(cost_usd) AS cost
+                    FROM evaluations WHERE version IN (SELECT version FROM lineage) GROUP BY version
+                )
+                SELECT l.version, l.parent, l.created_at, l.stored_as,
+                       m.runs, m.quality, m.performance, m.latency, m.tokens, m.cost
+                FROM lineage l LEFT JOIN measured m USING (version) ORDER BY l.hops DESC
+            """, (version, max_depth, max_depth)).fetchall()
+        # Each generation's measured quality/latency tradeoff (None until it has been evaluated)
+        return [
+            {
+                "version": v, "parent": p, "created_at": created_at, "stored_as": stored_as,
+                "evaluation": None if not runs else {
+                    "evaluated_runs": runs, "quality": quality, "performance_score": performance,
+                    "latency_s": latency, "tokens": tokens, "cost_usd": cost,
+                },
+            }
+            for v, p, created_at, stored_as, runs, quality, performance, latency, tokens, cost in rows
+        ]
+
+    def get_diff(self, version: str) -> Optional[Dict[str, Any]]:
+        """
+        What `version` changed relative to its parent: a unified diff per prompt
+        and old/new values for every other changed field. None if the version doesn't exist.
+        """
+        with self._connect() as con:
+            row = con.execute("SELECT parent FROM sops WHERE version = ?", (version,)).fetchone()
+            if row is None:
+                return None
+            parent = row[0]
+            new = self._reconstruct(con, version).model_dump()
+            old = self._reconstruct(con, parent).model_dump() if parent else {}
+
+        changes = {}
+        for name, value in new.items():
+            previous = old.get(name)
+            if value == previous:
+                continue
+            if isinstance(value, str) and isinstance(previous, str):
+                changes[name] = {"diff": "\n".join(difflib.unified_diff(
+                    previous.splitlines(), value.splitlines(),
+                    fromfile=f"{parent}/{name}", tofile=f"{version}/{name}", lineterm="",
+                ))}
+            else:
+                changes[name] = {"old": previous, "new": value}
+        return {"version": version, "parent": parent, "changes": changes}
+
+
+def _snapshot(body: str) -> Dict[str, Any]:
+    """A stored full SOP, with defaults for fields added since it was written (deltas may change them)."""
+    return ComplianceSOP(**json.loads(body)).model_dump()
+
+
+def _evaluation_summary(runs: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not runs:
+        return None
+    summary = {"evaluated_runs": len(runs)}
+    for name in ("quality", "performance_score", "latency_s", "tokens", "cost_usd"):
+        values = [r[name] for r in runs if r[name] is not None]
+        summary[name] = sum(values) / len(values) if values else None
+    return summary
+
+
+def make_delta(parent: Dict[str, Any], child: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Diff of two SOP dicts. A changed prompt becomes a list of ops: [start, end] copies
+    characters start..end of the parent's text, a string inserts new text. Other changed
+    fields store the new value.
+    """
+    delta = {}
+    for name, value in child.items():
+        old = parent.get(name)
+        if value == old:
+            continue
+        if isinstance(value, str) and isinstance(old, str):
+            delta[name] = {"ops": _text_ops(old, value)}
+        else:
+            delta[name] = {"value": value}
+    return delta
+
+
+def _text_ops(old: str, new: str) -> List[Any]:
+    """
+    Copy/insert ops turning `old` into `new`. Lines are matched first; only the
+    changed line blocks are diffed word by word, which keeps long prompts cheap.
+    """
+    ops: List[Any] = []
+
+    def copy(start: int, end: int):
+        if ops and isinstance(ops[-1], list) and ops[-1][1] == start:
+            ops[-1][1] = end
+        elif end > start:
+            ops.append([start, end])
+
+    def insert(text: str):
+        if ops and isinstance(ops[-1], str):
+            ops[-1] += text
+        elif text:
+            ops.append(text)
+
+    def diff(a: List[str], b: List[str], base: int, recurse: bool):
+        offsets = [base]
+        for piece in a:
+            offsets.append(offsets[-1] + len(piece))
+        for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+            if tag == "equal":
+                copy(offsets[i1], offsets[i2])
+            elif tag == "replace" and recurse:
+                diff(TOKEN_RE.findall("".join(a[i1:i2])), TOKEN_RE.findall("".join(b[j1:j2])), offsets[i1], False)
             else:
-                data[v] = sop.dict()
-                
-        with open(SOP_DB_PATH, "w") as f:
-            json.dump(data, f, indent=2)
+                insert("".join(b[j1:j2]))
+
+    diff(old.splitlines(keepends=True), new.splitlines(keepends=True), 0, True)
+    return ops
+
+
+def apply_delta(parent: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of `make_delta`: rebuilds the child dict from its parent."""
+    child = dict(parent)
+    for name, change in delta.items():
+        if "value" in change:
+            child[name] = change["value"]
+        else:
+            text = parent[name]
+            child[name] = "".join(text[op[0]:op[1]] if isinstance(op, list) else op for op in change["ops"])
+    return child
+
+
+def _version_number(version: str) -> Optional[int]:
+    """Numeric part of 'v<N>' version IDs; None for custom names."""
+    return int(version[1:]) if version.startswith("v") and version[1:].isdigit() else None
@@ -1,5 +1,22 @@
-from pydantic import BaseModel, Field
-from typing import Literal
+import logging
+from pydantic import BaseModel, Field, ValidationInfo, field_validator
+from compliance_rag.config import llm_config, LOCAL_MODELS
+
+logger = logging.getLogger("compliance_rag.sop")
+
+# Knobs the Director may change besides the prompts (see evolve_sop); each is
+# bounded by its Field so an evolved SOP can't leave the safe range.
+EVOLVABLE_KNOBS = (
+    "researcher_retriever_k",
+    "context_token_budget",
+    "planner_model",
+    "synthesizer_model",
+    "sql_analyst_model",
+    "llm_timeout_s",
+    "sql_analyst_enabled",
+    "rerank_enabled",
+    "rerank_candidates",
+)
 
 class ComplianceSOP(BaseModel):
     """
@@ -18,19 +35,71 @@ class ComplianceSOP(BaseModel):
     # RETRIEVAL STRATEGY
     researcher_retriever_k: int = Field(
         description="Number of documents for the Policy Researcher to retrieve.", 
-        default=3
+        default=3,
+        ge=1,
+        le=10
+    )
+    context_token_budget: int = Field(
+        description="Approximate tokens of research findings passed to the Synthesizer; the rest is cut.",
+        default=3000,
+        ge=500,
+        le=6000
+    )
+    rerank_enabled: bool = Field(
+        description="Whether the Researcher re-scores rerank_candidates search hits with a cross-encoder "
+                    "and keeps the best researcher_retriever_k.",
+        default=False
+    )
+    rerank_candidates: int = Field(
+        description="Search hits fetched per researcher query for reranking (used when rerank_enabled).",
+        default=20,
+        ge=5,
+        le=50
     )
     
     # STRATEGY SWITCHES
     conflict_check_enabled: bool = Field(
-        description="Whether to use the Conflict Detector agent.", 
+        description="Whether the Researcher adds known cross-policy conflicts of retrieved clauses (from the ingestion-time conflict index).",
+        default=True
+    )
+    sql_analyst_enabled: bool = Field(
+        description="Whether the SQL Analyst runs the Planner's metadata tasks.",
         default=True
     )
     
     # MODEL SELECTION (Evolvable)
-    # We allow the Director to switch between models for synthesis if needed.
-    # Currently only qwen2.5 is configured, but we can add more compliant models.
-    synthesizer_model: Literal["qwen2.5"] = Field(
+    # The Director may move a role to any local model in OLLAMA_MODELS,
+    # e.g. a smaller model for the Planner if answers stay good but latency is high.
+    planner_model: str = Field(
+        description="The local LLM to use for the Planner.",
+        default="llama3.1"
+    )
+    synthesizer_model: str = Field(
         description="The LLM to use for the Synthesizer.", 
         default="qwen2.5"
     )
+    sql_analyst_model: str = Field(
+        description="The local LLM to use for the SQL Analyst.",
+        default="qwen2.5"
+    )
+    
+    # LATENCY
+    llm_timeout_s: float = Field(
+        description="Seconds a specialist LLM call may take, once admitted by the scheduler, before the agent falls back.",
+        default=120.0,
+        ge=5.0,
+        le=600.0
+    )
+
+    @field_validator("planner_model", "synthesizer_model", "sql_analyst_model")
+    @classmethod
+    def _local_model(cls, value: str, info: ValidationInfo) -> str:
+        # Stored SOPs must keep loading when a model leaves OLLAMA_MODELS, so an unknown
+        # model falls back to the role's configured one; proposed changes are checked
+        # against LOCAL_MODELS before they get here (apply_changes in agents/evolution.py)
+        if value not in LOCAL_MODELS:
+            fallback = llm_config[info.field_name.removesuffix("_model")].model
+            logger.warning("Model '%s' for %s is not a configured local model; using '%s'.",
+                           value, info.field_name, fallback)
+            return fallback
+        return value
@@ -0,0 +1,356 @@
+"""
+Load-balanced pool of Ollama replicas behind one model interface.
+
+`pooled(factory, urls)` builds one LangChain client per replica URL and returns
+an `EndpointPool` that exposes the usual invoke/ainvoke/embed_* calls:
+
+- Routing: each call goes to the healthy replica with the fewest outstanding
+  requests. Replica state is shared by URL, so the planner, synthesizer and
+  embedding pools all see the same load and health of a server.
+- Health: a replica is ejected after `eject_after` consecutive failures (or at
+  once on a connection error) for `eject_s` seconds. A background checker polls
+  every replica's /api/tags and re-admits ejected replicas that answer again.
+  If every replica is ejected, calls are still attempted rather than refused.
+- Failover: a failed call is retried once on another replica. A read timeout
+  is not: it is the client's own request timeout (the SOP's llm_timeout_s), a
+  deadline for the call rather than a replica fault.
+- Hedging (optional): once a call has run longer than the `hedge_percentile`
+  of recent latencies for that call type, a duplicate goes to a second replica
+  and whichever finishes first wins.
+
+With hedging on, the LLM scheduler's per-lane limit is a soft limit: a hedged
+call holds one slot but has two requests in flight, and a losing sync request
+(a thread that can't be interrupted) keeps running on its replica after the
+winner has returned and the slot is released. Async losers are cancelled.
+Size LLM_CONCURRENCY with that headroom, or leave OLLAMA_HEDGE_PERCENTILE at 0
+where the per-lane limit has to be exact.
+
+With a single URL, `pooled` returns the plain client, so nothing changes.
+"""
+import time
+import asyncio
+import logging
+import threading
+import urllib.request
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger("compliance_rag.endpoint_pool")
+
+# Ollama answers this cheaply without loading a model
+HEALTH_PATH = "/api/tags"
+HEALTH_TIMEOUT_S = 2.0
+
+# Recent latencies kept per call type for the hedging threshold
+LATENCY_SAMPLES = 256
+
+# Threads running sync calls so a slow replica can be hedged (bounded by the LLM scheduler's slots)
+_executor = ThreadPoolExecutor(max_workers=64, thread_name_prefix="llm-endpoint")
+
+
+class ReplicaState:
+    """Load and health of one server URL, shared by every pool that uses it."""
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.last_error: Optional[str] = None
+
+    def healthy(self, now: float) -> bool:
+        return self.ejected_until <= now
+
+    def as_dict(self, now: float) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy(now),
+            "ejected_for_s": round(max(0.0, self.ejected_until - now), 1),
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+_lock = threading.Lock()
+_replicas: Dict[str, ReplicaState] = {}
+_health_checker: Optional["HealthChecker"] = None
+
+
+def replica_state(url: str) -> ReplicaState:
+    with _lock:
+        if url not in _replicas:
+            _replicas[url] = ReplicaState(url)
+        return _replicas[url]
+
+
+def replica_stats() -> Dict[str, Dict[str, Any]]:
+    """Health and load of every known replica, keyed by URL."""
+    now = time.monotonic()
+    with _lock:
+        return {url: state.as_dict(now) for url, state in _replicas.items()}
+
+
+def _eject(state: ReplicaState, seconds: float, reason: str):
+    """Caller holds _lock."""
+    if state.healthy(time.monotonic()):
+        logger.warning("Ejecting LLM endpoint %s for %.0fs: %s", state.url, seconds, reason)
+    state.ejected_until = time.monotonic() + seconds
+
+
+class HealthChecker:
+    """Polls every registered replica and re-admits (or ejects) it based on the answer."""
+    def __init__(self, interval: float, eject_s: float):
+        self.interval = interval
+        self.eject_s = eject_s
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="llm-endpoint-health")
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with _lock:
+                states = list(_replicas.values())
+            for state in states:
+                self.check(state)
+
+    def check(self, state: ReplicaState) -> bool:
+        try:
+            with urllib.request.urlopen(state.url.rstrip("/") + HEALTH_PATH, timeout=HEALTH_TIMEOUT_S) as resp:
+                ok = resp.status == 200
+        except Exception as e:
+            ok, error = False, str(e)
+        with _lock:
+            if ok:
+                if not state.healthy(time.monotonic()):
+                    logger.info("LLM endpoint %s passed its health check; re-admitted.", state.url)
+                state.ejected_until = 0.0
+                state.consecutive_failures = 0
+            else:
+                state.last_error = error
+                _eject(state, self.eject_s, f"health check failed ({error})")
+        return ok
+
+
+def _deadline_exceeded(error: BaseException) -> bool:
+    """A read timeout means the call outlived its request timeout; another replica won't be faster."""
+    return isinstance(error, httpx.ReadTimeout)
+
+
+def _start_health_checker(interval: float, eject_s: float):
+    global _health_checker
+    with _lock:
+        if _health_checker is None and interval > 0:
+            _health_checker = HealthChecker(interval, eject_s)
+
+
+class EndpointPool:
+    """A chat or embedding model served by several replicas (see module docstring)."""
+    backend = "ollama"
+
+    def __init__(self, factory: Callable[[str], Any], urls: List[str], eject_after: int = 3,
+                 eject_s: float = 30.0, health_interval: float = 10.0, hedge_percentile: float = 0.0,
+                 hedge_min_samples: int = 20):
+        if not urls:
+            raise ValueError("An endpoint pool needs at least one URL")
+        self.urls = list(urls)
+        self.clients = {url: factory(url) for url in self.urls}
+        self.states = {url: replica_state(url) for url in self.urls}
+        self.eject_after = eject_after
+        self.eject_s = eject_s
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._latencies: Dict[str, deque] = {}
+        self._rotation = 0
+        _start_health_checker(health_interval, eject_s)
+
+    @property
+    def replica_count(self) -> int:
+        return len(self.urls)
+
+    def __getattr__(self, name: str):
+        # Model settings (model, temperature, ...) are the same on every replica
+        if name in ("urls", "clients"):
+            raise AttributeError(name)
+        return getattr(self.clients[self.urls[0]], name)
+
+    def __repr__(self) -> str:
+        return f"EndpointPool({self.model}, {self.urls})"
+
+    # ── Routing and health ───────────────────────────────────
+
+    def _pick(self, exclude: List[str]) -> Optional[str]:
+        """Reserves the least-loaded healthy replica not in `exclude` (any replica if none is healthy)."""
+        now = time.monotonic()
+        with _lock:
+            # Rotate the starting point so ties are spread evenly
+            self._rotation = (self._rotation + 1) % len(self.urls)
+            order = self.urls[self._rotation:] + self.urls[:self._rotation]
+            candidates = [u for u in order if u not in exclude and self.states[u].healthy(now)]
+            if not candidates and not exclude:
+                candidates = order
+            if not candidates:
+                return None
+            url = min(candidates, key=lambda u: self.states[u].outstanding)
+            self.states[url].outstanding += 1
+            self.states[url].calls += 1
+            return url
+
+    def _finished(self, url: str, method: str, started: float, error: Optional[BaseException]):
+        state = self.states[url]
+        with _lock:
+            state.outstanding -= 1
+            if error is None:
+                state.consecutive_failures = 0
+                self._latencies.setdefault(method, deque(maxlen=LATENCY_SAMPLES)).append(time.perf_counter() - started)
+            elif not isinstance(error, asyncio.CancelledError):
+                state.errors += 1
+                state.consecutive_failures += 1
+                state.last_error = f"{type(error).__name__}: {error}"
+                if isinstance(error, (ConnectionError, TimeoutError)) or state.consecutive_failures >= self.eject_after:
+                    _eject(state, self.eject_s, state.last_error)
+
+    def hedge_after(self, method: str) -> Optional[float]:
+        """Seconds after which a call of this type is hedged, or None if hedging is off or unwarmed."""
+        samples = self._latencies.get(method)
+        if not self.hedge_percentile or len(self.urls) < 2 or not samples or len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))]
+
+    # ── Calls ────────────────────────────────────────────────
+
+    def _run(self, url: str, method: str, args, kwargs):
+        started = time.perf_counter()
+        try:
+            result = getattr(self.clients[url], method)(*args, **kwargs)
+        except BaseException as e:
+            self._finished(url, method, started, e)
+            raise
+        self._finished(url, method, started, None)
+        return result
+
+    def _call(self, method: str, *args, **kwargs):
+        hedge_after = self.hedge_after(method)
+        primary = self._pick([])
+        tried, hedges = [primary], []
+        pending = {_executor.submit(self._run, primary, method, args, kwargs): primary}
+        hedged, retried, error = hedge_after is None, False, None
+        while True:
+            done, _ = wait(pending, timeout=None if hedged else hedge_after, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first replica is slower than usual: race a duplicate on another one
+                hedged = True
+                url = self._pick(tried)
+                if url:
+                    tried.append(url)
+                    hedges.append(url)
+                    pending[_executor.submit(self._run, url, method, args, kwargs)] = url
+                    self.hedges += 1
+                continue
+            for future in done:
+                url = pending.pop(future)
+                if future.exception() is None:
+                    if url in hedges:
+                        self.hedge_wins += 1
+                    # A losing request still in `pending` runs to completion outside the scheduler slot
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                url = None if retried or _deadline_exceeded(error) else self._pick(tried)
+                if url is None:
+                    raise error
+                logger.warning("%s failed on %s (%s); retrying on %s.", method, tried[-1], error, url)
+                retried, hedged = True, True
+                tried.append(url)
+                pending[_executor.submit(self._run, url, method, args, kwargs)] = url
+
+    async def _arun(self, url: str, method: str, args, kwargs):
+        started = time.perf_counter()
+        try:
+            result = await getattr(self.clients[url], method)(*args, **kwargs)
+        except BaseException as e:
+            self._finished(url, method, started, e)
+            raise
+        self._finished(url, method, started, None)
+        return result
+
+    async def _acall(self, method: str, *args, **kwargs):
+        hedge_after = self.hedge_after(method)
+        primary = self._pick([])
+        tried, hedges = [primary], []
+        pending = {asyncio.ensure_future(self._arun(primary, method, args, kwargs)): primary}
+        hedged, retried, error = hedge_after is None, False, None
+        try:
+            while True:
+                done, _ = await asyncio.wait(pending, timeout=None if hedged else hedge_after,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    url = self._pick(tried)
+                    if url:
+                        tried.append(url)
+                        hedges.append(url)
+                        pending[asyncio.ensure_future(self._arun(url, method, args, kwargs))] = url
+                        self.hedges += 1
+                    continue
+                for task in done:
+                    url = pending.pop(task)
+                    if task.exception() is None:
+                        if url in hedges:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    url = None if retried or _deadline_exceeded(error) else self._pick(tried)
+                    if url is None:
+                        raise error
+                    logger.warning("%s failed on %s (%s); retrying on %s.", method, tried[-1], error, url)
+                    retried, hedged = True, True
+                    tried.append(url)
+                    pending[asyncio.ensure_future(self._arun(url, method, args, kwargs))] = url
+        finally:
+            # Unlike threads, the losing async request can be abandoned
+            for task in pending:
+                task.cancel()
+
+    def invoke(self, *args, **kwargs):
+        return self._call("invoke", *args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        return await self._acall("ainvoke", *args, **kwargs)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._call("embed_documents", texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call("embed_query", text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self._acall("aembed_documents", texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self._acall("aembed_query", text)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedging counters of this pool; replica health and load are in `replica_stats()`."""
+        thresholds = {m: self.hedge_after(m) for m in list(self._latencies)}
+        return {
+            "urls": self.urls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_after_ms": {m: round(t * 1000, 1) for m, t in thresholds.items() if t is not None},
+        }
+
+
+def pooled(factory: Callable[[str], Any], urls: List[str], **settings) -> Any:
+    """One client per URL behind an EndpointPool, or the plain client for a single URL."""
+    if len(urls) == 1:
+        return factory(urls[0])
+    return EndpointPool(factory, urls, **settings)
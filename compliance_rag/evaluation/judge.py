@@ -1,14 +1,16 @@
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langchain_core.messages import HumanMessage, SystemMessage
 from compliance_rag.config import llm_config
-from compliance_rag.evaluation.models import GradedScore, EvaluationResult
+from compliance_rag.evaluation.models import GradedScore, EvaluationResult, RunMetrics
 from compliance_rag.evaluation.programmatic import verify_citations
+from compliance_rag.evaluation.performance import performance_score
 
-def evaluate_run(request: str, response: str, context: str) -> EvaluationResult:
+def evaluate_run(request: str, response: str, context: str, metrics: Optional[RunMetrics] = None) -> EvaluationResult:
     """
     Evaluates a single run of the Compliance Assistant.
     Combines LLM-as-a-Judge with programmatic checks.
+    With the run's measured `metrics`, also scores latency and cost against the performance budget.
     """
     judge_llm = llm_config["director"]
 
@@ -55,5 +57,7 @@ def evaluate_run(request: str, response: str, context: str) -> EvaluationResult:
         accuracy=accuracy,
         citation_fidelity=citation_fidelity,
         completeness=completeness,
-        regulatory_compliance=compliance
+        regulatory_compliance=compliance,
+        performance_score=performance_score(metrics) if metrics else 1.0,
+        run_metrics=metrics
     )
@@ -1,11 +1,22 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 class GradedScore(BaseModel):
     """A single dimension score from a judge."""
     score: int = Field(description="Score from 1 to 5", ge=1, le=5)
     reasoning: str = Field(description="Justification for the score")
 
+class RunMetrics(BaseModel):
+    """Measured cost of one agent-network run."""
+    latency_s: float = Field(description="End-to-end wall time of the run, minus LLM scheduler queue wait")
+    queue_wait_s: float = Field(default=0.0, description="Wall time spent waiting for an LLM scheduler slot (not scored)")
+    tokens: Dict[str, Dict[str, int]] = Field(default_factory=dict, description="Prompt/completion tokens per role")
+    cost_usd: float = Field(default=0.0, description="Estimated cost from LLM_PRICES")
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(t.get("prompt", 0) + t.get("completion", 0) for t in self.tokens.values())
+
 class EvaluationResult(BaseModel):
     """Aggregate evaluation of a compliance assistant run."""
     accuracy: GradedScore
@@ -13,6 +24,7 @@ class EvaluationResult(BaseModel):
     completeness: GradedScore
     regulatory_compliance: GradedScore
     performance_score: float = Field(description="Normalized latency/cost score", default=1.0)
+    run_metrics: Optional[RunMetrics] = Field(default=None, description="Measurements behind performance_score")
     
     def to_vector(self) -> List[float]:
         """Convert scores to a float vector for Pareto analysis."""
@@ -23,3 +35,40 @@ class EvaluationResult(BaseModel):
             float(self.regulatory_compliance.score),
             self.performance_score
         ]
+
+class GoldenItem(BaseModel):
+    """One golden-set question and the policies a correct answer must draw on."""
+    id: str
+    question: str
+    expected_policy_ids: List[str] = Field(default_factory=list)
+
+class ItemResult(BaseModel):
+    """The evaluated run of one golden-set question under one SOP version."""
+    item_id: str
+    question: str
+    response: str
+    evaluation: EvaluationResult
+    policy_recall: float = Field(description="Share of the expected policies found in the research context", default=1.0)
+    cached: bool = False
+
+class GoldenSetReport(BaseModel):
+    """Aggregate scores of one SOP version over the golden set."""
+    version: str
+    items: List[ItemResult]
+    means: Dict[str, float]
+    passed: bool
+    failures: List[str] = Field(default_factory=list, description="Aggregate thresholds that were missed")
+    failed_items: Dict[str, str] = Field(default_factory=dict, description="item_id -> error of questions whose run or judging failed")
+    cached_items: int = 0
+    elapsed_s: float = 0.0
+
+    def to_vector(self) -> List[float]:
+        """Mean scores in `EvaluationResult.to_vector()` order, for Pareto selection."""
+        dimensions = ("accuracy", "citation_fidelity", "completeness", "regulatory_compliance", "performance_score")
+        return [float(self.means.get(d, 0.0)) for d in dimensions]
+
+    def worst_item(self) -> Optional[ItemResult]:
+        """The item with the lowest normalized quality, recall or performance: the best candidate for diagnosis."""
+        def weakest(r: ItemResult) -> float:
+            return min(sum(r.evaluation.to_vector()[:4]) / 20, r.policy_recall, r.evaluation.performance_score)
+        return min(self.items, key=weakest, default=None)
@@ -0,0 +1,54 @@
+"""
+Pareto selection over evaluation vectors (`to_vector()`: the four Judge
+dimensions and the performance score, higher is better everywhere).
+
+A candidate dominates another when it is at least as good on every dimension
+and better on one. `select_survivors` keeps whole non-dominated fronts, best
+first; when a front doesn't fit, its most spread-out members are kept
+(crowding distance, as in NSGA-II), so a fast-but-terse SOP and a slow-but-
+thorough one can both survive instead of being averaged into one score.
+"""
+from typing import List, Sequence
+
+
+def dominates(a: Sequence[float], b: Sequence[float]) -> bool:
+    return all(x >= y for x, y in zip(a, b)) and any(x > y for x, y in zip(a, b))
+
+
+def pareto_fronts(vectors: Sequence[Sequence[float]]) -> List[List[int]]:
+    """Indices of `vectors` grouped into non-dominated fronts, the Pareto front first."""
+    remaining = list(range(len(vectors)))
+    fronts = []
+    while remaining:
+        front = [i for i in remaining if not any(dominates(vectors[j], vectors[i]) for j in remaining if j != i)]
+        fronts.append(front)
+        remaining = [i for i in remaining if i not in front]
+    return fronts
+
+
+def crowding_distance(vectors: Sequence[Sequence[float]], front: List[int]) -> dict:
+    """Index -> how isolated that point is within its front (boundary points are infinite)."""
+    if len(front) <= 2:
+        return {i: float("inf") for i in front}
+    distance = {i: 0.0 for i in front}
+    for d in range(len(vectors[front[0]])):
+        ordered = sorted(front, key=lambda i: vectors[i][d])
+        low, high = vectors[ordered[0]][d], vectors[ordered[-1]][d]
+        if high == low:
+            # No spread: the "boundary" points would be arbitrary, so the dimension counts for nobody
+            continue
+        distance[ordered[0]] = distance[ordered[-1]] = float("inf")
+        for prev, cur, nxt in zip(ordered, ordered[1:], ordered[2:]):
+            distance[cur] += (vectors[nxt][d] - vectors[prev][d]) / (high - low)
+    return distance
+
+
+def select_survivors(vectors: Sequence[Sequence[float]], k: int) -> List[int]:
+    """Indices of the `k` survivors, best front first and most isolated first within a front."""
+    survivors: List[int] = []
+    for front in pareto_fronts(vectors):
+        distance = crowding_distance(vectors, front)
+        survivors.extend(sorted(front, key=lambda i: -distance[i])[:k - len(survivors)])
+        if len(survivors) >= k:
+            break
+    return survivors
@@ -0,0 +1,99 @@
+"""
+Latency and cost of an agent-network run, scored against the performance budget.
+
+`run_metrics(trace, sop)` turns the trace of one graph run (compliance_rag/tracing.py)
+into end-to-end latency, tokens per role and an estimated cost (LLM_PRICES, at
+the models the SOP picked for each role). Time spent waiting for an LLM
+scheduler slot (`llm_queue` spans) is taken out of the latency and reported as
+queue_wait_s: it depends on what else was running (e.g. concurrent golden-set
+evaluations), not on the SOP being scored.
+`performance_score(metrics)` normalizes each against its budget: 1.0 within
+budget, falling linearly to 0.0 at twice the budget. The run's score is its
+worst dimension, so doubling latency or cost alone is enough to fail it.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+from compliance_rag.config import (
+    llm_config,
+    LOCAL_ROLES,
+    LLM_PRICES,
+    PERF_LATENCY_BUDGET_S,
+    PERF_TOKEN_BUDGET,
+    PERF_COST_BUDGET_USD,
+)
+from compliance_rag.core.sop import ComplianceSOP
+from compliance_rag.evaluation.models import RunMetrics
+from compliance_rag.tracing import Trace
+
+
+def model_name(model: Any) -> str:
+    return str(getattr(model, "model", None) or getattr(model, "model_name", None) or "").lower()
+
+
+def role_model(role: str, sop: Optional[ComplianceSOP] = None) -> str:
+    """The model that served `role`: the SOP's choice for local roles, the configured one otherwise."""
+    if sop is not None and role in LOCAL_ROLES:
+        return getattr(sop, f"{role}_model").lower()
+    return model_name(llm_config.get(role))
+
+
+def covered_ms(intervals: List[Tuple[float, float]]) -> float:
+    """Wall time covered by (start_ms, duration_ms) intervals; overlapping waits count once."""
+    total, reach = 0.0, None
+    for start, duration in sorted(intervals):
+        end = start + duration
+        if reach is None or start > reach:
+            total += duration
+            reach = end
+        elif end > reach:
+            total += end - reach
+            reach = end
+    return total
+
+
+def run_metrics(trace: Trace, sop: Optional[ComplianceSOP] = None) -> RunMetrics:
+    """Latency, tokens and cost of the run of `sop` recorded in `trace` (call it right after the run)."""
+    summary = trace.summary()
+    cost = 0.0
+    for role, used in summary["tokens"].items():
+        prompt_price, completion_price = LLM_PRICES.get(role_model(role, sop), (0.0, 0.0))
+        cost += (used["prompt"] * prompt_price + used["completion"] * completion_price) / 1e6
+    queue_ms = covered_ms([(s["start_ms"], s["ms"]) for s in summary["spans"] if s["kind"] == "llm_queue"])
+    return RunMetrics(
+        latency_s=max(0.0, summary["total_ms"] - queue_ms) / 1000,
+        queue_wait_s=queue_ms / 1000,
+        tokens=summary["tokens"],
+        cost_usd=cost,
+    )
+
+
+def budget_usage(metrics: RunMetrics) -> Dict[str, Dict[str, float]]:
+    """Used amount and budget of every enabled dimension."""
+    dimensions = {
+        "latency_s": (metrics.latency_s, PERF_LATENCY_BUDGET_S),
+        "tokens": (metrics.total_tokens, PERF_TOKEN_BUDGET),
+        "cost_usd": (metrics.cost_usd, PERF_COST_BUDGET_USD),
+    }
+    return {name: {"used": used, "budget": budget} for name, (used, budget) in dimensions.items() if budget > 0}
+
+
+def dimension_score(used: float, budget: float) -> float:
+    return max(0.0, min(1.0, 2.0 - used / budget))
+
+
+def performance_score(metrics: RunMetrics) -> float:
+    """1.0 when every dimension is within budget, 0.0 when any is at twice its budget or more."""
+    scores = [dimension_score(d["used"], d["budget"]) for d in budget_usage(metrics).values()]
+    return round(min(scores, default=1.0), 3)
+
+
+def budget_overruns(metrics: RunMetrics) -> List[str]:
+    """Human-readable lines for the dimensions over budget, for failure diagnosis."""
+    lines = []
+    for name, d in budget_usage(metrics).items():
+        if d["used"] > d["budget"]:
+            lines.append(f"{name} {d['used']:.4g} vs budget {d['budget']:.4g} ({d['used'] / d['budget']:.1f}x)")
+    if lines and metrics.tokens:
+        per_role = ", ".join(f"{role} {t['prompt']}+{t['completion']}" for role, t in metrics.tokens.items())
+        lines.append(f"prompt+completion tokens per role: {per_role}")
+    return lines
@@ -0,0 +1,322 @@
+"""
+Golden-set evaluation of an SOP version.
+
+Every question in the golden set (GOLDEN_SET_PATH, one JSON object per line
+with "id", "question" and "expected_policy_ids") is run through the agent
+network and the Judge, at most `concurrency` questions at a time. Besides the
+Judge's dimensions and the performance score, each run gets a policy recall:
+the share of expected policies whose ID or source document shows up in the
+research context or the answer.
+
+Per-dimension means decide whether the version passes (EVAL_QUALITY_THRESHOLD,
+EVAL_MIN_POLICY_RECALL, PERF_SCORE_THRESHOLD). A question whose agent run or
+Judge call fails is recorded as a failed item (never cached) and fails the
+version, while the remaining questions are still aggregated. Results are cached per
+(SOP version, SOP content and scoring settings, question), so re-evaluating a
+version only runs new questions, while a version label reused after a gene-pool
+reset, or a change of the performance budgets, never gets stale results.
+
+Usage:
+    python -m compliance_rag.evaluation.runner --version v3 --concurrency 4 --output golden_v3.json
+"""
+import json
+import time
+import hashlib
+import sqlite3
+import asyncio
+import logging
+import argparse
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+import duckdb
+
+from compliance_rag.config import (
+    GOLDEN_SET_PATH,
+    EVAL_CONCURRENCY,
+    EVAL_CACHE_PATH,
+    EVAL_QUALITY_THRESHOLD,
+    EVAL_MIN_POLICY_RECALL,
+    PERF_SCORE_THRESHOLD,
+    PERF_LATENCY_BUDGET_S,
+    PERF_TOKEN_BUDGET,
+    PERF_COST_BUDGET_USD,
+    LLM_PRICES,
+    METADATA_DB_PATH,
+)
+from compliance_rag.core.sop import ComplianceSOP
+from compliance_rag.evaluation.judge import evaluate_run
+from compliance_rag.evaluation.models import EvaluationResult, GoldenItem, ItemResult, GoldenSetReport
+from compliance_rag.evaluation.performance import run_metrics
+from compliance_rag.graph.workflow import create_compliance_graph
+from compliance_rag.tracing import start_trace
+
+logger = logging.getLogger("compliance_rag.eval_runner")
+
+JUDGE_DIMENSIONS = ("accuracy", "citation_fidelity", "completeness", "regulatory_compliance")
+
+
+def load_golden_set(path: str = GOLDEN_SET_PATH) -> List[GoldenItem]:
+    """Reads the golden set; blank lines and lines starting with '#' are skipped."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                items.append(GoldenItem(**json.loads(line)))
+            except (ValueError, TypeError) as e:
+                raise ValueError(f"{path}:{number}: invalid golden-set entry ({e})")
+    ids = [item.id for item in items]
+    duplicates = sorted({i for i in ids if ids.count(i) > 1})
+    if duplicates:
+        raise ValueError(f"{path}: duplicate golden-set IDs {duplicates}")
+    return items
+
+
+def policy_sources() -> Dict[str, str]:
+    """policy_id -> source document file name, from the metadata database (empty if unavailable)."""
+    try:
+        con = duckdb.connect(METADATA_DB_PATH, read_only=True)
+        try:
+            rows = con.execute("SELECT policy_id, source_file FROM policies WHERE source_file IS NOT NULL").fetchall()
+        finally:
+            con.close()
+    except duckdb.Error as e:
+        logger.warning("Policy sources unavailable (%s); policy recall only matches policy IDs.", e)
+        return {}
+    return {policy_id: source for policy_id, source in rows}
+
+
+def policy_recall(expected: List[str], context: str, response: str, sources: Dict[str, str]) -> float:
+    """Share of `expected` policies cited by ID or retrieved by source document."""
+    if not expected:
+        return 1.0
+    text = f"{context}\n{response}"
+    found = sum(1 for pid in expected if pid in text or (sources.get(pid) and sources[pid] in text))
+    return found / len(expected)
+
+
+def evaluation_fingerprint(sop: ComplianceSOP) -> str:
+    """Hash of the SOP's content and the settings its performance score depends on."""
+    settings = {
+        "sop": sop.model_dump(mode="json"),
+        "budgets": [PERF_LATENCY_BUDGET_S, PERF_TOKEN_BUDGET, PERF_COST_BUDGET_USD],
+        "prices": LLM_PRICES,
+    }
+    return hashlib.sha1(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class EvaluationCache:
+    """Evaluated runs keyed by (SOP version, evaluation fingerprint, question), in a small SQLite database."""
+    def __init__(self, path: str = EVAL_CACHE_PATH):
+        self.path = path
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            # Caches from before the fingerprint was part of the key can't be trusted; start over
+            columns = {row[1] for row in con.execute("PRAGMA table_info(eval_cache)")}
+            if columns and "fingerprint" not in columns:
+                con.execute("DROP TABLE eval_cache")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS eval_cache (
+                    sop_version TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    question TEXT NOT NULL,
+                    created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    response TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    evaluation TEXT NOT NULL,
+                    PRIMARY KEY (sop_version, fingerprint, question)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def get(self, version: str, fingerprint: str, question: str) -> Optional[Tuple[str, str, EvaluationResult]]:
+        con = self._connect()
+        try:
+            row = con.execute(
+                "SELECT response, context, evaluation FROM eval_cache"
+                " WHERE sop_version = ? AND fingerprint = ? AND question = ?",
+                (version, fingerprint, question),
+            ).fetchone()
+        finally:
+            con.close()
+        if row is None:
+            return None
+        return row[0], row[1], EvaluationResult.model_validate_json(row[2])
+
+    def put(self, version: str, fingerprint: str, question: str, response: str, context: str,
+            evaluation: EvaluationResult):
+        con = self._connect()
+        try:
+            con.execute(
+                "INSERT OR REPLACE INTO eval_cache (sop_version, fingerprint, question, response, context, evaluation)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (version, fingerprint, question, response, context, evaluation.model_dump_json()),
+            )
+        finally:
+            con.close()
+
+
+class GoldenSetRunner:
+    """
+    Runs the golden set against one SOP version (see module docstring).
+    With a `gene_pool`, freshly evaluated runs are also recorded as that version's evaluations.
+    Concurrent `run()` calls (e.g. a population of candidate SOPs) share the
+    `concurrency` limit, so evaluating N versions at once doesn't multiply the load.
+    """
+    def __init__(self, gene_pool=None, concurrency: int = EVAL_CONCURRENCY,
+                 cache: Optional[EvaluationCache] = None, use_cache: bool = True):
+        self.gene_pool = gene_pool
+        self.concurrency = max(1, concurrency)
+        self.cache = (cache or EvaluationCache()) if use_cache else None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _limit(self) -> asyncio.Semaphore:
+        # One semaphore per event loop (asyncio primitives can't be shared across loops)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore, self._loop = asyncio.Semaphore(self.concurrency), loop
+        return self._semaphore
+
+    async def run(self, sop: ComplianceSOP, version: str, items: Optional[List[GoldenItem]] = None) -> GoldenSetReport:
+        items = items if items is not None else load_golden_set()
+        started = time.perf_counter()
+        semaphore = self._limit()
+        sources = await asyncio.to_thread(policy_sources)
+        graph = create_compliance_graph()
+        fingerprint = evaluation_fingerprint(sop)
+        outcomes = await asyncio.gather(*(
+            self._run_item(graph, sop, version, fingerprint, item, semaphore, sources) for item in items
+        ), return_exceptions=True)
+        results, errors = [], {}
+        for item, outcome in zip(items, outcomes):
+            if isinstance(outcome, ItemResult):
+                results.append(outcome)
+            elif isinstance(outcome, Exception):
+                logger.warning("Golden-set question %s failed under %s: %s", item.id, version, outcome)
+                errors[item.id] = f"{type(outcome).__name__}: {outcome}"
+            else:
+                raise outcome
+        report = aggregate(version, results, errors)
+        report.elapsed_s = round(time.perf_counter() - started, 2)
+        logger.info(
+            "Golden set for %s: %d questions (%d cached) in %ss; %s", version, len(items), report.cached_items,
+            report.elapsed_s, "PASSED" if report.passed else "FAILED: " + "; ".join(report.failures),
+        )
+        return report
+
+    async def _run_item(self, graph, sop: ComplianceSOP, version: str, fingerprint: str, item: GoldenItem,
+                        semaphore: asyncio.Semaphore, sources: Dict[str, str]) -> ItemResult:
+        cached = await asyncio.to_thread(self.cache.get, version, fingerprint, item.question) if self.cache else None
+        if cached:
+            response, context, evaluation = cached
+        else:
+            async with semaphore:
+                response, context, evaluation = await self._evaluate(graph, sop, item)
+            if self.cache:
+                await asyncio.to_thread(self.cache.put, version, fingerprint, item.question, response, context, evaluation)
+            if self.gene_pool:
+                await asyncio.to_thread(self.gene_pool.record_evaluation, version, item.question, evaluation)
+        return ItemResult(
+            item_id=item.id,
+            question=item.question,
+            response=response,
+            evaluation=evaluation,
+            policy_recall=policy_recall(item.expected_policy_ids, context, response, sources),
+            cached=bool(cached),
+        )
+
+    async def _evaluate(self, graph, sop: ComplianceSOP, item: GoldenItem) -> Tuple[str, str, EvaluationResult]:
+        initial_state = {
+            "initial_request": item.question,
+            "plan": None,
+            "agent_outputs": [],
+            "final_response": None,
+            "sop": sop
+        }
+        with start_trace() as trace:
+            final_state = await graph.ainvoke(initial_state)
+        metrics = run_metrics(trace, sop)
+        response = final_state["final_response"] or ""
+        context = "\n".join([str(o.findings) for o in final_state["agent_outputs"]])
+        evaluation = await asyncio.to_thread(evaluate_run, item.question, response, context, metrics)
+        return response, context, evaluation
+
+
+def aggregate(version: str, results: List[ItemResult], errors: Optional[Dict[str, str]] = None) -> GoldenSetReport:
+    """Per-dimension means over the golden set and the pass/fail decision; `errors` are the failed items."""
+    errors = errors or {}
+    means: Dict[str, float] = {}
+    if results:
+        for dimension in JUDGE_DIMENSIONS:
+            means[dimension] = statistics.mean(getattr(r.evaluation, dimension).score for r in results)
+        means["performance_score"] = statistics.mean(r.evaluation.performance_score for r in results)
+        means["policy_recall"] = statistics.mean(r.policy_recall for r in results)
+        measured = [r.evaluation.run_metrics for r in results if r.evaluation.run_metrics]
+        if measured:
+            means["latency_s"] = statistics.mean(m.latency_s for m in measured)
+            means["queue_wait_s"] = statistics.mean(m.queue_wait_s for m in measured)
+            means["tokens"] = statistics.mean(m.total_tokens for m in measured)
+            means["cost_usd"] = statistics.mean(m.cost_usd for m in measured)
+    means = {name: round(value, 4) for name, value in means.items()}
+
+    failures = [] if results or errors else ["the golden set is empty"]
+    if errors:
+        failures.append(f"{len(errors)} of {len(results) + len(errors)} questions failed to run or be judged")
+    for dimension in JUDGE_DIMENSIONS:
+        if dimension in means and means[dimension] < EVAL_QUALITY_THRESHOLD:
+            failures.append(f"mean {dimension} {means[dimension]:.2f} < {EVAL_QUALITY_THRESHOLD}")
+    if "policy_recall" in means and means["policy_recall"] < EVAL_MIN_POLICY_RECALL:
+        failures.append(f"mean policy_recall {means['policy_recall']:.2f} < {EVAL_MIN_POLICY_RECALL}")
+    if "performance_score" in means and means["performance_score"] < PERF_SCORE_THRESHOLD:
+        failures.append(f"mean performance_score {means['performance_score']:.2f} < {PERF_SCORE_THRESHOLD}")
+
+    return GoldenSetReport(
+        version=version,
+        items=results,
+        means=means,
+        passed=not failures,
+        failures=failures,
+        failed_items=errors,
+        cached_items=sum(r.cached for r in results),
+    )
+
+
+def main():
+    from compliance_rag.core.gene_pool import SOPGenePool
+    from compliance_rag.utils.logger import setup_logger
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--version", help="SOP version to evaluate (default: latest)")
+    parser.add_argument("--golden", default=GOLDEN_SET_PATH, help="Golden-set JSONL file")
+    parser.add_argument("--concurrency", type=int, default=EVAL_CONCURRENCY)
+    parser.add_argument("--no-cache", action="store_true", help="Re-run every question")
+    parser.add_argument("--output", help="Write the JSON report to this path")
+    args = parser.parse_args()
+
+    setup_logger("compliance_rag", level="INFO")
+    gene_pool = SOPGenePool()
+    version = args.version or gene_pool.get_latest_version_id()
+    sop = gene_pool.get_sop(version)
+    if sop is None:
+        parser.error(f"SOP version '{version}' not found")
+
+    runner = GoldenSetRunner(gene_pool, args.concurrency, use_cache=not args.no_cache)
+    report = asyncio.run(runner.run(sop, version, load_golden_set(args.golden)))
+    for name, value in report.means.items():
+        print(f"{name:<22} {value:.3f}")
+    print(f"{version}: {'PASSED' if report.passed else 'FAILED (' + '; '.join(report.failures) + ')'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report.model_dump_json(indent=2))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from langgraph.graph import StateGraph, START, END
 from compliance_rag.core.state import ComplianceState
+from compliance_rag.tracing import traced_node
 from compliance_rag.agents.specialists import (
     planner_node, 
     researcher_node, 
@@ -13,11 +14,11 @@ def create_compliance_graph():
     """
     workflow = StateGraph(ComplianceState)
     
-    # 1. Add Nodes
-    workflow.add_node("planner", planner_node)
-    workflow.add_node("researcher", researcher_node)
-    workflow.add_node("sql_analyst", sql_analyst_node)
-    workflow.add_node("synthesizer", synthesizer_node)
+    # 1. Add Nodes (each one timed for /metrics and query timings)
+    workflow.add_node("planner", traced_node("planner", planner_node))
+    workflow.add_node("researcher", traced_node("researcher", researcher_node))
+    workflow.add_node("sql_analyst", traced_node("sql_analyst", sql_analyst_node))
+    workflow.add_node("synthesizer", traced_node("synthesizer", synthesizer_node))
     
     # 2. Define Edges
     # For the baseline, we use a simple linear progression.
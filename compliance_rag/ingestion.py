@@ -1,67 +1,300 @@
 import os
+import glob
+import json
+import time
 import shutil
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader, DirectoryLoader, TextLoader
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+from langchain_community.document_loaders import PyPDFLoader, TextLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
 from langchain_core.documents import Document
 
-from compliance_rag.config import llm_config, DATA_DIR, VECTOR_STORE_PATH
+from compliance_rag.config import (
+    llm_config, DATA_DIR, VECTOR_STORE_PATH, FAISS_INDEX_TYPE,
+    INGEST_WORKERS, INGEST_WINDOW_FILES, CHUNKER, CHUNK_MAX_CHARS, DEDUP_MAX_HAMMING,
+    CHUNK_COMPARE_RECURSIVE, CONFLICT_INDEX_ENABLED
+)
+from compliance_rag.metadata_db import front_matter_records, upsert_front_matter, policy_tags, metadata_snapshot, apply_front_matter
+from compliance_rag.chunking import StructuredChunker, NearDuplicateFilter
+from compliance_rag.chunk_store import CHUNK_STORE_FILE
+from compliance_rag.vector_index import StreamingIndexBuilder, CHECKPOINT_FILE, INDEX_FILE, embedding_fingerprint
+from compliance_rag.conflicts import update_conflict_index
 
-def ingest_compliance_docs():
+# Front-matter records of finished windows, kept in the staging folder until written to the metadata DB
+FRONT_MATTER_LOG = "front_matter.jsonl"
+
+# We support PDFs and Text files for now
+LOADERS = {
+    ".pdf": PyPDFLoader,
+    ".txt": TextLoader,
+    ".md": TextLoader,
+}
+
+
+def discover_files(data_dir: str = DATA_DIR) -> List[str]:
+    """
+    Finds every loadable file under `data_dir`, largest first.
+    Scheduling the biggest files first keeps one slow PDF from finishing last on an idle pool.
+    """
+    paths = [
+        path
+        for ext in LOADERS
+        for path in glob.glob(os.path.join(data_dir, "**", f"*{ext}"), recursive=True)
+    ]
+    return sorted(paths, key=lambda path: (-os.path.getsize(path), path))
+
+
+def _load_file(path: str) -> Tuple[str, List[Document], float, Optional[str]]:
+    """Parses one file. Runs in a worker process; errors are returned, not raised."""
+    start = time.perf_counter()
+    try:
+        loader_cls = LOADERS[os.path.splitext(path)[1].lower()]
+        docs = loader_cls(path).load()
+        return path, docs, time.perf_counter() - start, None
+    except Exception as e:
+        return path, [], time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def load_documents(
+    paths: List[str],
+    workers: int = INGEST_WORKERS,
+    pool: Optional[ProcessPoolExecutor] = None,
+) -> List[Document]:
+    """
+    Parses `paths` over a process pool with per-file error isolation:
+    a corrupt file is reported and skipped without losing the rest of its type.
+    Prints parse throughput per file type. Pass `pool` to reuse worker processes.
+    """
+    start = time.perf_counter()
+    results: Dict[str, List[Document]] = {}
+    stats = defaultdict(lambda: {"files": 0, "failed": 0, "bytes": 0, "docs": 0, "parse_s": 0.0})
+
+    def record(path, docs, elapsed, error):
+        ext = os.path.splitext(path)[1].lower()
+        stats[ext]["files"] += 1
+        stats[ext]["bytes"] += os.path.getsize(path)
+        stats[ext]["parse_s"] += elapsed
+        if error:
+            stats[ext]["failed"] += 1
+            print(f"Warning: Could not load {path}: {error}")
+        else:
+            stats[ext]["docs"] += len(docs)
+            results[path] = docs
+
+    paths = sorted(paths, key=os.path.getsize, reverse=True)
+    if pool is not None:
+        for future in as_completed([pool.submit(_load_file, path) for path in paths]):
+            record(*future.result())
+    elif workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            record(*_load_file(path))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as own_pool:
+            for future in as_completed([own_pool.submit(_load_file, path) for path in paths]):
+                record(*future.result())
+
+    wall = time.perf_counter() - start
+    print(f"Parsed {len(paths)} files in {wall:.2f}s with {workers} worker(s).")
+    for ext, row in sorted(stats.items()):
+        mb = row["bytes"] / 1e6
+        parse_s = max(row["parse_s"], 1e-9)
+        print(
+            f"  {ext:<5} files={row['files']:<6} failed={row['failed']:<4} docs={row['docs']:<7} "
+            f"{mb:.1f} MB  {row['files'] / parse_s:.1f} files/s/worker  {mb / parse_s:.2f} MB/s/worker"
+        )
+
+    # Keep a stable document order (and so stable vector row IDs) across runs
+    return [doc for path in sorted(results) for doc in results[path]]
+
+
+def tag_policy_metadata(docs: List[Document], policy_metadata: Dict[str, Dict[str, str]]):
+    """
+    Tags each document with its policy metadata, matched on the document's file name.
+    Chunks inherit these tags, which is what makes filtered retrieval possible.
+    """
+    tagged = 0
+    for doc in docs:
+        metadata = policy_metadata.get(os.path.basename(doc.metadata.get("source", "")))
+        if metadata:
+            doc.metadata.update(metadata)
+            tagged += 1
+    print(f"Tagged {tagged}/{len(docs)} documents with policy metadata.")
+
+
+def read_front_matter_log(path: str) -> List[Dict[str, str]]:
+    """Front-matter records saved by earlier windows of this ingestion (empty if none)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def make_text_splitter():
+    """Returns the splitter selected by CHUNKER."""
+    if CHUNKER == "recursive":
+        # Splitting is crucial for RAG. We use overlap to maintain context across chunks.
+        return RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200,
+            add_start_index=True
+        )
+    return StructuredChunker(max_chars=CHUNK_MAX_CHARS)
+
+
+def compare_recursive() -> bool:
+    return CHUNK_COMPARE_RECURSIVE and CHUNKER != "recursive"
+
+
+def print_chunking_report(stats: Dict[str, float], folder_path: str):
+    """Summarizes this run's chunking; with CHUNK_COMPARE_RECURSIVE, against the original 1000/200 recursive splitter."""
+    embedded = stats["embedded"]
+    per_chunk_s = stats["embed_s"] / embedded if embedded else 0.0
+    index_bytes = os.path.getsize(os.path.join(folder_path, INDEX_FILE))
+    store_bytes = os.path.getsize(os.path.join(folder_path, CHUNK_STORE_FILE))
+
+    print("--- Chunking Report ---")
+    print(f"Chunker: {CHUNKER} (max {CHUNK_MAX_CHARS} chars), near-duplicate threshold: {DEDUP_MAX_HAMMING} bits")
+    print(f"Chunks produced: {stats['produced']}, near-duplicates removed: {stats['duplicates']}, embedded: {embedded}")
+    if compare_recursive():
+        legacy = stats["legacy"]
+        saved = legacy - embedded
+        print(f"Recursive splitter would have embedded: {legacy} ({saved:+d} saved, {saved / max(legacy, 1):.0%})")
+        print(
+            f"Embedding time: {stats['embed_s']:.1f}s ({per_chunk_s * 1000:.1f} ms/chunk), "
+            f"estimated {saved * per_chunk_s:.1f}s saved vs recursive splitter"
+        )
+        if embedded:
+            print(
+                f"Index size: {index_bytes / 1e6:.2f} MB (recursive splitter est. "
+                f"{index_bytes * legacy / embedded / 1e6:.2f} MB), chunk store: {store_bytes / 1e6:.2f} MB"
+            )
+    else:
+        print(f"Embedding time: {stats['embed_s']:.1f}s, index size: {index_bytes / 1e6:.2f} MB")
+
+
+def ingest_compliance_docs(resume: bool = True, window_files: int = INGEST_WINDOW_FILES):
     """
     Ingests compliance documents from the data directory into a FAISS vector store.
     This mirrors the 'Preparing the Knowledge Stores' step in the tutorial.
+
+    The corpus is streamed in fixed-size windows of files (load -> split -> embed -> append),
+    so memory stays flat regardless of corpus size. Progress is checkpointed after each
+    window; with `resume`, a crashed run continues from its last completed window.
+
+    Chunks are tagged from an in-memory snapshot of the policy metadata DB, so the windows
+    never lock it; front-matter found along the way is written to it once, before the
+    new store is published (waiting up to METADATA_LOCK_TIMEOUT_S for API workers to
+    release the file).
     """
     print(f"--- Starting Data Ingestion from {DATA_DIR} ---")
-    
-    # 1. Load Documents
-    # We support PDFs and Text files for now
-    loaders = [
-        DirectoryLoader(DATA_DIR, glob="**/*.pdf", loader_cls=PyPDFLoader),
-        DirectoryLoader(DATA_DIR, glob="**/*.txt", loader_cls=TextLoader),
-        DirectoryLoader(DATA_DIR, glob="**/*.md", loader_cls=TextLoader)
-    ]
-    
-    raw_docs: List[Document] = []
-    for loader in loaders:
-        try:
-            raw_docs.extend(loader.load())
-        except Exception as e:
-            print(f"Warning: Could not load some documents: {e}")
-            
-    print(f"Loaded {len(raw_docs)} raw documents.")
-    
-    if not raw_docs:
+
+    # We build into a staging folder so a failed run never destroys the current store.
+    staging_path = f"{VECTOR_STORE_PATH}.staging"
+    has_checkpoint = os.path.exists(os.path.join(staging_path, CHECKPOINT_FILE))
+    if os.path.exists(staging_path) and not (resume and has_checkpoint):
+        shutil.rmtree(staging_path)
+
+    # Front-matter fills gaps in the policy metadata; windows merge it into a snapshot and
+    # log it in the staging folder (so a resumed run still writes it), the DB is written once
+    front_matter_log = os.path.join(staging_path, FRONT_MATTER_LOG)
+    metadata = metadata_snapshot()
+    upsert_front_matter(metadata, read_front_matter_log(front_matter_log))
+
+    # The index type (flat, ivf_flat, ivf_pq, hnsw) comes from FAISS_INDEX_TYPE.
+    # Chunk text goes to a columnar chunk store next to the index (no pickled docstore).
+    embeddings = llm_config["embedding_model"]
+    builder = StreamingIndexBuilder(staging_path, FAISS_INDEX_TYPE, embedding=embedding_fingerprint(embeddings))
+    done = set(builder.files_done)
+    paths = [p for p in discover_files(DATA_DIR) if p not in done]
+    if done:
+        print(f"Resuming: {len(done)} files already ingested, {len(paths)} remaining.")
+
+    text_splitter = make_text_splitter()
+    legacy_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200) if compare_recursive() else None
+
+    # Near-duplicate detection spans the whole corpus, including windows done before a resume
+    dedup = NearDuplicateFilter(DEDUP_MAX_HAMMING) if DEDUP_MAX_HAMMING >= 0 else None
+    if dedup:
+        for signature in builder.chunks.metadata_values("simhash"):
+            dedup.add(int(signature))
+    stats = {"produced": 0, "duplicates": 0, "embedded": 0, "legacy": 0, "embed_s": 0.0}
+
+    print(f"Creating FAISS vector store ({FAISS_INDEX_TYPE}) in windows of {window_files} files...")
+    try:
+        with ProcessPoolExecutor(max_workers=INGEST_WORKERS) as pool:
+            for window_start in range(0, len(paths), window_files):
+                window = paths[window_start:window_start + window_files]
+
+                # 1. Load Documents
+                # Files are parsed in parallel, largest first, with failures isolated per file
+                raw_docs = load_documents(window, pool=pool)
+                # Chunks are tagged from the snapshot, merged with this window's front-matter
+                records = front_matter_records(raw_docs)
+                upsert_front_matter(metadata, records)
+                tag_policy_metadata(raw_docs, policy_tags(metadata, (os.path.basename(p) for p in window)))
+                with open(front_matter_log, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(r) + "\n" for r in records)
+
+                # 2. Split Text and drop near-duplicate boilerplate
+                splits = text_splitter.split_documents(raw_docs)
+                stats["produced"] += len(splits)
+                if legacy_splitter:
+                    stats["legacy"] += len(legacy_splitter.split_documents(raw_docs))
+                if dedup:
+                    kept = dedup.filter(splits)
+                    stats["duplicates"] += len(splits) - len(kept)
+                    splits = kept
+
+                # 3. Embed and append to the index, then checkpoint
+                embed_start = time.perf_counter()
+                vectors = embeddings.embed_documents([d.page_content for d in splits]) if splits else []
+                stats["embed_s"] += time.perf_counter() - embed_start
+                stats["embedded"] += len(splits)
+                builder.add(splits, vectors, files=window, duplicates=dedup.take_dropped() if dedup else None)
+                print(
+                    f"Window {window_start // window_files + 1}: {len(raw_docs)} documents -> "
+                    f"{len(splits)} chunks ({builder.next_row} indexed so far)."
+                )
+
+        # One short write of every window's front-matter, before the checkpoint is dropped:
+        # if the DB stays locked this raises, and re-running resumes straight to this step
+        apply_front_matter(read_front_matter_log(front_matter_log))
+        total_chunks = builder.finish()
+        if os.path.exists(front_matter_log):
+            os.remove(front_matter_log)
+    finally:
+        builder.close()
+        metadata.close()
+
+    if not total_chunks:
         print("No documents found to ingest. Skipping vector store creation.")
+        shutil.rmtree(staging_path)
         return
 
-    # 2. Split Text
-    # Splitting is crucial for RAG. We use overlap to maintain context across chunks.
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=200,
-        add_start_index=True
-    )
-    
-    splits = text_splitter.split_documents(raw_docs)
-    print(f"Split into {len(splits)} chunks.")
-
-    # 3. Create Vector Store
-    # We use FAISS (Facebook AI Similarity Search) with our local embeddings
-    print("Creating FAISS vector store... this may take a moment.")
-    vectorstore = FAISS.from_documents(
-        documents=splits,
-        embedding=llm_config["embedding_model"]
-    )
-    
-    # 4. Save Index
-    # Persist to disk so we don't have to rebuild every time
+    print_chunking_report(stats, staging_path)
+
+    # 4. Publish Index
+    # Swap the finished store into place so the API picks it up on next start
     if os.path.exists(VECTOR_STORE_PATH):
         shutil.rmtree(VECTOR_STORE_PATH)
     
-    vectorstore.save_local(VECTOR_STORE_PATH)
-    print(f"Vector store saved to {VECTOR_STORE_PATH}")
+    os.rename(staging_path, VECTOR_STORE_PATH)
+    print(f"Vector store with {total_chunks} chunks saved to {VECTOR_STORE_PATH}")
+
+    # 5. Update Conflict Index (opt-in: it waits on up to CONFLICT_MAX_CHECKS LLM calls)
+    # Only pairs involving new or changed chunks are checked; a failure here leaves the
+    # previous conflict index in place and never fails the ingestion
+    if CONFLICT_INDEX_ENABLED:
+        try:
+            conflict_stats = update_conflict_index()
+            print(
+                f"Conflict index: {conflict_stats['candidates']} candidate pairs of {conflict_stats['all_pairs']}, "
+                f"{conflict_stats['checked']} checked ({conflict_stats['already_checked']} unchanged), "
+                f"{conflict_stats['conflicts_indexed']} conflicts indexed"
+            )
+        except Exception as e:
+            print(f"Warning: Could not update the conflict index: {e}")
 
 if __name__ == "__main__":
     ingest_compliance_docs()
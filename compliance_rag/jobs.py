@@ -0,0 +1,340 @@
+"""
+Persistent background job queue.
+
+Jobs are rows in an SQLite table next to the gene pool, so they survive
+restarts and every API worker process can claim work from the same queue.
+Each worker process runs a bounded pool of asyncio tasks that claim queued
+jobs atomically, run the registered handler and record per-stage timings.
+Running jobs are heartbeated; a job whose heartbeat goes stale (its process
+died or was restarted) is re-queued by any live worker.
+
+JobStore is synchronous; the runner calls it through asyncio.to_thread, so a
+write lock held by another process (up to BUSY_TIMEOUT_S) never blocks the
+API's event loop.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from compliance_rag.config import DATA_DIR, JOB_WORKERS, JOB_POLL_INTERVAL, JOB_MAX_ATTEMPTS
+from compliance_rag.utils.logger import request_id_var
+
+logger = logging.getLogger("compliance_rag.jobs")
+
+JOB_DB_PATH = os.path.join(DATA_DIR, "jobs.db")
+
+# Seconds a writer waits for another process's transaction before failing
+BUSY_TIMEOUT_S = 30
+
+# Running jobs are heartbeated this often; a job silent for JOB_STALE_AFTER_S is orphaned
+JOB_HEARTBEAT_S = 10
+JOB_STALE_AFTER_S = 3 * JOB_HEARTBEAT_S
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler when its job was cancelled."""
+
+
+class JobStore:
+    """
+    Job records in SQLite. Claims use BEGIN IMMEDIATE, so a queued job is handed
+    to exactly one worker even when several processes poll the same file.
+    """
+    def __init__(self, db_path: str = JOB_DB_PATH):
+        self.db_path = db_path
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+        with self._connect(write=True) as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    stages TEXT NOT NULL DEFAULT '[]',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    worker TEXT,
+                    heartbeat_at REAL,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+
+    @contextmanager
+    def _connect(self, write: bool = False):
+        con = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_S, isolation_level=None)
+        con.row_factory = sqlite3.Row
+        try:
+            if write:
+                con.execute("BEGIN IMMEDIATE")
+                try:
+                    yield con
+                    con.execute("COMMIT")
+                except BaseException:
+                    con.execute("ROLLBACK")
+                    raise
+            else:
+                yield con
+        finally:
+            con.close()
+
+    def submit(self, kind: str, payload: Dict[str, Any]) -> str:
+        job_id = uuid.uuid4().hex
+        with self._connect(write=True) as con:
+            con.execute(
+                "INSERT INTO jobs (id, kind, status, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, QUEUED, json.dumps(payload), _now()),
+            )
+        logger.info("Job %s (%s) queued.", job_id, kind)
+        return job_id
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Marks the oldest queued job as running on `worker` and returns it, or None."""
+        # Idle polls only read: the write lock is taken only when there is something to claim
+        with self._connect() as con:
+            if con.execute("SELECT 1 FROM jobs WHERE status = ? LIMIT 1", (QUEUED,)).fetchone() is None:
+                return None
+        with self._connect(write=True) as con:
+            row = con.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            con.execute(
+                "UPDATE jobs SET status = ?, worker = ?, started_at = ?, heartbeat_at = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (RUNNING, worker, _now(), time.time(), row["id"]),
+            )
+            return self._as_dict(con.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone())
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as con:
+            row = con.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._as_dict(row) if row else None
+
+    def record_stage(self, job_id: str, stage: str, seconds: float):
+        with self._connect(write=True) as con:
+            stages = json.loads(con.execute("SELECT stages FROM jobs WHERE id = ?", (job_id,)).fetchone()[0])
+            stages.append({"stage": stage, "seconds": round(seconds, 3)})
+            con.execute("UPDATE jobs SET stages = ? WHERE id = ?", (json.dumps(stages), job_id))
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        """Records the outcome of a running job (no-op if it was re-queued or finished meanwhile)."""
+        with self._connect(write=True) as con:
+            con.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (status, json.dumps(result) if result is not None else None, error, _now(), job_id, RUNNING),
+            )
+
+    def requeue(self, job_id: str):
+        """Puts a job interrupted by shutdown back in the queue; the interrupted run doesn't count as an attempt."""
+        with self._connect(write=True) as con:
+            con.execute(
+                "UPDATE jobs SET status = ?, worker = NULL, stages = '[]', attempts = MAX(attempts - 1, 0) "
+                "WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING),
+            )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancels a job. Queued jobs are cancelled immediately; running jobs are flagged
+        and stop at their next stage boundary. Returns the resulting status, or None if unknown.
+        """
+        with self._connect(write=True) as con:
+            row = con.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] == QUEUED:
+                con.execute("UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?", (CANCELLED, _now(), job_id))
+                return CANCELLED
+            if row["status"] == RUNNING:
+                con.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            return row["status"]
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as con:
+            row = con.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def heartbeat(self, job_ids: List[str]):
+        if not job_ids:
+            return
+        with self._connect(write=True) as con:
+            con.executemany("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", [(time.time(), j) for j in job_ids])
+
+    def requeue_orphans(self, stale_after: float = JOB_STALE_AFTER_S, max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+        """
+        Re-queues running jobs whose heartbeat is older than `stale_after` seconds (their
+        worker crashed or was restarted mid-job). Jobs that already used `max_attempts`
+        are failed instead. Returns the number re-queued.
+        """
+        requeued = 0
+        with self._connect(write=True) as con:
+            orphans = con.execute(
+                "SELECT id, attempts FROM jobs WHERE status = ? AND heartbeat_at < ?",
+                (RUNNING, time.time() - stale_after),
+            ).fetchall()
+            for row in orphans:
+                if row["attempts"] >= max_attempts:
+                    con.execute(
+                        "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                        (FAILED, f"Worker died {row['attempts']} times while running this job.", _now(), row["id"]),
+                    )
+                else:
+                    con.execute(
+                        "UPDATE jobs SET status = ?, worker = NULL, stages = '[]' WHERE id = ?", (QUEUED, row["id"])
+                    )
+                    requeued += 1
+        return requeued
+
+    @staticmethod
+    def _as_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["stages"] = json.loads(job["stages"])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+
+class JobContext:
+    """Handed to job handlers: times stages and stops the job when it was cancelled."""
+    def __init__(self, store: JobStore, job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    async def check_cancelled(self):
+        if await asyncio.to_thread(self.store.cancel_requested, self.job_id):
+            raise JobCancelled()
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        await self.check_cancelled()
+        start = time.perf_counter()
+        yield
+        await asyncio.to_thread(self.store.record_stage, self.job_id, name, time.perf_counter() - start)
+
+
+Handler = Callable[[Dict[str, Any], JobContext], Awaitable[Any]]
+
+
+class JobRunner:
+    """
+    A bounded pool of asyncio workers in this process, claiming jobs from the shared store.
+    Handlers are async functions `(payload, ctx) -> result` registered per job kind.
+    """
+    def __init__(self, store: JobStore, handlers: Dict[str, Handler], workers: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_INTERVAL):
+        self.store = store
+        self.handlers = handlers
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+
+    async def _heartbeat(self):
+        """Keeps this process's jobs alive and rescues jobs orphaned by dead workers."""
+        while True:
+            try:
+                await asyncio.to_thread(self.store.heartbeat, list(self._running))
+                requeued = await asyncio.to_thread(self.store.requeue_orphans)
+                if requeued:
+                    logger.info("Re-queued %d job(s) orphaned by a stopped worker.", requeued)
+                    self.notify()
+            except Exception as e:
+                logger.error("Job heartbeat failed: %s", e)
+            await asyncio.sleep(JOB_HEARTBEAT_S)
+
+    async def stop(self):
+        """Stops the workers; jobs still running go back to the queue for the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def notify(self):
+        """Wakes idle workers after a submit, instead of waiting for the next poll."""
+        self._wakeup.set()
+
+    async def cancel(self, job_id: str, timeout: float = 5.0):
+        """
+        Interrupts a job running in this process right away and waits (up to `timeout`)
+        until it has recorded the cancellation. Other processes stop it at a stage boundary.
+        """
+        task = self._running.get(job_id)
+        if task:
+            task.cancel()
+            await asyncio.wait([task], timeout=timeout)
+
+    async def _work(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim, self.worker_id)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            task = asyncio.create_task(self._run(job))
+            self._running[job["id"]] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                # Shutdown: abandon the job and hand it back to the queue
+                task.cancel()
+                await asyncio.to_thread(self.store.requeue, job["id"])
+                logger.info("Job %s re-queued on shutdown.", job["id"])
+                raise
+            finally:
+                self._running.pop(job["id"], None)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_id, kind = job["id"], job["kind"]
+        handler = self.handlers.get(kind)
+        if handler is None:
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, error=f"No handler for job kind '{kind}'.")
+            return
+
+        # Everything the job logs (and the threads it starts) carries the job ID
+        request_id_var.set(job_id)
+        logger.info("Job %s (%s) started on %s.", job_id, kind, self.worker_id)
+        try:
+            result = await handler(job["payload"], JobContext(self.store, job_id))
+        except (JobCancelled, asyncio.CancelledError):
+            if not await asyncio.to_thread(self.store.cancel_requested, job_id):
+                raise
+            await asyncio.to_thread(self.store.finish, job_id, CANCELLED)
+            logger.info("Job %s cancelled.", job_id)
+        except Exception as e:
+            logger.error("Job %s failed: %s", job_id, e)
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, error=str(e))
+        else:
+            await asyncio.to_thread(self.store.finish, job_id, SUCCEEDED, result=result)
+            logger.info("Job %s succeeded.", job_id)
+
+
+def _now() -> str:
+    return datetime.utcnow().isoformat()
@@ -0,0 +1,134 @@
+"""
+In-process CPU embeddings with sentence-transformers (EMBEDDING_BACKEND=local).
+
+Instead of one HTTP round trip to Ollama per query and per ingestion window,
+the model runs inside the worker process:
+
+- `embed_documents` encodes in batches of `batch_size`.
+- Concurrent `embed_query` calls are coalesced: the first caller waits
+  `batch_wait_ms` for others to arrive, then encodes them all as one batch.
+- `runtime` picks the sentence-transformers backend: "torch", or "onnx" /
+  "openvino" for the exported (optionally quantized, via `model_file`) model.
+- `threads` caps the CPU threads the runtime uses (0 = its default).
+
+Vectors are L2-normalized. Every index records the fingerprint of the
+embeddings that built it (see vector_index.py), so an index built with one
+backend or model is never searched with vectors from another.
+"""
+import time
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger("compliance_rag.local_embeddings")
+
+
+class LocalEmbeddings(Embeddings):
+    """A sentence-transformers model on CPU, loaded on first use (see module docstring)."""
+    backend = "local"
+
+    def __init__(
+        self,
+        model: str,
+        runtime: str = "torch",
+        model_file: Optional[str] = None,
+        batch_size: int = 32,
+        threads: int = 0,
+        batch_wait_ms: float = 2.0,
+        query_prefix: str = "",
+        document_prefix: str = "",
+    ):
+        if runtime not in ("torch", "onnx", "openvino"):
+            raise ValueError(f"Unknown embedding runtime '{runtime}'. Use torch, onnx or openvino.")
+        self.model = model
+        self.runtime = runtime
+        self.model_file = model_file
+        self.batch_size = max(1, batch_size)
+        self.threads = threads
+        self.batch_wait_s = batch_wait_ms / 1000
+        self.query_prefix = query_prefix
+        self.document_prefix = document_prefix
+        self._encoder = None
+        self._encoder_lock = threading.Lock()
+        self._pending: List[Tuple[str, Future]] = []
+        self._pending_lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        """Model, runtime and model file: anything that changes the vectors."""
+        parts = [self.backend, self.model]
+        if self.runtime != "torch":
+            parts.append(self.runtime)
+        if self.model_file:
+            parts.append(self.model_file)
+        if self.query_prefix or self.document_prefix:
+            parts.append(f"prefix={self.query_prefix!r},{self.document_prefix!r}")
+        return "/".join(parts).lower()
+
+    def __repr__(self) -> str:
+        return f"LocalEmbeddings({self.fingerprint})"
+
+    def _load(self):
+        # Called with _encoder_lock held
+        if self._encoder is None:
+            from sentence_transformers import SentenceTransformer
+
+            model_kwargs = {}
+            if self.model_file:
+                model_kwargs["file_name"] = self.model_file
+            if self.threads > 0:
+                if self.runtime == "torch":
+                    import torch
+                    torch.set_num_threads(self.threads)
+                elif self.runtime == "onnx":
+                    import onnxruntime
+                    session_options = onnxruntime.SessionOptions()
+                    session_options.intra_op_num_threads = self.threads
+                    model_kwargs["session_options"] = session_options
+                else:
+                    model_kwargs["ov_config"] = {"INFERENCE_NUM_THREADS": str(self.threads)}
+
+            started = time.perf_counter()
+            self._encoder = SentenceTransformer(
+                self.model, device="cpu", backend=self.runtime, model_kwargs=model_kwargs or None
+            )
+            logger.info("Loaded embedding model %s in %.1fs.", self.fingerprint, time.perf_counter() - started)
+        return self._encoder
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        # One encode at a time: the runtime already spreads a batch over `threads` cores
+        with self._encoder_lock:
+            vectors = self._load().encode(
+                texts, batch_size=self.batch_size, normalize_embeddings=True,
+                convert_to_numpy=True, show_progress_bar=False,
+            )
+        return vectors.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        return self._encode([self.document_prefix + text for text in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        future: Future = Future()
+        with self._pending_lock:
+            self._pending.append((self.query_prefix + text, future))
+            leader = len(self._pending) == 1
+        if leader:
+            # Give concurrent queries a moment to join, then encode everything waiting
+            if self.batch_wait_s > 0:
+                time.sleep(self.batch_wait_s)
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            try:
+                vectors = self._encode([t for t, _ in batch])
+            except Exception as e:
+                for _, waiting in batch:
+                    waiting.set_exception(e)
+            else:
+                for (_, waiting), vector in zip(batch, vectors):
+                    waiting.set_result(vector)
+        return future.result()
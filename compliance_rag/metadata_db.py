@@ -1,48 +1,358 @@
-import duckdb
+import re
 import os
-from datetime import datetime
-from compliance_rag.config import METADATA_DB_PATH
+import time
+import argparse
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import duckdb
+import pandas as pd
+from langchain_core.documents import Document
+from compliance_rag.config import METADATA_DB_PATH, METADATA_LOCK_TIMEOUT_S
+
+# Column name -> DuckDB type of the 'policies' table
+POLICY_COLUMNS = {
+    "policy_id": "VARCHAR",
+    "title": "VARCHAR",
+    "owner": "VARCHAR",
+    "version": "VARCHAR",
+    "last_updated": "DATE",
+    "department": "VARCHAR",
+    "status": "VARCHAR",
+    "retention_years": "INTEGER",
+    "source_file": "VARCHAR",
+}
+
+# Columns the SQL Analyst and the retrieval filters select on
+INDEXED_COLUMNS = ("department", "status", "last_updated", "owner")
+
+# Export headers we accept besides the column names themselves (after normalization)
+COLUMN_ALIASES = {
+    "id": "policy_id",
+    "policy": "policy_id",
+    "name": "title",
+    "policy_owner": "owner",
+    "effective_date": "last_updated",
+    "updated": "last_updated",
+    "dept": "department",
+    "retention": "retention_years",
+    "file": "source_file",
+    "source": "source_file",
+}
+
+# Bulk readers by export file extension
+EXPORT_READERS = {
+    ".csv": "read_csv_auto(?, all_varchar = true)",
+    ".parquet": "read_parquet(?)",
+}
+
+# '**Department:** Human Resources' header lines, or 'department: ...' inside a '---' block
+BOLD_FIELD_RE = re.compile(r"^\*\*(.+?):\*\*\s*(.+?)\s*$")
+YAML_FIELD_RE = re.compile(r"^([A-Za-z][\w ]*):\s*(.+?)\s*$")
+
+# Sample metadata for the bundled policies in data/.
+# Dates are formatted as YYYY-MM-DD
+# source_file links each policy to its document so ingestion can tag chunks with it
+SAMPLE_DATA = [
+    ('POL-001', 'AI Usage Policy', 'Sarah Chen', '1.2', '2024-01-15', 'Engineering', 'Active', 5, 'ai_usage_policy.md'),
+    ('POL-002', 'Remote Work Policy', 'Marcus Thorne', '2.0', '2023-11-20', 'HR', 'Active', 3, 'remote_work_policy.md'),
+    ('POL-003', 'Data Classification Standard', 'Elena Rodriguez', '1.0', '2024-02-10', 'Security', 'Active', 7, 'data_classification_standard.md')
+]
+
+
+def create_policies_table(con: duckdb.DuckDBPyConnection):
+    """
+    Creates the 'policies' table and its filter indexes if they don't exist yet. Existing rows are kept,
+    and tables created by an older schema (e.g. without source_file) get the missing columns.
+    """
+    columns = ",\n".join(
+        f"{name} {dtype}{' PRIMARY KEY' if name == 'policy_id' else ''}" for name, dtype in POLICY_COLUMNS.items()
+    )
+    con.execute(f"CREATE TABLE IF NOT EXISTS policies (\n{columns}\n)")
+    for name, dtype in POLICY_COLUMNS.items():
+        con.execute(f"ALTER TABLE policies ADD COLUMN IF NOT EXISTS {name} {dtype}")
+    for column in INDEXED_COLUMNS:
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_policies_{column} ON policies ({column})")
+
+
+def upsert_policies(con: duckdb.DuckDBPyConnection, source_sql: str, params: Optional[list] = None,
+                    fill_only: bool = False) -> int:
+    """
+    Upserts the rows of `source_sql` (a SELECT yielding policy columns) into 'policies'.
+
+    Rows are deduplicated on policy_id, keeping the most recently updated one. NULL
+    values never overwrite stored ones; with `fill_only`, incoming values only fill
+    columns that are still NULL (used for document front-matter, which is less
+    authoritative than the metadata exports).
+    """
+    casts = ", ".join(f"TRY_CAST({name} AS {dtype}) AS {name}" for name, dtype in POLICY_COLUMNS.items())
+    if fill_only:
+        updates = ", ".join(f"{name} = COALESCE(policies.{name}, EXCLUDED.{name})" for name in POLICY_COLUMNS if name != "policy_id")
+    else:
+        updates = ", ".join(f"{name} = COALESCE(EXCLUDED.{name}, policies.{name})" for name in POLICY_COLUMNS if name != "policy_id")
+
+    before = con.execute("SELECT COUNT(*) FROM policies").fetchone()[0]
+    con.execute(f"""
+        INSERT INTO policies BY NAME
+        SELECT {casts} FROM ({source_sql})
+        WHERE policy_id IS NOT NULL
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY policy_id ORDER BY TRY_CAST(last_updated AS DATE) DESC NULLS LAST) = 1
+        ON CONFLICT (policy_id) DO UPDATE SET {updates}
+    """, params or [])
+    return con.execute("SELECT COUNT(*) FROM policies").fetchone()[0] - before
+
+
+def _normalize_header(name: str) -> str:
+    column = re.sub(r"[^0-9a-z]+", "_", name.strip().lower()).strip("_")
+    return COLUMN_ALIASES.get(column, column)
+
+
+def load_policy_exports(paths: Iterable[str], con: Optional[duckdb.DuckDBPyConnection] = None) -> int:
+    """
+    Bulk-loads policy metadata from CSV or Parquet exports (globs allowed, e.g. 'exports/*.csv')
+    with DuckDB's native readers, upserting on policy_id. Reports load throughput per export.
+    Returns the number of rows read.
+    """
+    own_con = con is None
+    con = con or duckdb.connect(METADATA_DB_PATH)
+    create_policies_table(con)
 
-def setup_metadata_db():
+    total_rows, total_start = 0, time.perf_counter()
+    try:
+        for path in paths:
+            ext = os.path.splitext(path)[1].lower()
+            if ext not in EXPORT_READERS:
+                raise ValueError(f"Unsupported metadata export '{path}'. Supported: {list(EXPORT_READERS)}")
+            reader = EXPORT_READERS[ext]
+
+            # Map the export's headers onto policy columns; unknown headers are ignored
+            headers = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {reader}", [path]).fetchall()]
+            mapped = {}
+            for header in headers:
+                column = _normalize_header(header)
+                if column in POLICY_COLUMNS and column not in mapped:
+                    mapped[column] = header
+            if "policy_id" not in mapped:
+                raise ValueError(f"Metadata export '{path}' has no policy_id column (headers: {headers})")
+            select = ", ".join(
+                f'"{mapped[name]}" AS {name}' if name in mapped else f"NULL AS {name}" for name in POLICY_COLUMNS
+            )
+
+            start = time.perf_counter()
+            rows = con.execute(f"SELECT COUNT(*) FROM {reader}", [path]).fetchone()[0]
+            added = upsert_policies(con, f"SELECT {select} FROM {reader}", [path])
+            elapsed = time.perf_counter() - start
+            total_rows += rows
+            print(
+                f"Loaded {path}: {rows} rows ({added} new, {rows - added} updated or duplicate) "
+                f"in {elapsed:.2f}s, {rows / max(elapsed, 1e-9):,.0f} rows/s"
+            )
+    finally:
+        if own_con:
+            con.close()
+
+    elapsed = time.perf_counter() - total_start
+    print(f"Metadata load: {total_rows} rows in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/s).")
+    return total_rows
+
+
+def parse_front_matter(text: str) -> Dict[str, str]:
+    """
+    Reads policy fields from the head of a markdown document: a '---' YAML-style block,
+    '**Field:** value' lines, and the first '# ' heading as the title. Stops at the first section.
+    """
+    fields = {}
+    lines = text.lstrip().splitlines()
+    in_block = bool(lines) and lines[0].strip() == "---"
+    for line in lines[1:] if in_block else lines:
+        stripped = line.strip()
+        if in_block:
+            if stripped == "---":
+                in_block = False
+                continue
+            match = YAML_FIELD_RE.match(stripped)
+        elif stripped.startswith("## "):
+            break
+        elif stripped.startswith("# "):
+            fields.setdefault("title", stripped[2:].strip())
+            continue
+        else:
+            match = BOLD_FIELD_RE.match(stripped)
+        if match:
+            column = _normalize_header(match.group(1))
+            if column in POLICY_COLUMNS:
+                fields[column] = match.group(2).strip().strip("'\"")
+    return fields
+
+
+def front_matter_records(docs: List[Document]) -> List[Dict[str, str]]:
+    """Policy fields from the front-matter of `docs`, each with the document's file name as source_file."""
+    records = []
+    for doc in docs:
+        # Only the first page of a PDF can carry front-matter
+        if doc.metadata.get("page", 0) != 0:
+            continue
+        fields = parse_front_matter(doc.page_content)
+        if fields:
+            records.append({**fields, "source_file": os.path.basename(doc.metadata.get("source", ""))})
+    return records
+
+
+def upsert_front_matter(con: duckdb.DuckDBPyConnection, records: List[Dict[str, str]]) -> Tuple[int, int]:
+    """
+    Upserts front-matter `records` into 'policies', filling only columns the exports left
+    empty. Records without a policy_id are matched to an existing policy by file name.
+    Returns (new policies, records skipped for lack of a policy_id).
+    """
+    if not records:
+        return 0, 0
+    frame = pd.DataFrame(records).reindex(columns=list(POLICY_COLUMNS))
+    known = con.execute(
+        "SELECT source_file, policy_id FROM policies WHERE source_file IN (SELECT UNNEST(?))",
+        [list(frame["source_file"])],
+    ).fetchall()
+    frame["policy_id"] = frame["policy_id"].fillna(frame["source_file"].map(dict(known)))
+    unmatched = int(frame["policy_id"].isna().sum())
+    con.register("front_matter", frame)
+    try:
+        added = upsert_policies(con, "SELECT * FROM front_matter", fill_only=True)
+    finally:
+        con.unregister("front_matter")
+    return added, unmatched
+
+
+def policy_tags(con: duckdb.DuckDBPyConnection, files: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """Stored policy metadata for `files`, keyed by file name, in the shape `tag_policy_metadata` expects."""
+    rows = con.execute("""
+        SELECT source_file, policy_id, department, status, CAST(last_updated AS VARCHAR)
+        FROM policies
+        WHERE source_file IN (SELECT UNNEST(?))
+    """, [sorted(set(files))]).fetchall()
+    return {
+        source_file: {"policy_id": policy_id, "department": department, "status": status, "last_updated": last_updated}
+        for source_file, policy_id, department, status, last_updated in rows
+    }
+
+
+def load_front_matter(docs: List[Document], con: Optional[duckdb.DuckDBPyConnection] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Upserts front-matter fields found in the ingested `docs` into 'policies' (see
+    `upsert_front_matter`) and returns the stored policy metadata for these files.
+    Without `con` this takes the database's write lock; ingestion instead tags chunks
+    from a `metadata_snapshot` and writes once at the end (`apply_front_matter`).
+    """
+    own_con = con is None
+    con = con or connect_metadata_db()
+    try:
+        create_policies_table(con)
+        records = front_matter_records(docs)
+        if records:
+            added, unmatched = upsert_front_matter(con, records)
+            print(
+                f"Front-matter: {len(records)} documents, {added} new policies, "
+                f"{unmatched} skipped (no policy_id and no known source_file)."
+            )
+        return policy_tags(con, (os.path.basename(d.metadata.get("source", "")) for d in docs))
+    finally:
+        if own_con:
+            con.close()
+
+
+def _retry_on_lock(open_db: Callable, path: str, timeout_s: float):
+    """Calls `open_db()` until it stops failing on a DuckDB file lock; raises after `timeout_s`."""
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            return open_db()
+        except duckdb.Error as e:
+            if "lock" not in str(e).lower():
+                raise
+            if time.monotonic() >= deadline:
+                raise RuntimeError(
+                    f"{path} stayed locked by another process for {timeout_s:.0f}s ({e}). "
+                    "Stop the API (or other ingestion) and retry, or raise METADATA_LOCK_TIMEOUT_S."
+                ) from e
+            time.sleep(0.1)
+
+
+def connect_metadata_db(path: str = METADATA_DB_PATH, read_only: bool = False,
+                        timeout_s: float = METADATA_LOCK_TIMEOUT_S) -> duckdb.DuckDBPyConnection:
+    """
+    Connects to the metadata database, retrying while another process holds a conflicting
+    lock (a writer excludes everyone; any open connection, e.g. an API worker's read-only
+    one, excludes a writer).
+    """
+    return _retry_on_lock(lambda: duckdb.connect(path, read_only=read_only), path, timeout_s)
+
+
+def metadata_snapshot(path: str = METADATA_DB_PATH,
+                      timeout_s: float = METADATA_LOCK_TIMEOUT_S) -> duckdb.DuckDBPyConnection:
+    """
+    An in-memory copy of the 'policies' table, read with one short read-only attach.
+    Ingestion merges front-matter into it window by window without locking the file.
+    """
+    snapshot = duckdb.connect()
+    create_policies_table(snapshot)
+    if os.path.exists(path):
+        attach = f"ATTACH '{path.replace(chr(39), chr(39) * 2)}' AS stored (READ_ONLY)"
+        _retry_on_lock(lambda: snapshot.execute(attach), path, timeout_s)
+        try:
+            if snapshot.execute(
+                "SELECT COUNT(*) FROM duckdb_tables() WHERE database_name = 'stored' AND table_name = 'policies'"
+            ).fetchone()[0]:
+                snapshot.execute("INSERT INTO policies BY NAME SELECT * FROM stored.policies")
+        finally:
+            snapshot.execute("DETACH stored")
+    return snapshot
+
+
+def apply_front_matter(records: List[Dict[str, str]], path: str = METADATA_DB_PATH) -> int:
+    """Writes front-matter `records` to the metadata database in one short write. Returns new policies."""
+    if not records:
+        return 0
+    con = connect_metadata_db(path)
+    try:
+        create_policies_table(con)
+        added, unmatched = upsert_front_matter(con, records)
+    finally:
+        con.close()
+    print(
+        f"Front-matter: {len(records)} documents, {added} new policies, "
+        f"{unmatched} skipped (no policy_id and no known source_file)."
+    )
+    return added
+
+
+def setup_metadata_db(export_paths: Optional[List[str]] = None):
     """
     Sets up a DuckDB database to store structured metadata for compliance policies.
     This enables the SQL Analyst agent to perform structured queries.
+
+    With `export_paths` (CSV/Parquet), the exports are bulk-loaded; otherwise the
+    sample metadata for the bundled policies is used. Either way rows are upserted,
+    so re-running never wipes metadata loaded earlier.
     """
     print(f"--- Initializing Metadata Database at {METADATA_DB_PATH} ---")
-    
+
     # Connect to DuckDB (creates the file if it doesn't exist)
     con = duckdb.connect(METADATA_DB_PATH)
-    
+
     # 1. Create the policies table
-    con.execute("""
-        CREATE OR REPLACE TABLE policies (
-            policy_id VARCHAR PRIMARY KEY,
-            title VARCHAR,
-            owner VARCHAR,
-            version VARCHAR,
-            last_updated DATE,
-            department VARCHAR,
-            status VARCHAR,
-            retention_years INTEGER
-        )
-    """)
-    
-    # 2. Insert sample metadata
-    # Dates are formatted as YYYY-MM-DD
-    sample_data = [
-        ('POL-001', 'AI Usage Policy', 'Sarah Chen', '1.2', '2024-01-15', 'Engineering', 'Active', 5),
-        ('POL-002', 'Remote Work Policy', 'Marcus Thorne', '2.0', '2023-11-20', 'HR', 'Active', 3),
-        ('POL-003', 'Data Classification Standard', 'Elena Rodriguez', '1.0', '2024-02-10', 'Security', 'Active', 7)
-    ]
-    
-    for record in sample_data:
-        con.execute("INSERT INTO policies VALUES (?, ?, ?, ?, ?, ?, ?, ?)", record)
-    
+    create_policies_table(con)
+
+    # 2. Load metadata
+    if export_paths:
+        load_policy_exports(export_paths, con)
+    else:
+        con.register("sample", pd.DataFrame(SAMPLE_DATA, columns=list(POLICY_COLUMNS)))
+        upsert_policies(con, "SELECT * FROM sample")
+        con.unregister("sample")
+
     # 3. Verify
     result = con.execute("SELECT COUNT(*) FROM policies").fetchone()
-    print(f"Successfully created 'policies' table with {result[0]} records.")
-    
+    print(f"Successfully loaded 'policies' table with {result[0]} records.")
+
     con.close()
 
 if __name__ == "__main__":
-    setup_metadata_db()
+    parser = argparse.ArgumentParser(description="Create or update the policy metadata database.")
+    parser.add_argument("exports", nargs="*", help="CSV/Parquet metadata exports (globs allowed)")
+    setup_metadata_db(parser.parse_args().exports)
@@ -0,0 +1,119 @@
+"""
+Cross-encoder reranking of vector search candidates.
+
+With the SOP's `rerank_enabled`, the researcher over-fetches
+`rerank_candidates` chunks from FAISS, scores each (query, chunk) pair with a
+small CPU cross-encoder (RERANK_MODEL) and passes only the best
+`researcher_retriever_k` to the synthesizer, so recall no longer has to be
+bought with a longer synthesizer prompt.
+
+Pairs are scored in batches of RERANK_BATCH_SIZE, one batch at a time per
+process (the model already uses RERANK_THREADS cores). Scores are cached by a
+hash of (query, chunk text), so repeated questions and overlapping candidate
+sets skip the model. Each rerank is timed as a "rerank" span (/metrics and
+query timings).
+
+sentence-transformers is only imported when reranking is first used; without
+it the candidates are cut to the top k in FAISS order and a warning is logged.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from compliance_rag.config import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_CACHE_SIZE, RERANK_THREADS
+from compliance_rag.tracing import span
+
+logger = logging.getLogger("compliance_rag.rerank")
+
+
+def pair_key(query: str, text: str) -> str:
+    return hashlib.sha1(f"{query}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class CrossEncoderReranker:
+    """Scores (query, chunk) pairs with a cross-encoder; loaded on first use."""
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 cache_size: int = RERANK_CACHE_SIZE, threads: int = RERANK_THREADS):
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self.threads = threads
+        self._model = None
+        self._unavailable: Optional[str] = None
+        self._model_lock = threading.Lock()
+        self._cache: "OrderedDict[str, float]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self):
+        # Double-checked: once loaded (or marked unavailable) the model lock is
+        # never taken here, so cache hits don't wait on a running predict.
+        if self._model is not None or self._unavailable is not None:
+            return self._model
+        with self._model_lock:
+            if self._model is None and self._unavailable is None:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    if self.threads > 0:
+                        import torch
+                        torch.set_num_threads(self.threads)
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                    logger.info("Loaded cross-encoder %s for reranking.", self.model_name)
+                except Exception as e:
+                    self._unavailable = str(e)
+                    logger.warning("Reranking disabled; cross-encoder %s unavailable (%s).", self.model_name, e)
+        return self._model
+
+    def score(self, query: str, texts: List[str]) -> List[float]:
+        """Relevance score per text (higher is better); cached pairs skip the model."""
+        keys = [pair_key(query, text) for text in texts]
+        scores: List[Optional[float]] = []
+        with self._cache_lock:
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                scores.append(score)
+            missing = [i for i, s in enumerate(scores) if s is None]
+            self.hits += len(texts) - len(missing)
+            self.misses += len(missing)
+        if missing:
+            model = self._load()
+            with self._model_lock:
+                predicted = model.predict(
+                    [(query, texts[i]) for i in missing], batch_size=self.batch_size, show_progress_bar=False
+                )
+            with self._cache_lock:
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, docs: List[Document], top_n: int) -> List[Tuple[Document, float]]:
+        """The `top_n` of `docs` by cross-encoder score (FAISS order if the model can't be loaded)."""
+        if not docs:
+            return []
+        if self._load() is None:
+            return [(doc, 0.0) for doc in docs[:top_n]]
+        with span("rerank", self.model_name) as attrs:
+            scores = self.score(query, [doc.page_content for doc in docs])
+            attrs["candidates"] = len(docs)
+        ranked = sorted(zip(docs, scores), key=lambda pair: pair[1], reverse=True)
+        return ranked[:top_n]
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "unavailable": self._unavailable,
+            "cached_pairs": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
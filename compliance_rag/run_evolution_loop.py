@@ -1,122 +1,223 @@
 """
 Self-Improvement Evolution Loop.
-Runs the agent, evaluates performance, diagnoses failures, evolves prompts.
-Autonomous loop until all scores >= threshold or max iterations reached.
+Runs the agent over the golden set, evaluates performance, diagnoses failures, evolves prompts.
+Autonomous loop until the golden-set means pass their thresholds or max iterations reached.
+
+By default one candidate is evolved per cycle and always replaces the current SOP.
+With --population N the Architect proposes N candidates per generation from one
+diagnosis; they are evaluated concurrently (sharing EVAL_CONCURRENCY) and the
+--survivors best are kept by Pareto dominance over the evaluation vector.
+The latency behind the performance dimension excludes LLM scheduler queue
+wait, so candidates aren't ranked on which others they ran alongside; with
+--isolated each candidate is evaluated on its own, under the same load as the
+parent, for the strictest latency comparison (at N times the wall time).
+
+Usage:
+    python -m compliance_rag.run_evolution_loop
+    python -m compliance_rag.run_evolution_loop --population 4 --survivors 2
+    python -m compliance_rag.run_evolution_loop --population 4 --survivors 2 --isolated
 """
-import re
 import asyncio
 import logging
-from compliance_rag.graph.workflow import create_compliance_graph
+import argparse
+from typing import List, Optional, Tuple
+from compliance_rag.config import GOLDEN_SET_PATH
 from compliance_rag.core.gene_pool import SOPGenePool
-from compliance_rag.evaluation.judge import evaluate_run
-from compliance_rag.agents.evolution import diagnose_failure, evolve_sop
-from compliance_rag.utils.logger import setup_logger
+from compliance_rag.core.sop import ComplianceSOP
+from compliance_rag.evaluation.models import GoldenSetReport
+from compliance_rag.evaluation.pareto import select_survivors
+from compliance_rag.evaluation.runner import GoldenSetRunner, load_golden_set
+from compliance_rag.agents.evolution import diagnose_failure, evolve_sop, propose_candidates
+from compliance_rag.utils.logger import setup_logger, payload
 
 # Setup logging
 setup_logger("compliance_rag", level="INFO")
 logger = logging.getLogger("compliance_rag.evolution_loop")
 
-QUERY = "Can I use ChatGPT for personal work?"
-THRESHOLD = 3.75
 MAX_ITERATIONS = 5
 
 
+def require_golden_set():
+    """The golden set; evolution has nothing to diagnose without questions, so an empty one is fatal."""
+    golden_set = load_golden_set()
+    if not golden_set:
+        raise SystemExit(f"The golden set at {GOLDEN_SET_PATH} has no questions; add some before running evolution.")
+    return golden_set
+
+
 async def run_loop():
     logger.info("=" * 60)
     logger.info("Starting Evolution Loop")
     logger.info("=" * 60)
-    
-    # 1. Load the latest 'Gene' (SOP)
+
+    # 1. Load the latest 'Gene' (SOP) and the golden set it is judged on
     gene_pool = SOPGenePool()
     current_sop = gene_pool.get_latest_sop()
     version_id = gene_pool.get_latest_version_id()
-    
-    logger.info(f"Loaded SOP Version: {version_id}")
-    
+    golden_set = require_golden_set()
+    runner = GoldenSetRunner(gene_pool)
+
+    logger.info("Loaded SOP Version: %s (%d golden-set questions)", version_id, len(golden_set))
+
     iteration = 0
-    
+
     while iteration < MAX_ITERATIONS:
         iteration += 1
-        logger.info(f"Evolution Cycle {iteration}/{MAX_ITERATIONS} (SOP: {version_id})")
-        
-        # 2. Run the Agent Network
-        logger.info(f"Running Agent with Query: '{QUERY}'")
-        graph = create_compliance_graph()
-        initial_state = {
-            "initial_request": QUERY,
-            "plan": None,
-            "agent_outputs": [],
-            "final_response": None,
-            "sop": current_sop
-        }
-        
+        logger.info("Evolution Cycle %d/%d (SOP: %s)", iteration, MAX_ITERATIONS, version_id)
+
+        # 2. Run the Agent Network and the Judge over the golden set
+        # (questions already evaluated for this version come from the cache)
         try:
-            final_state = await graph.ainvoke(initial_state)
+            report = await runner.run(current_sop, version_id, golden_set)
         except Exception as e:
-            logger.error(f"Agent network failed: {e}")
+            logger.error("Golden-set evaluation failed: %s", e)
             logger.info("Skipping to next iteration...")
             continue
-            
-        response = final_state["final_response"]
-        context = "\n".join([o.findings for o in final_state["agent_outputs"]])
-        
-        logger.info("-" * 50)
-        logger.info(f"Agent Response:\n{response}")
-        logger.info("-" * 50)
-        
-        # 3. Evaluate the Run (The Judge)
-        # FIXED: Correct argument order is (request, response, context)
-        logger.info("Evaluating Performance...")
-        try:
-            eval_result = evaluate_run(QUERY, response, context)
-        except Exception as e:
-            logger.error(f"Evaluation failed: {e}")
-            continue
-        
-        scores = {
-            "Accuracy": eval_result.accuracy.score,
-            "Citations": eval_result.citation_fidelity.score,
-            "Completeness": eval_result.completeness.score,
-            "Tone": eval_result.regulatory_compliance.score
-        }
-        
-        logger.info("--- Evaluation Scores ---")
-        for dim, score in scores.items():
-            logger.info(f"  {dim}: {score}/5")
-        
-        # 4. Evolution Logic
-        all_pass = all(s >= THRESHOLD for s in scores.values())
-        
-        if all_pass:
-            logger.info(f"SUCCESS! All scores >= {THRESHOLD}. Stopping evolution.")
+
+        logger.info("--- Golden-Set Means ---")
+        for dim, score in report.means.items():
+            logger.info("  %s: %s", dim, score)
+
+        # 3. Evolution Logic
+        # Passing is decided on the aggregate, so one lucky question can't carry a version
+        if report.passed:
+            logger.info("SUCCESS! Golden-set means meet every threshold. Stopping evolution.")
             break
-        
-        logger.info(f"Sub-Optimal (< {THRESHOLD}). Initiating Evolution Protocol...")
-        
-        # A. Diagnose
-        diagnosis = diagnose_failure(QUERY, response, eval_result)
-        logger.info(f"Diagnosis: {diagnosis[:200]}")
-        
+
+        logger.info("Sub-Optimal (%s). Initiating Evolution Protocol...", "; ".join(report.failures))
+
+        # A. Diagnose, on the question that did worst
+        worst = report.worst_item()
+        if worst is None:
+            logger.warning("No question could be judged (%d failed); retrying the evaluation.", len(report.failed_items))
+            continue
+        logger.info("Worst question: [%s] %s", worst.item_id, payload(worst.question))
+        diagnosis = diagnose_failure(worst.question, worst.response, worst.evaluation, report.failures)
+        logger.info("Diagnosis: %s", payload(diagnosis, 200))
+
         # B. Evolve
         logger.info("Evolving SOP Prompts...")
         new_sop = evolve_sop(current_sop, diagnosis)
-        
+
         # C. Save
-        match = re.search(r"v(\d+)", version_id)
-        next_version_num = int(match.group(1)) + 1 if match else 1
-        version_id = f"v{next_version_num}"
-        
-        gene_pool.add_sop(version_id, new_sop)
+        version_id = gene_pool.add_next_sop(new_sop, parent=version_id)
         current_sop = new_sop
-        logger.info(f"Evolution Successful! Saved genome as '{version_id}'. Looping...")
-            
+        logger.info("Evolution Successful! Saved genome as '%s'. Looping...", version_id)
+
     if iteration >= MAX_ITERATIONS:
-        logger.warning(f"Max iterations ({MAX_ITERATIONS}) reached without meeting target.")
-    
+        logger.warning("Max iterations (%d) reached without meeting target.", MAX_ITERATIONS)
+
+    logger.info("=" * 60)
+    logger.info("Evolution Loop Complete")
+    logger.info("=" * 60)
+
+
+Member = Tuple[str, ComplianceSOP, GoldenSetReport]
+
+
+async def evaluate_member(runner: GoldenSetRunner, sop: ComplianceSOP, version: str,
+                          golden_set) -> Optional[GoldenSetReport]:
+    """The golden-set report of one version, or None (logged) if the evaluation itself failed."""
+    try:
+        return await runner.run(sop, version, golden_set)
+    except Exception as e:
+        logger.error("Golden-set evaluation of %s failed: %s", version, e)
+        return None
+
+
+def best_passing(members: List[Member]) -> Optional[Member]:
+    """The passing member with the highest summed evaluation vector, if any passes."""
+    passing = [m for m in members if m[2].passed]
+    return max(passing, key=lambda m: sum(m[2].to_vector())) if passing else None
+
+
+async def run_population_loop(population_size: int, survivors: int, isolated: bool = False):
+    logger.info("=" * 60)
+    logger.info("Starting Population Evolution (%d candidates/generation, %d survivors)", population_size, survivors)
+    logger.info("=" * 60)
+
+    gene_pool = SOPGenePool()
+    golden_set = require_golden_set()
+    runner = GoldenSetRunner(gene_pool)
+
+    version_id = gene_pool.get_latest_version_id()
+    current_sop = gene_pool.get_latest_sop()
+    report = await evaluate_member(runner, current_sop, version_id, golden_set)
+    if report is None:
+        logger.error("Cannot start evolution without an evaluation of %s.", version_id)
+        return
+    population: List[Member] = [(version_id, current_sop, report)]
+    best = best_passing(population)
+
+    for generation in range(1, MAX_ITERATIONS + 1):
+        if best:
+            break
+
+        # Survivors take turns as the parent, so every trade-off on the front gets explored
+        parent_version, parent_sop, parent_report = population[(generation - 1) % len(population)]
+        logger.info("Generation %d/%d: parent %s (%s)", generation, MAX_ITERATIONS, parent_version,
+                    "; ".join(parent_report.failures))
+
+        # A. Diagnose once, on the parent's worst question
+        worst = parent_report.worst_item()
+        if worst is None:
+            logger.warning("No question of %s could be judged (%d failed); skipping generation.",
+                           parent_version, len(parent_report.failed_items))
+            continue
+        diagnosis = await asyncio.to_thread(
+            diagnose_failure, worst.question, worst.response, worst.evaluation, parent_report.failures
+        )
+        logger.info("Diagnosis: %s", payload(diagnosis, 200))
+
+        # B. Propose N candidates and save them, so their evaluations land in the lineage
+        candidates = await asyncio.to_thread(propose_candidates, parent_sop, diagnosis, population_size)
+        if not candidates:
+            logger.warning("No candidates proposed; skipping generation.")
+            continue
+        versions = [gene_pool.add_next_sop(sop, parent=parent_version) for sop in candidates]
+
+        # C. Evaluate all candidates at once; they share the runner's concurrency limit, so
+        # a generation takes (N x questions) / EVAL_CONCURRENCY runs instead of N in series.
+        # Scored latency leaves out scheduler queue wait (evaluation/performance.py), the part
+        # that grows with the number of candidates; --isolated removes the sharing altogether.
+        # A candidate whose evaluation failed stays in the gene pool but can't compete.
+        if isolated:
+            reports = [await evaluate_member(runner, sop, v, golden_set) for sop, v in zip(candidates, versions)]
+        else:
+            reports = await asyncio.gather(*(
+                evaluate_member(runner, sop, v, golden_set) for sop, v in zip(candidates, versions)
+            ))
+        pool = population + [(v, sop, r) for v, sop, r in zip(versions, candidates, reports) if r is not None]
+
+        # D. Stop on any passing member before pruning, so a passing candidate can't be
+        # dropped by Pareto selection in favour of a failing one that scores higher elsewhere
+        best = best_passing(pool)
+        if best:
+            break
+
+        # E. Select survivors by Pareto dominance over (accuracy, citations, completeness, tone, performance)
+        population = [pool[i] for i in select_survivors([m[2].to_vector() for m in pool], survivors)]
+        for v, _, report in population:
+            logger.info("  survivor %s: %s", v, [round(x, 2) for x in report.to_vector()])
+
+    if best:
+        logger.info("SUCCESS! %s meets every threshold. Stopping evolution.", best[0])
+    else:
+        logger.warning("Max generations (%d) reached without meeting target.", MAX_ITERATIONS)
+
     logger.info("=" * 60)
     logger.info("Evolution Loop Complete")
     logger.info("=" * 60)
 
 
 if __name__ == "__main__":
-    asyncio.run(run_loop())
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--population", type=int, default=1, help="Candidates proposed per generation")
+    parser.add_argument("--survivors", type=int, default=2, help="Candidates kept per generation (population mode)")
+    parser.add_argument("--isolated", action="store_true", help="Evaluate candidates one at a time (population mode)")
+    args = parser.parse_args()
+
+    if args.population > 1:
+        asyncio.run(run_population_loop(args.population, max(1, args.survivors), args.isolated))
+    else:
+        asyncio.run(run_loop())
@@ -0,0 +1,421 @@
+"""
+Priority-aware admission control for LLM and embedding calls.
+
+Every model in `llm_config` is wrapped so its calls pass through one
+`LLMScheduler` per process. Calls are grouped into lanes by backend and model
+(e.g. "ollama/qwen2.5"); each lane admits at most its configured number of
+concurrent calls and queues the rest.
+
+Queued calls belong to a priority class (interactive, batch, evolution), taken
+from the caller's context (`llm_priority`). When a slot frees up, the lane picks
+the next class by weighted fair queuing: every class gets a share of the slots
+proportional to its weight, so an interactive request arriving behind a burst of
+evolution calls waits for at most one slot, while background classes still make
+progress. Queue waits are recorded per class, and as `llm_queue` spans (tracing.py).
+
+Limits are per process unless the scheduler is given a `SharedAdmission` pool
+(admission.py): then slots come from a pool shared by every process, and a
+per-lane pump thread takes them for this process's queue, one call at a time in
+the same fair order, competing with the other processes' queued calls by class.
+"""
+import time
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from compliance_rag.tracing import record
+
+if TYPE_CHECKING:
+    from compliance_rag.admission import SharedAdmission
+
+logger = logging.getLogger("compliance_rag.scheduler")
+
+INTERACTIVE, BATCH, EVOLUTION = "interactive", "batch", "evolution"
+PRIORITY_CLASSES = (INTERACTIVE, BATCH, EVOLUTION)
+
+# Calls made outside any llm_priority() block are treated as background work
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar("llm_priority", default=BATCH)
+
+# Queue-wait samples kept per class for percentiles
+WAIT_SAMPLES = 2048
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """Runs the enclosed LLM calls (including threads started with a copied context) in `priority`."""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown LLM priority '{priority}'. Allowed: {PRIORITY_CLASSES}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def prioritized(priority: str):
+    """Decorator form of `llm_priority` for request handlers and job handlers."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def run_async(*args, **kwargs):
+                with llm_priority(priority):
+                    return await func(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with llm_priority(priority):
+                return func(*args, **kwargs)
+        return run
+    return decorate
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """Parses 'ollama=2,openai=16,ollama/nomic-embed-text=4' into a lane limit mapping."""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        key, _, value = item.partition("=")
+        if not value.strip().isdigit() or int(value) < 1:
+            raise ValueError(f"Invalid LLM concurrency limit '{item}' (expected name=N with N >= 1)")
+        limits[key.strip().lower()] = int(value)
+    return limits
+
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    """Parses 'interactive=8,batch=2,evolution=1' into class weights."""
+    weights = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip().lower()
+        if name not in PRIORITY_CLASSES:
+            raise ValueError(f"Unknown LLM priority '{name}'. Allowed: {PRIORITY_CLASSES}")
+        weights[name] = float(value)
+        if weights[name] <= 0:
+            raise ValueError(f"LLM priority weight for '{name}' must be positive")
+    return weights
+
+
+def lane_key(model: Any) -> str:
+    """'backend/model' for a LangChain chat or embedding model, e.g. 'ollama/llama3.1'."""
+    cls = type(model).__name__.lower()
+    backend = getattr(model, "backend", None) or ("ollama" if "ollama" in cls else "openai" if "openai" in cls else cls)
+    name = getattr(model, "model", None) or getattr(model, "model_name", None) or "default"
+    return f"{backend}/{name}".lower()
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued", "wait", "granted", "lease", "event", "loop", "future")
+
+    def __init__(self, priority: str, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.enqueued = time.perf_counter()
+        self.wait = 0.0
+        self.granted = False
+        self.lease: Optional[int] = None
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def wake(self):
+        self.granted = True
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _Lane:
+    """Concurrency slots of one backend/model with a fair queue per priority class."""
+    def __init__(self, limit: int, lock: threading.Lock):
+        self.limit = limit
+        self.active = 0
+        self.queues: Dict[str, deque] = {p: deque() for p in PRIORITY_CLASSES}
+        # Start-time fair queuing: a class's virtual time advances by 1/weight per admitted call
+        self.vtime: Dict[str, float] = {p: 0.0 for p in PRIORITY_CLASSES}
+        self.clock = 0.0
+        self.admitted = 0
+        # Shared admission only: leases to give back, and the pump's wake-up on queue changes
+        self.releases: List[int] = []
+        self.changed = threading.Condition(lock)
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+
+class LLMScheduler:
+    """
+    Per-process admission control for model calls (see module docstring).
+    `limits` maps 'backend' or 'backend/model' to a max concurrency; model entries
+    override their backend's, and lanes without either use `default_limit`.
+    Limits are per replica: a model served by an endpoint pool of N replicas gets N times the slots.
+    With `shared`, the limits hold across every process using the same pool.
+    """
+    def __init__(self, limits: Optional[Dict[str, int]] = None, default_limit: int = 4,
+                 weights: Optional[Dict[str, float]] = None, shared: Optional["SharedAdmission"] = None):
+        self.limits = {k.lower(): v for k, v in (limits or {}).items()}
+        self.default_limit = default_limit
+        self.weights = {INTERACTIVE: 8.0, BATCH: 2.0, EVOLUTION: 1.0, **(weights or {})}
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._lanes: Dict[str, _Lane] = {}
+        self._replicas: Dict[str, int] = {}
+        self._waits: Dict[str, deque] = {p: deque(maxlen=WAIT_SAMPLES) for p in PRIORITY_CLASSES}
+        self._totals: Dict[str, Dict[str, float]] = {
+            p: {"calls": 0, "queued_calls": 0, "wait_s": 0.0, "max_wait_s": 0.0} for p in PRIORITY_CLASSES
+        }
+
+    def limit_for(self, key: str) -> int:
+        limit = self.limits.get(key) or self.limits.get(key.split("/", 1)[0]) or self.default_limit
+        return limit * self._replicas.get(key, 1)
+
+    def _lane(self, key: str) -> _Lane:
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = _Lane(self.limit_for(key), self._lock)
+            if self.shared:
+                threading.Thread(target=self._pump, args=(key,), name=f"llm-admission-{key}", daemon=True).start()
+        return lane
+
+    # ── Admission ────────────────────────────────────────────
+
+    def _enqueue(self, key: str, waiter: _Waiter) -> bool:
+        """Takes a free slot (True) or queues `waiter` (False). Caller holds the lock."""
+        lane = self._lane(key)
+        if lane.active < lane.limit and not lane.queued() and not self.shared:
+            lane.active += 1
+            self._admit(lane, waiter.priority)
+            self._record(waiter)
+            return True
+        if not lane.queues[waiter.priority]:
+            # A class returning from idle doesn't get credit for the time it wasn't queued
+            lane.vtime[waiter.priority] = max(lane.vtime[waiter.priority], lane.clock)
+        lane.queues[waiter.priority].append(waiter)
+        lane.changed.notify()
+        return False
+
+    def _admit(self, lane: _Lane, priority: str):
+        lane.clock = max(lane.clock, lane.vtime[priority])
+        lane.vtime[priority] = lane.clock + 1.0 / self.weights[priority]
+        lane.admitted += 1
+
+    @staticmethod
+    def _next_class(lane: _Lane) -> Optional[str]:
+        candidates = [p for p in PRIORITY_CLASSES if lane.queues[p]]
+        return min(candidates, key=lambda p: lane.vtime[p]) if candidates else None
+
+    def _grant(self, lane: _Lane, lease: Optional[int] = None) -> bool:
+        """Admits the next waiter by virtual time, if any. Caller holds the lock."""
+        priority = self._next_class(lane)
+        if priority is None:
+            return False
+        waiter = lane.queues[priority].popleft()
+        lane.active += 1
+        self._admit(lane, priority)
+        self._record(waiter)
+        waiter.lease = lease
+        waiter.wake()
+        return True
+
+    def _release(self, key: str, waiter: _Waiter):
+        """
+        Frees `waiter`'s slot and hands it to the next waiter by virtual time, or with
+        shared admission gives the lease back to the pool. Caller holds the lock.
+        """
+        lane = self._lanes[key]
+        lane.active -= 1
+        if self.shared:
+            lane.releases.append(waiter.lease)
+            lane.changed.notify()
+            return
+        while lane.active < lane.limit and self._grant(lane):
+            pass
+
+    def _withdraw(self, key: str, waiter: _Waiter):
+        """Removes an abandoned waiter, or gives back the slot it was granted meanwhile."""
+        with self._lock:
+            if waiter.granted:
+                self._release(key, waiter)
+            else:
+                self._lanes[key].queues[waiter.priority].remove(waiter)
+
+    def _pump(self, key: str):
+        """
+        Shared admission: takes slots of lane `key` from the pool for this process's
+        queued calls and returns released ones. The process's waiting row in the pool
+        always carries the class of its next queued call, and is withdrawn when the
+        queue empties. Runs for the life of the process.
+        """
+        lane = self._lanes[key]
+        waiting = False
+        while True:
+            with self._lock:
+                while not (lane.queued() or lane.releases or waiting):
+                    lane.changed.wait()
+                releases, lane.releases = lane.releases, []
+                priority = self._next_class(lane)
+                limit = self.limit_for(key)
+            try:
+                self.shared.release(releases)
+                releases = []
+                if priority is None:
+                    self.shared.cancel(key)
+                    waiting = False
+                    continue
+                lease = self.shared.acquire(key, priority, limit, self.weights[priority])
+            except Exception:
+                logger.exception("Shared LLM admission failed for lane %s; retrying.", key)
+                with self._lock:
+                    lane.releases.extend(releases)
+                time.sleep(self.shared.poll_s)
+                continue
+
+            with self._lock:
+                waiting = lease is None
+                if lease is not None:
+                    if not self._grant(lane, lease):
+                        lane.releases.append(lease)  # the call was abandoned meanwhile
+                elif not lane.releases:
+                    lane.changed.wait(self.shared.poll_s)
+
+    def _record(self, waiter: _Waiter):
+        wait = waiter.wait = time.perf_counter() - waiter.enqueued
+        totals = self._totals[waiter.priority]
+        totals["calls"] += 1
+        totals["wait_s"] += wait
+        totals["max_wait_s"] = max(totals["max_wait_s"], wait)
+        if wait > 0.001:
+            totals["queued_calls"] += 1
+        self._waits[waiter.priority].append(wait)
+        waiter.granted = True
+
+    @contextmanager
+    def slot(self, key: str, priority: Optional[str] = None):
+        """Holds one concurrency slot of lane `key` for the enclosed (blocking) call."""
+        waiter = _Waiter(priority or current_priority())
+        with self._lock:
+            admitted = self._enqueue(key, waiter)
+        if not admitted:
+            try:
+                waiter.event.wait()
+            except BaseException:
+                self._withdraw(key, waiter)
+                raise
+        record("llm_queue", key, waiter.wait)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(key, waiter)
+
+    @asynccontextmanager
+    async def aslot(self, key: str, priority: Optional[str] = None):
+        """Async `slot`: queued coroutines wait without blocking the event loop."""
+        waiter = _Waiter(priority or current_priority(), loop=asyncio.get_running_loop())
+        with self._lock:
+            admitted = self._enqueue(key, waiter)
+        if not admitted:
+            try:
+                await waiter.future
+            except BaseException:
+                self._withdraw(key, waiter)
+                raise
+        record("llm_queue", key, waiter.wait)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._release(key, waiter)
+
+    def wrap(self, model: Any) -> "ScheduledModel":
+        scheduled = ScheduledModel(model, self)
+        replicas = getattr(model, "replica_count", 1)
+        with self._lock:
+            self._replicas[scheduled.lane] = max(self._replicas.get(scheduled.lane, 1), replicas)
+            if scheduled.lane in self._lanes:
+                self._lanes[scheduled.lane].limit = self.limit_for(scheduled.lane)
+        return scheduled
+
+    # ── Metrics ──────────────────────────────────────────────
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue-wait metrics per priority class and current occupancy per lane."""
+        def pct(values: List[float], q: float) -> float:
+            return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 2) if values else 0.0
+
+        with self._lock:
+            classes = {}
+            for p in PRIORITY_CLASSES:
+                waits = sorted(self._waits[p])
+                totals = self._totals[p]
+                classes[p] = {
+                    "weight": self.weights[p],
+                    "calls": int(totals["calls"]),
+                    "queued_calls": int(totals["queued_calls"]),
+                    "waiting": sum(len(lane.queues[p]) for lane in self._lanes.values()),
+                    "wait_ms_mean": round(totals["wait_s"] / totals["calls"] * 1000, 2) if totals["calls"] else 0.0,
+                    "wait_ms_p50": pct(waits, 0.5),
+                    "wait_ms_p95": pct(waits, 0.95),
+                    "wait_ms_max": round(totals["max_wait_s"] * 1000, 2),
+                }
+            lanes = {
+                key: {"limit": lane.limit, "active": lane.active, "queued": lane.queued(), "admitted": lane.admitted}
+                for key, lane in self._lanes.items()
+            }
+        stats = {"classes": classes, "lanes": lanes}
+        if self.shared:
+            stats["shared"] = self.shared.snapshot()
+        return stats
+
+
+class ScheduledModel:
+    """
+    Wraps a LangChain chat or embedding model so `invoke`/`embed_*` (and their async
+    variants) run inside a scheduler slot. Everything else is delegated unchanged.
+    """
+    def __init__(self, model: Any, scheduler: LLMScheduler):
+        self.wrapped = model
+        self.scheduler = scheduler
+        self.lane = lane_key(model)
+
+    def __getattr__(self, name: str):
+        return getattr(self.wrapped, name)
+
+    def __repr__(self) -> str:
+        return f"ScheduledModel({self.lane})"
+
+    def invoke(self, *args, **kwargs):
+        with self.scheduler.slot(self.lane):
+            return self.wrapped.invoke(*args, **kwargs)
+
+    async def ainvoke(self, *args, **kwargs):
+        async with self.scheduler.aslot(self.lane):
+            return await self.wrapped.ainvoke(*args, **kwargs)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self.scheduler.slot(self.lane):
+            return self.wrapped.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with self.scheduler.slot(self.lane):
+            return self.wrapped.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        async with self.scheduler.aslot(self.lane):
+            return await self.wrapped.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        async with self.scheduler.aslot(self.lane):
+            return await self.wrapped.aembed_query(text)
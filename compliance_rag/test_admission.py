@@ -0,0 +1,161 @@
+import os
+import time
+import asyncio
+import tempfile
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from compliance_rag.admission import SharedAdmission
+from compliance_rag.scheduler import LLMScheduler, llm_priority, INTERACTIVE, BATCH, EVOLUTION
+
+# Worker processes are spawned, so they share nothing with the test but the admission database
+CONTEXT = multiprocessing.get_context("spawn")
+LIMIT = 2
+
+
+class SleepyModel:
+    """Looks like a ChatOllama model to the scheduler; records when each call starts and ends."""
+    model = "llama3.1"
+    backend = "ollama"
+
+    def __init__(self, seconds: float, events):
+        self.seconds = seconds
+        self.events = events
+
+    def invoke(self, label):
+        self.events.put(("start", label, time.time()))
+        time.sleep(self.seconds)
+        self.events.put(("end", label, time.time()))
+        return label
+
+    async def ainvoke(self, label):
+        self.events.put(("start", label, time.time()))
+        await asyncio.sleep(self.seconds)
+        self.events.put(("end", label, time.time()))
+        return label
+
+
+def worker(path: str, events, priority: str, calls: int, seconds: float, at: float = 0.0):
+    """One API worker or job process: `calls` concurrent calls of one class, from time `at` on."""
+    scheduler = LLMScheduler({"ollama": LIMIT}, shared=SharedAdmission(path, poll_s=0.01))
+    model = scheduler.wrap(SleepyModel(seconds, events))
+    time.sleep(max(0.0, at - time.time()))
+
+    def call(i):
+        with llm_priority(priority):
+            return model.invoke(f"{priority}-{os.getpid()}-{i}")
+
+    with ThreadPoolExecutor(max_workers=calls) as executor:
+        list(executor.map(call, range(calls)))
+
+
+def async_worker(path: str, events, priority: str, calls: int, seconds: float):
+    scheduler = LLMScheduler({"ollama": LIMIT}, shared=SharedAdmission(path, poll_s=0.01))
+    model = scheduler.wrap(SleepyModel(seconds, events))
+
+    async def call(i):
+        with llm_priority(priority):
+            return await model.ainvoke(f"{priority}-{os.getpid()}-{i}")
+
+    async def run():
+        await asyncio.gather(*(call(i) for i in range(calls)))
+
+    asyncio.run(run())
+
+
+def hold_and_die(path: str):
+    """Takes the only slot and exits without giving it back."""
+    assert SharedAdmission(path).acquire("ollama/llama3.1", BATCH, 1, 2.0) is not None
+    os._exit(0)
+
+
+def collect(events, processes):
+    for p in processes:
+        p.join(timeout=60)
+        assert p.exitcode == 0, f"worker exited with {p.exitcode}"
+    collected = []
+    while not events.empty():
+        collected.append(events.get())
+    return sorted(collected, key=lambda e: e[2])
+
+
+def max_concurrency(events) -> int:
+    active = peak = 0
+    for kind, _, _ in events:
+        active += 1 if kind == "start" else -1
+        peak = max(peak, active)
+    return peak
+
+
+def test_limit_holds_across_processes():
+    print("--- The lane limit holds across 3 worker processes (threads and coroutines) ---")
+    path = os.path.join(tempfile.mkdtemp(), "admission.db")
+    events = CONTEXT.Queue()
+    processes = [
+        CONTEXT.Process(target=worker, args=(path, events, BATCH, 6, 0.05)),
+        CONTEXT.Process(target=worker, args=(path, events, EVOLUTION, 6, 0.05)),
+        CONTEXT.Process(target=async_worker, args=(path, events, INTERACTIVE, 6, 0.05)),
+    ]
+    for p in processes:
+        p.start()
+    collected = collect(events, processes)
+    peak = max_concurrency(collected)
+    print(f"{len(collected) // 2} calls, at most {peak} in flight")
+    assert len(collected) == 36 and peak == LIMIT
+    assert "ollama/llama3.1" not in SharedAdmission(path).snapshot()  # no slot or waiting row left
+
+
+def test_priority_across_processes():
+    print("--- An interactive call in one worker goes ahead of evolution calls queued in another ---")
+    path = os.path.join(tempfile.mkdtemp(), "admission.db")
+    events = CONTEXT.Queue()
+    start = time.time() + 3  # after the spawned interpreters have imported everything
+    processes = [
+        CONTEXT.Process(target=worker, args=(path, events, BATCH, LIMIT, 1.0, start)),
+        CONTEXT.Process(target=worker, args=(path, events, EVOLUTION, 6, 0.2, start + 0.3)),
+        CONTEXT.Process(target=worker, args=(path, events, INTERACTIVE, 1, 0.2, start + 0.6)),
+    ]
+    for p in processes:
+        p.start()
+    starts = [label.split("-")[0] for kind, label, _ in collect(events, processes) if kind == "start"]
+    print(f"Admission order: {starts}")
+    # Both slots are busy until the batch calls end; the interactive call, queued last, is in the next pair
+    assert starts[:LIMIT] == [BATCH] * LIMIT
+    assert INTERACTIVE in starts[LIMIT:LIMIT + 2]
+
+
+def test_slots_of_dead_processes_are_reclaimed():
+    print("--- A slot held by a process that exited is reclaimed ---")
+    path = os.path.join(tempfile.mkdtemp(), "admission.db")
+    p = CONTEXT.Process(target=hold_and_die, args=(path,))
+    p.start()
+    p.join(timeout=60)
+    admission = SharedAdmission(path)
+    assert admission.acquire("ollama/llama3.1", INTERACTIVE, 1, 8.0) is not None
+
+
+def test_abandoned_calls_return_their_slot():
+    print("--- Cancelled queued calls leave no slot or waiting row behind ---")
+    path = os.path.join(tempfile.mkdtemp(), "admission.db")
+    scheduler = LLMScheduler({"ollama": 1}, shared=SharedAdmission(path, poll_s=0.01))
+    model = scheduler.wrap(SleepyModel(0.3, multiprocessing.Queue()))
+
+    async def run():
+        tasks = [asyncio.create_task(model.ainvoke(f"call-{i}")) for i in range(4)]
+        await asyncio.sleep(0.1)
+        for task in tasks[1:]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.sleep(0.1)  # the pump gives the lease back
+
+    asyncio.run(run())
+    lanes = scheduler.shared.snapshot()
+    print(f"After cancelling: {lanes}")
+    assert "ollama/llama3.1" not in lanes
+
+
+if __name__ == "__main__":
+    test_limit_holds_across_processes()
+    test_priority_across_processes()
+    test_slots_of_dead_processes_are_reclaimed()
+    test_abandoned_calls_return_their_slot()
+    print("All shared admission checks passed.")
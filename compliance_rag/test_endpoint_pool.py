@@ -0,0 +1,114 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from langchain_ollama import ChatOllama, OllamaEmbeddings
+from compliance_rag.endpoint_pool import EndpointPool
+from compliance_rag.benchmarks.stub_servers import start_stubs
+
+# Fast health checks so recovered stubs are re-admitted within the test
+HEALTH_INTERVAL = 0.2
+
+
+def chat_pool(stubs, **settings) -> EndpointPool:
+    settings.setdefault("health_interval", HEALTH_INTERVAL)
+    return EndpointPool(lambda url: ChatOllama(model="llama3.1", base_url=url), [s.url for s in stubs], **settings)
+
+
+def test_least_outstanding_routing():
+    print("--- Least-outstanding routing over 3 replicas ---")
+    stubs = start_stubs(3, latency_ms=200)
+    pool = chat_pool(stubs)
+    with ThreadPoolExecutor(max_workers=9) as executor:
+        answers = list(executor.map(lambda i: pool.invoke(f"question {i}").content, range(9)))
+    print(f"Requests per replica: {[s.requests for s in stubs]}, max in flight: {[s.max_in_flight for s in stubs]}")
+    assert all(a.startswith("[stub:") for a in answers)
+    assert [s.requests for s in stubs] == [3, 3, 3]
+
+    embeddings = EndpointPool(lambda url: OllamaEmbeddings(model="nomic-embed-text", base_url=url), [s.url for s in stubs])
+    assert len(embeddings.embed_documents(["a", "b"])) == 2 and len(embeddings.embed_query("c")) == 768
+    for s in stubs:
+        s.stop()
+
+
+def test_ejection_and_recovery():
+    print("--- A failing replica is ejected, skipped and re-admitted ---")
+    stubs = start_stubs(2, latency_ms=20)
+    broken = stubs[0]
+    broken.fail = True
+    pool = chat_pool(stubs, eject_after=2, eject_s=60)
+
+    for i in range(10):
+        assert pool.invoke(f"question {i}").content.startswith(f"[{stubs[1].name}]")
+    state = pool.states[broken.url]
+    print(f"Broken replica: {broken.requests} requests, healthy={state.healthy(time.monotonic())}")
+    assert not state.healthy(time.monotonic())
+    assert broken.requests <= 3  # two failures to eject, plus at most one health check race
+
+    broken.fail = False
+    time.sleep(HEALTH_INTERVAL * 3)
+    print(f"After recovery: healthy={state.healthy(time.monotonic())}")
+    assert state.healthy(time.monotonic())
+
+    # A replica that stops listening is ejected on the first connection error
+    stubs[1].stop()
+    before = broken.requests
+    assert pool.invoke("after shutdown").content.startswith(f"[{broken.name}]")
+    assert not pool.states[stubs[1].url].healthy(time.monotonic())
+    assert pool.invoke("again").content and broken.requests == before + 2
+    broken.stop()
+
+
+def test_hedged_requests():
+    print("--- Hedged requests cut the slow tail ---")
+    results = {}
+    for hedge_percentile in (0, 90):
+        # One degraded replica: 10% of its calls stall for a second
+        stubs = start_stubs(2, latency_ms=30)
+        stubs[0].slow_fraction, stubs[0].slow_ms = 0.1, 1000
+        pool = chat_pool(stubs, hedge_percentile=hedge_percentile, hedge_min_samples=20)
+        latencies = []
+        for i in range(100):
+            start = time.perf_counter()
+            pool.invoke(f"question {i}")
+            latencies.append((time.perf_counter() - start) * 1000)
+        tail = sorted(latencies[20:])  # after the hedging threshold has warmed up
+        results[hedge_percentile] = tail
+        print(
+            f"hedge_percentile={hedge_percentile}: p50 {tail[len(tail) // 2]:.0f} ms, "
+            f"p95 {tail[int(len(tail) * 0.95)]:.0f} ms, max {tail[-1]:.0f} ms, "
+            f"hedges {pool.hedges}, hedge wins {pool.hedge_wins}"
+        )
+        for s in stubs:
+            s.stop()
+    assert results[90][-1] < 500 < results[0][-1]
+
+
+def test_async_hedged_requests():
+    print("--- Async calls: hedging and failover ---")
+    stubs = start_stubs(2, latency_ms=30)
+    stubs[0].slow_fraction, stubs[0].slow_ms = 0.3, 1000
+    pool = chat_pool(stubs, hedge_percentile=80, hedge_min_samples=10)
+
+    async def run():
+        latencies = []
+        for i in range(60):
+            start = time.perf_counter()
+            await pool.ainvoke(f"question {i}")
+            latencies.append((time.perf_counter() - start) * 1000)
+        print(f"max after warm-up {max(latencies[10:]):.0f} ms, hedges {pool.hedges}, wins {pool.hedge_wins}")
+        assert max(latencies[10:]) < 500 and pool.hedge_wins > 0
+
+        stubs[0].stop()
+        answer = await pool.ainvoke("failover")
+        assert answer.content.startswith(f"[{stubs[1].name}]")
+
+    asyncio.run(run())
+    stubs[1].stop()
+
+
+if __name__ == "__main__":
+    test_least_outstanding_routing()
+    test_ejection_and_recovery()
+    test_hedged_requests()
+    test_async_hedged_requests()
+    print("All endpoint pool checks passed.")
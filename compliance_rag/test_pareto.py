@@ -0,0 +1,62 @@
+from compliance_rag.evaluation.pareto import dominates, pareto_fronts, crowding_distance, select_survivors
+
+
+def test_dominance():
+    print("--- Dominance ---")
+    assert dominates([5, 4, 4, 4, 0.9], [5, 4, 3, 4, 0.9])
+    assert not dominates([5, 4, 4, 4, 0.9], [5, 4, 4, 4, 0.9])  # equal is not better
+    assert not dominates([5, 5, 5, 5, 0.2], [4, 4, 4, 4, 0.9])  # a trade-off dominates neither way
+    assert not dominates([4, 4, 4, 4, 0.9], [5, 5, 5, 5, 0.2])
+
+
+def test_fronts():
+    print("--- Non-dominated fronts ---")
+    vectors = [
+        [5, 5, 5, 5, 0.2],  # 0: thorough but slow
+        [4, 4, 4, 4, 0.9],  # 1: terse but fast
+        [4, 4, 4, 4, 0.5],  # 2: dominated by 1
+        [3, 3, 3, 3, 0.1],  # 3: dominated by everything
+        [5, 5, 5, 5, 0.2],  # 4: duplicate of 0, neither dominates the other
+    ]
+    fronts = pareto_fronts(vectors)
+    print(f"Fronts: {fronts}")
+    assert fronts == [[0, 1, 4], [2], [3]]
+    assert pareto_fronts([]) == []
+
+
+def test_crowding():
+    print("--- Crowding distance ---")
+    vectors = [[1, 0], [0, 1], [0.5, 0.5], [0.4, 0.6]]
+    distance = crowding_distance(vectors, [0, 1, 2, 3])
+    print(f"Distances: {distance}")
+    assert distance[0] == distance[1] == float("inf")  # boundary points
+    # 2 sits between 3 and 0 on both axes, 3 between 1 and 2: (0.6 + 0.6) vs (0.5 + 0.5)
+    assert abs(distance[2] - 1.2) < 1e-9 and abs(distance[3] - 1.0) < 1e-9
+    assert crowding_distance(vectors, [2, 3]) == {2: float("inf"), 3: float("inf")}
+    # A dimension with no spread adds nothing (and doesn't divide by zero)
+    flat = [[1, 0, 3], [0, 1, 3], [0.5, 0.5, 3]]
+    assert crowding_distance(flat, [0, 1, 2])[2] == 2.0
+
+
+def test_select_survivors():
+    print("--- Survivor selection ---")
+    vectors = [
+        [3, 3, 3, 3, 0.1],  # 0: last front
+        [5, 5, 5, 5, 0.2],  # 1: front 1, boundary
+        [4, 4, 4, 4, 0.5],  # 2: front 2
+        [4, 4, 4, 4, 0.9],  # 3: front 1, boundary
+        [4.5, 4.5, 4.5, 4.5, 0.6],  # 4: front 1, between the two
+    ]
+    assert select_survivors(vectors, 2) == [1, 3]  # the spread-out ends of the front, not the middle
+    assert select_survivors(vectors, 3) == [1, 3, 4]
+    assert select_survivors(vectors, 4) == [1, 3, 4, 2]  # the whole front, then the next one
+    assert select_survivors(vectors, 10) == [1, 3, 4, 2, 0]
+    assert select_survivors([], 2) == []
+
+
+if __name__ == "__main__":
+    test_dominance()
+    test_fronts()
+    test_crowding()
+    test_select_survivors()
+    print("All Pareto selection checks passed.")
@@ -0,0 +1,77 @@
+import time
+from compliance_rag.config import PERF_LATENCY_BUDGET_S, PERF_TOKEN_BUDGET, PERF_COST_BUDGET_USD, LLM_PRICES
+from compliance_rag.core.sop import ComplianceSOP
+from compliance_rag.evaluation.models import RunMetrics
+from compliance_rag.evaluation.performance import (
+    covered_ms, dimension_score, performance_score, budget_overruns, run_metrics, role_model,
+)
+from compliance_rag.tracing import Trace
+
+
+def test_dimension_score():
+    print("--- Budget normalization ---")
+    assert dimension_score(0, 10) == 1.0
+    assert dimension_score(10, 10) == 1.0  # at budget
+    assert dimension_score(15, 10) == 0.5  # halfway to twice the budget
+    assert dimension_score(20, 10) == 0.0
+    assert dimension_score(50, 10) == 0.0  # clamped
+
+
+def test_performance_score():
+    print("--- Run score is the worst dimension ---")
+    within = RunMetrics(latency_s=PERF_LATENCY_BUDGET_S / 2, tokens={"synthesizer": {"prompt": 10, "completion": 5}})
+    assert performance_score(within) == 1.0 and budget_overruns(within) == []
+
+    slow = RunMetrics(latency_s=PERF_LATENCY_BUDGET_S * 1.25)
+    print(f"Latency at 1.25x budget: {performance_score(slow)}")
+    assert performance_score(slow) == 0.75
+    assert len(budget_overruns(slow)) == 1 and budget_overruns(slow)[0].startswith("latency_s")
+
+    verbose = RunMetrics(latency_s=0.0, tokens={"synthesizer": {"prompt": PERF_TOKEN_BUDGET * 2, "completion": 0}})
+    assert performance_score(verbose) == 0.0
+    assert budget_overruns(verbose)[-1] == f"prompt+completion tokens per role: synthesizer {PERF_TOKEN_BUDGET * 2}+0"
+
+    costly = RunMetrics(latency_s=0.0, cost_usd=PERF_COST_BUDGET_USD * 1.9)
+    assert performance_score(costly) == 0.1
+
+
+def test_covered_ms():
+    print("--- Overlapping queue waits count once ---")
+    assert covered_ms([]) == 0.0
+    assert covered_ms([(0, 100), (50, 100), (300, 10)]) == 160.0
+    assert covered_ms([(0, 100), (10, 20)]) == 100.0  # nested
+    assert covered_ms([(300, 10), (0, 100)]) == 110.0  # unsorted input
+
+
+def test_run_metrics():
+    print("--- Metrics from a trace ---")
+    sop = ComplianceSOP(planner_prompt="p", synthesizer_prompt="s")
+    trace = Trace()
+    trace.started = time.perf_counter() - 10.0  # a 10 s run
+    trace.add({"kind": "llm_queue", "name": "ollama", "start_ms": 0.0, "ms": 2000.0})
+    trace.add({"kind": "llm_queue", "name": "ollama", "start_ms": 1000.0, "ms": 2000.0})
+    trace.add({"kind": "llm", "name": "director", "start_ms": 3000.0, "ms": 500.0,
+               "prompt_tokens": 1000, "completion_tokens": 200})
+    trace.add({"kind": "llm", "name": "synthesizer", "start_ms": 4000.0, "ms": 500.0,
+               "prompt_tokens": 3000, "completion_tokens": 400})
+    metrics = run_metrics(trace, sop)
+    print(f"latency {metrics.latency_s:.2f}s, queue {metrics.queue_wait_s}s, cost ${metrics.cost_usd:.6f}")
+
+    assert metrics.queue_wait_s == 3.0
+    assert 7.0 <= metrics.latency_s < 7.5  # 10 s minus 3 s of queueing
+    assert metrics.tokens == {"director": {"prompt": 1000, "completion": 200},
+                              "synthesizer": {"prompt": 3000, "completion": 400}}
+    assert metrics.total_tokens == 4600
+    director_price = LLM_PRICES.get(role_model("director"), (0.0, 0.0))
+    synthesizer_price = LLM_PRICES.get(role_model("synthesizer", sop), (0.0, 0.0))
+    expected = (1000 * director_price[0] + 200 * director_price[1]
+                + 3000 * synthesizer_price[0] + 400 * synthesizer_price[1]) / 1e6
+    assert abs(metrics.cost_usd - expected) < 1e-12
+
+
+if __name__ == "__main__":
+    test_dimension_score()
+    test_performance_score()
+    test_covered_ms()
+    test_run_metrics()
+    print("All performance scoring checks passed.")
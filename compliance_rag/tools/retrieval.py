@@ -1,24 +1,129 @@
 import duckdb
-from langchain_community.vectorstores import FAISS
+import threading
+from typing import Any, Dict, List, Optional
+from langchain_core.documents import Document
 from langchain_core.tools import tool
 from compliance_rag.config import llm_config, VECTOR_STORE_PATH, METADATA_DB_PATH
+from compliance_rag.vector_index import load_vector_store
+from compliance_rag.rerank import CrossEncoderReranker
+from compliance_rag.conflicts import lookup_conflicts, format_conflicts
+from compliance_rag.tracing import span
 
 # 1. Vector Search Tool
-# Use the FAISS index we created for sematic search
-vector_store = FAISS.load_local(
-    VECTOR_STORE_PATH, 
-    llm_config["embedding_model"],
-    allow_dangerous_deserialization=True # Required for local loading
-)
+# Use the FAISS index we created for sematic search.
+# The index is memory-mapped and tuned with FAISS_NPROBE / FAISS_EF_SEARCH;
+# chunk text is read from the columnar chunk store only for the top-k hits.
+# It is loaded on first use, so importing this module (e.g. for POLICY_FILTER_FIELDS,
+# or in a benchmark run against a remote API) doesn't need an ingested store.
+vector_store = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store():
+    """The policy vector store, loaded from VECTOR_STORE_PATH on first call."""
+    global vector_store
+    if vector_store is None:
+        with _vector_store_lock:
+            if vector_store is None:
+                vector_store = load_vector_store(VECTOR_STORE_PATH, llm_config["embedding_model"])
+    return vector_store
+
+
+# Cross-encoder for the optional rerank stage; the model is loaded on first use
+reranker = CrossEncoderReranker()
+
+# Metadata filters the Planner may attach to a researcher task.
+# Values may be a single string or a list; the date bounds apply to last_updated.
+POLICY_FILTER_FIELDS = ("policy_id", "department", "status", "owner", "updated_after", "updated_before")
+
+
+def resolve_policy_ids(filters: Dict[str, Any]) -> List[str]:
+    """Resolves metadata filters to the matching policy IDs in DuckDB."""
+    clauses, params = [], []
+    for field, value in filters.items():
+        if field not in POLICY_FILTER_FIELDS:
+            raise ValueError(f"Unsupported policy filter '{field}'. Allowed: {POLICY_FILTER_FIELDS}")
+        if field == "updated_after":
+            clauses.append("last_updated >= CAST(? AS DATE)")
+            params.append(str(value))
+        elif field == "updated_before":
+            clauses.append("last_updated <= CAST(? AS DATE)")
+            params.append(str(value))
+        else:
+            values = value if isinstance(value, list) else [value]
+            clauses.append(f"lower({field}) IN ({', '.join('?' for _ in values)})")
+            params.extend(str(v).lower() for v in values)
+
+    con = duckdb.connect(METADATA_DB_PATH, read_only=True)
+    try:
+        with span("sql", "policy_filter"):
+            rows = con.execute(
+                f"SELECT policy_id FROM policies WHERE {' AND '.join(clauses) or 'TRUE'}", params
+            ).fetchall()
+    finally:
+        con.close()
+    return [r[0] for r in rows]
+
+
+def filtered_policy_search(query: str, k: int, filters: Dict[str, Any]) -> List[Document]:
+    """
+    Vector search restricted to chunks of policies matching `filters`.
+    Allowed policy IDs are resolved in DuckDB first, so excluded policies are never scanned.
+    """
+    store = get_vector_store()
+    allowed = store.chunks.rows_for_policies(resolve_policy_ids(filters))
+    if not len(allowed):
+        return []
+    return store.similarity_search(query, k=k, allowed_ids=allowed)
+
 
 @tool
-def policy_search_tool(query: str, k: int = 3):
+def policy_search_tool(
+    query: str,
+    k: int = 3,
+    filters: Optional[Dict[str, Any]] = None,
+    rerank_candidates: int = 0,
+    conflict_check: bool = False,
+):
     """
     Search for internal company policy content and clauses.
     Use this for questions about rules, standards, and requirements.
+    Optional filters (policy_id, department, status, owner, updated_after, updated_before)
+    restrict the search to matching policies, e.g. {"department": "HR", "status": "Active"}.
+    With rerank_candidates > k, that many hits are fetched and the k best by cross-encoder are returned.
+    With conflict_check, known conflicts of the returned clauses with other policies are appended.
     """
-    docs = vector_store.similarity_search(query, k=k)
-    return "\n\n".join([f"Source: {d.metadata.get('source', 'Unknown')}\n{d.page_content}" for d in docs])
+    fetch = max(k, rerank_candidates)
+    if filters:
+        docs = filtered_policy_search(query, fetch, filters)
+        if not docs:
+            return f"No policy content matches the filters {filters}."
+    else:
+        docs = get_vector_store().similarity_search(query, k=fetch)
+    if fetch > k:
+        docs = [doc for doc, _ in reranker.rerank(query, docs, k)]
+    result = "\n\n".join([_format_chunk(d) for d in docs])
+    if conflict_check:
+        # Precomputed at ingestion time (conflicts.py): one indexed lookup, no LLM call
+        conflicts = lookup_conflicts(docs)
+        if conflicts:
+            result += "\n\n" + format_conflicts(conflicts)
+    return result
+
+
+def _format_chunk(doc: Document) -> str:
+    source = f"Source: {doc.metadata.get('source', 'Unknown')}"
+    if doc.metadata.get("section_path"):
+        source += f" | Section: {doc.metadata['section_path']}"
+    # The same clause in other policies (dropped as a near-duplicate at ingestion)
+    also_in = [
+        a["source"] + (f" ({a['section_path']})" if a.get("section_path") else "")
+        for a in doc.metadata.get("also_in", []) if a.get("source")
+    ]
+    if also_in:
+        source += f" | Also in: {'; '.join(also_in)}"
+    return f"{source}\n{doc.page_content}"
+
 
 # 2. Metadata SQL Tool
 # Query the DuckDB database for structured policy information
@@ -31,8 +136,10 @@ def policy_metadata_tool(sql_query: str):
     Use this for questions about owners, dates, versions, and lists of policies.
     """
     try:
-        con = duckdb.connect(METADATA_DB_PATH)
-        result = con.execute(sql_query).df().to_string()
+        # Read-only: generated SQL can't modify metadata, and API workers can share the file
+        con = duckdb.connect(METADATA_DB_PATH, read_only=True)
+        with span("sql", "metadata_tool"):
+            result = con.execute(sql_query).df().to_string()
         con.close()
         return result
     except Exception as e:
@@ -0,0 +1,252 @@
+"""
+Latency and token instrumentation for the agent network.
+
+Timed sections ("spans") are recorded in two places:
+
+- Process-wide Prometheus histograms, served by GET /metrics in the text
+  exposition format (one set per worker process, like /scheduler/stats).
+- The current request's `Trace`, if one was started with `start_trace()`.
+  The trace lives in a context variable, so spans recorded in LangGraph node
+  threads and `asyncio.to_thread` calls land in the request that caused them.
+
+Span kinds and the histogram each one feeds:
+    query          compliance_rag_query_seconds{endpoint}          end-to-end request
+    node           compliance_rag_node_seconds{node}               LangGraph node wall time
+    llm            compliance_rag_llm_call_seconds{role}           LLM call, including queueing
+    llm_queue      compliance_rag_llm_queue_seconds{lane}          wait for an LLM scheduler slot
+    embedding      compliance_rag_embedding_seconds{role}          embedding call, including queueing
+    vector_search  compliance_rag_vector_search_seconds{mode}      FAISS search + chunk fetch
+    rerank         compliance_rag_rerank_seconds{model}            cross-encoder scoring of candidates
+    sql            compliance_rag_sql_seconds{statement}           DuckDB execution
+LLM calls also feed compliance_rag_llm_prompt_tokens{role} and
+compliance_rag_llm_completion_tokens{role}. /metrics also reports
+compliance_rag_log_records_dropped_total, the log records dropped because the
+logging queue was full (compliance_rag/utils/logger.py).
+"""
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Sequence
+
+# Seconds; covers sub-millisecond FAISS searches up to slow CPU-only generations
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class Histogram:
+    """A labelled Prometheus histogram (cumulative buckets, _sum and _count)."""
+    def __init__(self, name: str, help_text: str, label: str, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List[float]] = {}  # label value -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for label_value, counts in sorted(series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {count:g}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {counts[-1]:g}')
+            lines.append(f"{self.name}_sum{{{label}}} {counts[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {counts[-1]:g}")
+        return lines
+
+
+SPAN_HISTOGRAMS: Dict[str, Histogram] = {
+    "query": Histogram("compliance_rag_query_seconds", "End-to-end request latency.", "endpoint"),
+    "node": Histogram("compliance_rag_node_seconds", "Wall time of each LangGraph node.", "node"),
+    "llm": Histogram("compliance_rag_llm_call_seconds", "LLM call latency per role, including queueing.", "role"),
+    "llm_queue": Histogram("compliance_rag_llm_queue_seconds", "Wait for an LLM scheduler slot.", "lane"),
+    "embedding": Histogram("compliance_rag_embedding_seconds", "Embedding call latency, including queueing.", "role"),
+    "vector_search": Histogram("compliance_rag_vector_search_seconds", "FAISS search and chunk fetch.", "mode"),
+    "rerank": Histogram("compliance_rag_rerank_seconds", "Cross-encoder reranking of search candidates.", "model"),
+    "sql": Histogram("compliance_rag_sql_seconds", "DuckDB statement execution.", "statement"),
+}
+PROMPT_TOKENS = Histogram("compliance_rag_llm_prompt_tokens", "Prompt tokens per LLM call.", "role", TOKEN_BUCKETS)
+COMPLETION_TOKENS = Histogram(
+    "compliance_rag_llm_completion_tokens", "Completion tokens per LLM call.", "role", TOKEN_BUCKETS
+)
+
+
+def render_metrics() -> str:
+    """All histograms, and the dropped log record count, in the Prometheus text exposition format."""
+    from compliance_rag.utils.logger import dropped_records  # the logger imports config, which imports us
+
+    lines = []
+    for histogram in (*SPAN_HISTOGRAMS.values(), PROMPT_TOKENS, COMPLETION_TOKENS):
+        lines.extend(histogram.render())
+    lines += [
+        "# HELP compliance_rag_log_records_dropped_total Log records dropped because the logging queue was full.",
+        "# TYPE compliance_rag_log_records_dropped_total counter",
+        f"compliance_rag_log_records_dropped_total {dropped_records()}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+# ── Per-request traces ───────────────────────────────────────
+
+class Trace:
+    """Spans recorded while handling one request (appended from several threads)."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, span: Dict[str, Any]):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> Dict[str, Any]:
+        """Timing breakdown: node wall times, time per span kind, tokens per role and the raw spans."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ms"])
+        nodes: Dict[str, float] = {}
+        totals: Dict[str, float] = {}
+        tokens: Dict[str, Dict[str, int]] = {}
+        for s in spans:
+            if s["kind"] == "node":
+                nodes[s["name"]] = round(nodes.get(s["name"], 0.0) + s["ms"], 2)
+            elif s["kind"] != "query":
+                totals[s["kind"]] = round(totals.get(s["kind"], 0.0) + s["ms"], 2)
+            if s["kind"] == "llm":
+                role = tokens.setdefault(s["name"], {"prompt": 0, "completion": 0})
+                role["prompt"] += s.get("prompt_tokens") or 0
+                role["completion"] += s.get("completion_tokens") or 0
+        return {
+            "total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "nodes_ms": nodes,
+            "totals_ms": totals,
+            "tokens": tokens,
+            "spans": spans,
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+@contextmanager
+def start_trace():
+    """Collects the spans of the enclosed work (including threads started with a copied context)."""
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def record(kind: str, name: str, seconds: float, **attrs):
+    """Observes a finished span in its histogram and in the current trace."""
+    SPAN_HISTOGRAMS[kind].observe(name, seconds)
+    trace = _trace.get()
+    if trace is not None:
+        start_ms = (time.perf_counter() - seconds - trace.started) * 1000
+        trace.add({"kind": kind, "name": name, "start_ms": round(start_ms, 2), "ms": round(seconds * 1000, 2), **attrs})
+
+
+@contextmanager
+def span(kind: str, name: str):
+    """
+    Times the enclosed block as a span of `kind`. Yields a dict; keys added to it
+    (e.g. token counts) are stored with the span in the trace.
+    """
+    attrs: Dict[str, Any] = {}
+    started = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        record(kind, name, time.perf_counter() - started, **attrs)
+
+
+# ── Instrumented models and nodes ────────────────────────────
+
+def _usage(response: Any) -> Dict[str, int]:
+    usage = getattr(response, "usage_metadata", None) or {}
+    return {"prompt_tokens": usage.get("input_tokens") or 0, "completion_tokens": usage.get("output_tokens") or 0}
+
+
+class TracedModel:
+    """
+    Wraps a (scheduled) chat or embedding model so every call is recorded as an
+    `llm` or `embedding` span of `role`, with token usage for chat calls.
+    Everything else is delegated unchanged.
+    """
+    def __init__(self, role: str, model: Any):
+        self.role = role
+        self.traced = model
+
+    def __getattr__(self, name: str):
+        return getattr(self.traced, name)
+
+    def __repr__(self) -> str:
+        return f"TracedModel({self.role}, {self.traced!r})"
+
+    def _observe(self, attrs: Dict[str, Any], response: Any):
+        attrs.update(_usage(response))
+        PROMPT_TOKENS.observe(self.role, attrs["prompt_tokens"])
+        COMPLETION_TOKENS.observe(self.role, attrs["completion_tokens"])
+
+    def invoke(self, *args, **kwargs):
+        with span("llm", self.role) as attrs:
+            response = self.traced.invoke(*args, **kwargs)
+            self._observe(attrs, response)
+            return response
+
+    async def ainvoke(self, *args, **kwargs):
+        with span("llm", self.role) as attrs:
+            response = await self.traced.ainvoke(*args, **kwargs)
+            self._observe(attrs, response)
+            return response
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embedding", self.role) as attrs:
+            attrs["texts"] = len(texts)
+            return self.traced.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with span("embedding", self.role):
+            return self.traced.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        with span("embedding", self.role) as attrs:
+            attrs["texts"] = len(texts)
+            return await self.traced.aembed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        with span("embedding", self.role):
+            return await self.traced.aembed_query(text)
+
+
+def traced_node(name: str, node):
+    """Wraps a LangGraph node function so its wall time is recorded as a `node` span."""
+    def run(state):
+        with span("node", name):
+            return node(state)
+    run.__name__ = getattr(node, "__name__", name)
+    run.__doc__ = node.__doc__
+    return run
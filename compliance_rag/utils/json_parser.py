@@ -6,6 +6,8 @@ import json
 import re
 import logging
 
+from compliance_rag.utils.logger import payload
+
 logger = logging.getLogger(__name__)
 
 
@@ -50,5 +52,5 @@ def parse_llm_json(raw: str) -> dict:
         except json.JSONDecodeError:
             pass
 
-    logger.error(f"Failed to parse JSON from LLM output: {text[:200]}...")
+    logger.error("Failed to parse JSON from LLM output: %s", payload(text, 200))
     return {}
@@ -1,39 +1,191 @@
 """
 Centralized logging configuration for the Compliance RAG system.
 Replaces all print() statements with structured logging.
+
+With LOG_ASYNC (the default) a caller only puts the record on an in-memory
+queue; a QueueListener thread formats and writes it, so slow stdout never
+stalls a request. When LOG_QUEUE_SIZE records are waiting, new ones are
+dropped and counted instead of blocking (`dropped_records()`, exported on
+GET /metrics as compliance_rag_log_records_dropped_total). LOG_FORMAT=json writes one JSON
+object per line.
+
+Every record carries the current request ID (`request_id_var`: set per HTTP
+request by app.py and per background job). Large values such as answers and
+findings should be logged through `payload()`, which truncates them to
+LOG_PAYLOAD_MAX_CHARS and keeps them for only LOG_PAYLOAD_SAMPLE_RATE of requests.
+Pass values as arguments (`logger.info("Plan: %s", payload(plan))`) rather than
+f-strings, so nothing is formatted when the level is disabled.
 """
-import logging
 import sys
+import json
+import zlib
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional, TextIO
+
+from compliance_rag.config import (
+    LOG_FORMAT, LOG_ASYNC, LOG_QUEUE_SIZE, LOG_PAYLOAD_MAX_CHARS, LOG_PAYLOAD_SAMPLE_RATE
+)
+
+TEXT_FORMAT = "%(asctime)s | %(name)-25s | %(levelname)-7s | %(request_id)-12s | %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# The request (or job) being handled; copied into threads with the rest of the context
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and goes into the JSON
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+_listeners: List[QueueListener] = []
+_queue_handlers: List["DroppingQueueHandler"] = []
+
+
+def _sampled(request_id: str, rate: float) -> bool:
+    if rate >= 1.0:
+        return True
+    if request_id == "-":
+        return random.random() < rate
+    return zlib.crc32(request_id.encode("utf-8")) % 10_000 < rate * 10_000
+
+
+class Payload:
+    """A large value to log; truncated or sampled out only if the record is actually emitted."""
+    __slots__ = ("value", "max_chars", "sample_rate")
+
+    def __init__(self, value, max_chars: int = LOG_PAYLOAD_MAX_CHARS, sample_rate: float = LOG_PAYLOAD_SAMPLE_RATE):
+        self.value = value
+        self.max_chars = max_chars
+        self.sample_rate = sample_rate
+
+    def __str__(self) -> str:
+        text = "" if self.value is None else str(self.value)
+        if not _sampled(request_id_var.get(), self.sample_rate):
+            return f"<{len(text)} chars, not sampled>"
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... [+{len(text) - self.max_chars} chars]"
+        return text
+
+
+def payload(value, max_chars: Optional[int] = None) -> Payload:
+    """Wraps a large value (response, findings, prompt) for logging under the payload policy."""
+    return Payload(value, LOG_PAYLOAD_MAX_CHARS if max_chars is None else max_chars)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the current request ID (runs in the calling thread)."""
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
 
 
-def setup_logger(name: str = "compliance_rag", level: str = "INFO") -> logging.Logger:
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Enqueues records without blocking; counts the ones dropped because the queue is full."""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message (and payloads) now, in the caller's context, but leave
+        # timestamps, padding and JSON encoding to the listener thread
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def dropped_records() -> int:
+    """Records dropped so far in this process because a log queue was full."""
+    return sum(handler.dropped for handler in _queue_handlers)
+
+
+def make_formatter(fmt: str = LOG_FORMAT) -> logging.Formatter:
+    if fmt == "json":
+        return JsonFormatter()
+    return logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT)
+
+
+def setup_logger(
+    name: str = "compliance_rag",
+    level: str = "INFO",
+    fmt: str = LOG_FORMAT,
+    use_queue: bool = LOG_ASYNC,
+    stream: Optional[TextIO] = None,
+) -> logging.Logger:
     """
     Creates a formatted logger instance.
-    
+
     Args:
         name: Logger name (typically module name)
         level: Log level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-    
+        fmt: "text" or "json"
+        use_queue: Hand records to a background writer thread instead of writing inline
+        stream: Where to write (default: stdout)
+
     Returns:
         Configured logger instance
     """
     logger = logging.getLogger(name)
-    
+
     # Avoid duplicate handlers
     if logger.handlers:
         return logger
-    
+
     logger.setLevel(getattr(logging, level.upper(), logging.INFO))
-    
+
     # Console handler with formatted output
-    handler = logging.StreamHandler(sys.stdout)
+    handler = logging.StreamHandler(stream or sys.stdout)
     handler.setLevel(logging.DEBUG)
-    
-    formatter = logging.Formatter(
-        "%(asctime)s | %(name)-25s | %(levelname)-7s | %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    
+    handler.setFormatter(make_formatter(fmt))
+
+    if use_queue:
+        queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        queue_handler.addFilter(RequestIdFilter())
+        listener = QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+        listener.start()
+        _listeners.append(listener)
+        _queue_handlers.append(queue_handler)
+        logger.addHandler(queue_handler)
+    else:
+        handler.addFilter(RequestIdFilter())
+        logger.addHandler(handler)
+
     return logger
+
+
+@atexit.register
+def flush_logging():
+    """Writes out queued records and stops the writer threads (also runs at exit)."""
+    while _listeners:
+        _listeners.pop().stop()
@@ -0,0 +1,490 @@
+"""
+FAISS index construction and loading for the policy vector store.
+Supports exact (flat) search plus the approximate IVF-Flat, IVF-PQ and HNSW
+index types, trained on a sample of the corpus and memory-mapped at load time.
+Chunk text lives beside the index in a columnar chunk store (see chunk_store.py).
+The fingerprint of the embeddings that built the index is stored with it, and
+a store refuses to search with query vectors from different embeddings.
+"""
+import os
+import json
+import math
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from compliance_rag.chunk_store import ChunkStore, CHUNK_STORE_FILE
+from compliance_rag.scheduler import lane_key
+from compliance_rag.tracing import span
+
+from compliance_rag.config import (
+    FAISS_INDEX_TYPE,
+    FAISS_NLIST,
+    FAISS_PQ_M,
+    FAISS_HNSW_M,
+    FAISS_TRAIN_SAMPLE,
+    FAISS_NPROBE,
+    FAISS_EF_SEARCH,
+    FAISS_MMAP,
+)
+
+logger = logging.getLogger("compliance_rag.vector_index")
+
+INDEX_FILE = "index.faiss"
+CHECKPOINT_FILE = "checkpoint.json"
+FILES_DONE_LOG = "files_done.jsonl"
+EMBEDDING_FILE = "embedding.json"
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+TRAINED_INDEX_TYPES = ("ivf_flat", "ivf_pq")
+
+# PQ uses 8-bit codes, so each sub-quantizer needs 2^8 centroids to train.
+PQ_MIN_TRAIN_POINTS = 256
+# FAISS warns below ~39 training points per IVF centroid.
+IVF_POINTS_PER_CENTROID = 39
+# HNSW graph traversal breaks down when a filter excludes most of the graph,
+# so allowed sets up to this size are searched exactly instead.
+HNSW_EXACT_FILTER_MAX = 4096
+
+
+def default_nlist(n_vectors: int) -> int:
+    """Rule-of-thumb IVF list count: ~4*sqrt(N), bounded by the training data."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // IVF_POINTS_PER_CENTROID))
+
+
+def _pq_subquantizers(dim: int, requested: int) -> int:
+    """Largest divisor of `dim` that does not exceed the requested PQ M."""
+    for m in range(min(requested, dim), 0, -1):
+        if dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(
+    index_type: str,
+    dim: int,
+    n_vectors: int,
+    nlist: int = FAISS_NLIST,
+    pq_m: int = FAISS_PQ_M,
+    hnsw_m: int = FAISS_HNSW_M,
+) -> str:
+    """
+    Translates an index type into a FAISS `index_factory` description.
+    Falls back to "Flat" when the corpus is too small to train the requested type.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type '{index_type}'. Expected one of {INDEX_TYPES}.")
+
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "hnsw":
+        return f"HNSW{hnsw_m}"
+
+    nlist = nlist or default_nlist(n_vectors)
+    if n_vectors < nlist * IVF_POINTS_PER_CENTROID or (
+        index_type == "ivf_pq" and n_vectors < PQ_MIN_TRAIN_POINTS
+    ):
+        logger.warning(
+            "Only %d vectors available; too few to train '%s' (nlist=%d). Using a flat index.",
+            n_vectors, index_type, nlist
+        )
+        return "Flat"
+
+    if index_type == "ivf_flat":
+        return f"IVF{nlist},Flat"
+    return f"IVF{nlist},PQ{_pq_subquantizers(dim, pq_m)}"
+
+
+def train_index(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    train_sample: int = FAISS_TRAIN_SAMPLE,
+    seed: int = 42,
+) -> None:
+    """Trains an index on a random sample of at most `train_sample` vectors."""
+    if index.is_trained:
+        return
+    if len(vectors) > train_sample:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(len(vectors), size=train_sample, replace=False)]
+    logger.info("Training FAISS index on %d sample vectors.", len(vectors))
+    index.train(np.ascontiguousarray(vectors, dtype="float32"))
+
+
+def build_index(vectors: np.ndarray, index_type: str = FAISS_INDEX_TYPE, **kwargs) -> faiss.Index:
+    """Creates and trains (but does not populate) an index suited to `vectors`."""
+    n_vectors, dim = vectors.shape
+    description = factory_string(index_type, dim, n_vectors, **kwargs)
+    logger.info("Building FAISS index '%s' for %d vectors of dim %d.", description, n_vectors, dim)
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    train_index(index, vectors)
+    return index
+
+
+def apply_search_params(
+    index: faiss.Index,
+    nprobe: int = FAISS_NPROBE,
+    ef_search: int = FAISS_EF_SEARCH,
+) -> None:
+    """Sets the query-time recall/latency knobs that apply to this index type."""
+    params = faiss.ParameterSpace()
+    if faiss.try_extract_index_ivf(index) is not None:
+        params.set_index_parameter(index, "nprobe", nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        params.set_index_parameter(index, "efSearch", ef_search)
+
+
+def filtered_search(
+    index: faiss.Index,
+    query: np.ndarray,
+    k: int,
+    allowed_ids: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Searches only the vectors whose row IDs are in `allowed_ids`.
+    Excluded rows are skipped inside FAISS via an ID selector rather than
+    being retrieved and filtered afterwards.
+    Returns (distances, ids) for the single `query` vector, without empty slots.
+    """
+    query = np.ascontiguousarray(query, dtype="float32").reshape(1, -1)
+    allowed_ids = np.asarray(allowed_ids, dtype="int64")
+
+    if isinstance(index, faiss.IndexHNSW) and len(allowed_ids) <= HNSW_EXACT_FILTER_MAX:
+        vectors = index.reconstruct_batch(allowed_ids)
+        distances = ((vectors - query) ** 2).sum(axis=1)
+        top = np.argsort(distances)[:k]
+        return distances[top], allowed_ids[top]
+
+    selector = faiss.IDSelectorBatch(allowed_ids)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+
+    distances, ids = index.search(query, k, params=params)
+    keep = ids[0] != -1
+    return distances[0][keep], ids[0][keep]
+
+
+def read_index(path: str, mmap: bool = FAISS_MMAP) -> faiss.Index:
+    """
+    Reads an index from disk. With `mmap`, the index data is mapped read-only
+    so every worker process shares the same page-cache pages.
+    Memory-mapped indexes cannot be modified; load without `mmap` to append.
+    """
+    # IO_FLAG_MMAP_IFC maps the vector/code storage of flat, IVF and HNSW indexes.
+    # Combining it with IO_FLAG_MMAP breaks IVF loading, so it is used on its own.
+    flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
+    return faiss.read_index(path, flags)
+
+
+def embedding_fingerprint(embeddings: Embeddings) -> str:
+    """
+    Identifies the model (and runtime) behind `embeddings`, e.g. 'ollama/nomic-embed-text'
+    or 'local/baai/bge-small-en-v1.5/onnx'. Vectors are only comparable within one fingerprint.
+    """
+    fingerprint = getattr(embeddings, "fingerprint", None)
+    if fingerprint:
+        return fingerprint
+    # Scheduled models (config.llm_config) already know their backend/model lane
+    return getattr(embeddings, "lane", None) or lane_key(embeddings)
+
+
+def read_embedding_fingerprint(folder_path: str) -> Optional[str]:
+    path = os.path.join(folder_path, EMBEDDING_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["fingerprint"]
+
+
+class PolicyVectorStore:
+    """
+    A FAISS index paired with the columnar chunk store holding its text.
+    Only the index is searched in memory; chunk text is fetched for the hits.
+    With the index's `fingerprint`, searching with different embeddings raises ValueError.
+    """
+    def __init__(self, index: faiss.Index, chunks: ChunkStore, embeddings: Embeddings,
+                 fingerprint: Optional[str] = None):
+        self.index = index
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.fingerprint = fingerprint
+        self.mismatch: Optional[str] = None
+        current = embedding_fingerprint(embeddings)
+        if fingerprint is None:
+            logger.warning("Index has no embedding fingerprint; assuming it was built with %s.", current)
+        elif fingerprint != current:
+            self.mismatch = (
+                f"The vector index was built with '{fingerprint}' embeddings but queries use '{current}'. "
+                "Switch EMBEDDING_BACKEND back or re-run `python -m compliance_rag.ingestion`."
+            )
+            logger.error(self.mismatch)
+
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        allowed_ids: Optional[np.ndarray] = None,
+    ) -> List[Tuple[Document, float]]:
+        """Top-k chunks with their L2 distances, optionally restricted to `allowed_ids`."""
+        if self.mismatch:
+            raise ValueError(self.mismatch)
+        vector = np.asarray(self.embeddings.embed_query(query), dtype="float32")
+        with span("vector_search", "unfiltered" if allowed_ids is None else "filtered"):
+            if allowed_ids is None:
+                distances, ids = self.index.search(vector.reshape(1, -1), k)
+                keep = ids[0] != -1
+                distances, ids = distances[0][keep], ids[0][keep]
+            else:
+                distances, ids = filtered_search(self.index, vector, k, allowed_ids)
+
+            scores = dict(zip(ids.tolist(), distances.tolist()))
+            return [(doc, scores[doc.metadata["row_id"]]) for doc in self.chunks.get(ids)]
+
+    def similarity_search(
+        self,
+        query: str,
+        k: int = 4,
+        allowed_ids: Optional[np.ndarray] = None,
+    ) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, allowed_ids)]
+
+
+class StreamingIndexBuilder:
+    """
+    Appends embedded chunks to the chunk store one window at a time, writing each
+    window's vectors to its own shard file and checkpointing after each window so an
+    interrupted build resumes where it stopped. `finish` builds the FAISS index once,
+    adding the shards in row order.
+
+    Each window writes only its own shard, a line per file to an append-only log and
+    a small checkpoint of counters, so memory and checkpoint I/O per window stay
+    bounded by the window size. The final merge holds the index plus one shard.
+    IVF index types train on the first `train_sample` vectors, read back from the
+    leading shards, rather than on the whole corpus.
+    """
+    def __init__(
+        self,
+        folder_path: str,
+        index_type: str = FAISS_INDEX_TYPE,
+        train_sample: int = FAISS_TRAIN_SAMPLE,
+        embedding: Optional[str] = None,
+    ):
+        self.folder_path = folder_path
+        self.index_type = index_type
+        self.train_sample = train_sample
+        self.embedding = embedding
+        self.next_row = 0
+        self.shards = 0
+        self.files_count = 0
+        self._files_bytes = 0
+
+        os.makedirs(folder_path, exist_ok=True)
+        self.chunks = ChunkStore(os.path.join(folder_path, CHUNK_STORE_FILE), read_only=False)
+        self._resume()
+
+    @property
+    def checkpoint_path(self) -> str:
+        return os.path.join(self.folder_path, CHECKPOINT_FILE)
+
+    @property
+    def files_log_path(self) -> str:
+        return os.path.join(self.folder_path, FILES_DONE_LOG)
+
+    def _shard_file(self, shard: int) -> str:
+        return os.path.join(self.folder_path, f"shard-{shard:06d}.npy")
+
+    @property
+    def files_done(self) -> Set[str]:
+        """Files fully ingested as of the last checkpoint, read back from the log."""
+        if not self.files_count:
+            return set()
+        with open(self.files_log_path, encoding="utf-8") as f:
+            return {json.loads(line) for line in f.read(self._files_bytes).splitlines()}
+
+    def _resume(self):
+        """Restores state from the last checkpoint and drops anything written after it."""
+        if os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            if "shards" not in checkpoint:
+                raise ValueError(
+                    f"Checkpoint in {self.folder_path} was written by an older index builder. "
+                    "Remove it to start over."
+                )
+            if checkpoint["index_type"] != self.index_type:
+                raise ValueError(
+                    f"Checkpoint in {self.folder_path} was built with index type "
+                    f"'{checkpoint['index_type']}', not '{self.index_type}'. Remove it to start over."
+                )
+            if checkpoint.get("embedding") != self.embedding:
+                raise ValueError(
+                    f"Checkpoint in {self.folder_path} was built with '{checkpoint.get('embedding')}' "
+                    f"embeddings, not '{self.embedding}'. Remove it to start over."
+                )
+            self.next_row = checkpoint["next_row"]
+            self.shards = checkpoint["shards"]
+            self.files_count = checkpoint["files"]
+            self._files_bytes = checkpoint["files_bytes"]
+            logger.info(
+                "Resuming index build at row %d (%d shards, %d files already done).",
+                self.next_row, self.shards, self.files_count
+            )
+        # Rows, shards and file names written after the last checkpoint belong to an interrupted window
+        self.chunks.delete_from(self.next_row)
+        shard = self.shards + 1
+        while os.path.exists(self._shard_file(shard)):
+            os.remove(self._shard_file(shard))
+            shard += 1
+        if os.path.exists(self.files_log_path):
+            os.truncate(self.files_log_path, self._files_bytes)
+
+    def add(self, documents: List[Document], vectors: np.ndarray, files: List[str],
+            duplicates: Optional[List[Dict[str, Optional[str]]]] = None):
+        """
+        Adds one window of chunks (and the files they came from), then checkpoints.
+        `duplicates` are the near-duplicates dropped from the window (`NearDuplicateFilter.take_dropped`).
+        """
+        self.chunks.add_duplicates(duplicates or [])
+        if documents:
+            vectors = np.asarray(vectors, dtype="float32").reshape(len(documents), -1)
+            tmp_path = f"{self._shard_file(self.shards + 1)}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, vectors)
+            os.replace(tmp_path, self._shard_file(self.shards + 1))
+            self.chunks.append(documents, start_row=self.next_row)
+            self.shards += 1
+            self.next_row += len(documents)
+
+        if files:
+            with open(self.files_log_path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(path) + "\n" for path in files)
+                f.flush()
+                self._files_bytes = f.tell()
+            self.files_count += len(files)
+        self._checkpoint()
+
+    def _checkpoint(self):
+        """
+        Atomically records how many rows, shards and logged files are complete.
+        A crash at any step leaves the previous checkpoint valid.
+        """
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "index_type": self.index_type,
+                "embedding": self.embedding,
+                "next_row": self.next_row,
+                "shards": self.shards,
+                "files": self.files_count,
+                "files_bytes": self._files_bytes,
+            }, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _load_shard(self, shard: int) -> np.ndarray:
+        return np.load(self._shard_file(shard), mmap_mode="r")
+
+    def _training_sample(self) -> np.ndarray:
+        """The first `train_sample` vectors (or all of them), read from the leading shards."""
+        if self.index_type not in TRAINED_INDEX_TYPES:
+            return np.asarray(self._load_shard(1)[:1])  # only the dimension is needed
+        parts, rows = [], 0
+        for shard in range(1, self.shards + 1):
+            vectors = self._load_shard(shard)[:self.train_sample - rows]
+            parts.append(np.asarray(vectors))
+            rows += len(vectors)
+            if rows >= self.train_sample:
+                break
+        return np.concatenate(parts)
+
+    def _merge_shards(self) -> faiss.Index:
+        """Builds the index and adds every shard in row order, so FAISS IDs match chunk rows."""
+        logger.info("Merging %d shards (%d vectors) into the index.", self.shards, self.next_row)
+        index = build_index(self._training_sample(), self.index_type)
+        for shard in range(1, self.shards + 1):
+            index.add(np.ascontiguousarray(self._load_shard(shard)))
+        return index
+
+    def finish(self) -> int:
+        """Merges the shards into the final index and removes them. Returns the chunk count."""
+        if self.next_row:
+            aliases = self.chunks.resolve_duplicates()
+            if aliases:
+                logger.info("Attributed %d dropped near-duplicates to the chunks kept in their place.", aliases)
+        self.close()
+        if not self.next_row:
+            return 0
+
+        index = self._merge_shards()
+        tmp_path = os.path.join(self.folder_path, f"{INDEX_FILE}.tmp")
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, os.path.join(self.folder_path, INDEX_FILE))
+        if self.embedding:
+            with open(os.path.join(self.folder_path, EMBEDDING_FILE), "w") as f:
+                json.dump({"fingerprint": self.embedding, "dim": index.d}, f)
+        os.remove(self.checkpoint_path)
+        for shard in range(1, self.shards + 1):
+            os.remove(self._shard_file(shard))
+        if os.path.exists(self.files_log_path):
+            os.remove(self.files_log_path)
+        return self.next_row
+
+    def close(self):
+        """Releases the chunk store. Safe to call after `finish` or on failure."""
+        self.chunks.close()
+
+
+def build_vector_store(
+    documents: List[Document],
+    embeddings: Embeddings,
+    folder_path: str,
+    index_type: str = FAISS_INDEX_TYPE,
+) -> int:
+    """
+    Embeds `documents`, builds the configured index type and writes it to
+    `folder_path` together with the chunk store. Returns the number of chunks.
+    For corpora that do not fit in memory, drive a StreamingIndexBuilder instead.
+    """
+    texts = [d.page_content for d in documents]
+    vectors = np.asarray(embeddings.embed_documents(texts), dtype="float32")
+
+    builder = StreamingIndexBuilder(folder_path, index_type, train_sample=len(documents),
+                                    embedding=embedding_fingerprint(embeddings))
+    builder.add(documents, vectors, files=[])
+    return builder.finish()
+
+
+def load_vector_store(
+    folder_path: str,
+    embeddings: Embeddings,
+    mmap: bool = FAISS_MMAP,
+    nprobe: int = FAISS_NPROBE,
+    ef_search: int = FAISS_EF_SEARCH,
+) -> PolicyVectorStore:
+    """
+    Opens a store written by `StreamingIndexBuilder`, memory-mapping the index,
+    applying the query-time search parameters and attaching the chunk store read-only.
+    Searches fail if `embeddings` differ from the ones the index was built with.
+    """
+    chunk_path = os.path.join(folder_path, CHUNK_STORE_FILE)
+    if not os.path.exists(chunk_path):
+        raise FileNotFoundError(
+            f"No chunk store at {chunk_path}. Stores saved in the pickled LangChain format "
+            "are no longer loaded; re-run `python -m compliance_rag.ingestion`."
+        )
+
+    index = read_index(os.path.join(folder_path, INDEX_FILE), mmap=mmap)
+    apply_search_params(index, nprobe=nprobe, ef_search=ef_search)
+
+    logger.info("Loaded FAISS index with %d vectors (mmap=%s).", index.ntotal, mmap)
+    return PolicyVectorStore(
+        index, ChunkStore(chunk_path, read_only=True), embeddings, read_embedding_fingerprint(folder_path)
+    )